@@ -0,0 +1,355 @@
+import os
+import time
+import ctypes
+import logging
+import threading
+import tracemalloc
+from collections import deque
+from PIL import Image, UnidentifiedImageError
+
+MB = 1 << 20
+
+# Peak memory per byte of the decoded RGB array (width * height * 3),
+# measured as the ru_maxrss growth of a request through the Flask endpoints.
+# Encodes add ENCODE_METRICS_COST scaled by the share of the image the
+# message reaches, since metrics only evaluate the modified region.
+ENCODE_COST = {'lsbm': 7, 'erde': 9, 'dct': 8, 'pvd': 7, 'mpvd': 10, 'jpeg': 4}
+ENCODE_METRICS_COST = 34
+DECODE_COST = {'lsbm': 9, 'erde': 7, 'dct': 7, 'pvd': 7, 'mpvd': 10, 'jpeg': 2, 'auto': 10}
+# Updates decode the old payload, re-embed and compare against the old stego image.
+UPDATE_COST = {'lsbm': 9, 'erde': 9, 'dct': 10}
+ANALYZE_COST = 31
+# Share of pixels Canny marks as edges in a typical photo (ERDE capacity),
+# kept low so the estimate errs on the large side.
+EDGE_DENSITY = 0.05
+# AC coefficients with |c| >= 2 per pixel in a quality 75 photo (JPEG capacity).
+JPEG_USABLE_DENSITY = 0.02
+
+SAMPLE_INTERVAL = 0.01
+RECENT_RECORDS = 200
+# glibc raises its mmap threshold each time a large block is freed, so after
+# a few requests arrays come from the heap and are kept there: later requests
+# reuse that memory and their RSS growth reads 0. The server's own growth is
+# therefore measured as malloc's in-use bytes (mallinfo2), which do not
+# depend on what the allocator retains. Pinning the threshold makes worker
+# RSS readable too, but slows every request down by a third, so it is only
+# done with STEGOSUITE_TRACE_MEMORY=1.
+M_MMAP_THRESHOLD = -3
+MMAP_THRESHOLD = 128 * 1024
+
+class AdmissionRejected(Exception):
+    """Raised when a request does not fit the memory budget. `status` is 413 or 429."""
+
+    def __init__(self, message, status, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+def probe_image(input_buffer):
+    """(width, height, frames) from the image header without decoding pixels, or None."""
+    input_buffer.seek(0)
+    try:
+        img = Image.open(input_buffer)
+        return img.width, img.height, getattr(img, 'n_frames', 1)
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        input_buffer.seek(0)
+
+def is_baseline_jpeg(input_buffer):
+    """True if the upload is a sequential JPEG, which the jpeg scheme edits without transcoding."""
+    input_buffer.seek(0)
+    try:
+        img = Image.open(input_buffer)
+        return img.format == 'JPEG' and not img.info.get('progressive')
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return False
+    finally:
+        input_buffer.seek(0)
+
+def _embedded_fraction(scheme, width, height, message_bytes):
+    # Share of rows the message reaches; the metrics region grows with it.
+    pixels = width * height
+    if scheme == 'lsbm':
+        bits = pixels * 3
+    elif scheme == 'dct':
+        bits = (height // 8) * (width // 8) * 3
+    elif scheme == 'pvd':
+        bits = pixels  # blue-channel pairs, about 2 bits each
+    elif scheme == 'mpvd':
+        bits = pixels * 4  # 1.5 pairs per pixel, 3 bits or more each
+    elif scheme == 'erde':
+        bits = pixels * EDGE_DENSITY
+    elif scheme == 'jpeg':
+        bits = pixels * JPEG_USABLE_DENSITY
+    else:
+        return 1.0
+    return min(1.0, message_bytes * 9 / max(bits, 1))
+
+def estimate_peak_bytes(operation, scheme, width, height, frames=1, message_bytes=0, baseline_jpeg=False):
+    """
+    Estimated peak memory of one request, before the upload itself is counted.
+    jpeg encodes into anything but a `baseline_jpeg` transcode the cover, so
+    their metrics cover the whole image.
+    """
+    rgb_bytes = width * height * 3 * frames
+    if operation == 'encode':
+        cost = ENCODE_COST.get(scheme, max(ENCODE_COST.values()))
+        if scheme == 'jpeg' and not baseline_jpeg:
+            cost += ENCODE_METRICS_COST
+        else:
+            cost += ENCODE_METRICS_COST * _embedded_fraction(scheme, width, height * frames, message_bytes)
+    elif operation == 'decode':
+        cost = DECODE_COST.get(scheme, max(DECODE_COST.values()))
+    elif operation == 'update':
+        cost = UPDATE_COST.get(scheme, max(UPDATE_COST.values()))
+        cost += ENCODE_METRICS_COST * _embedded_fraction(scheme, width, height * frames, message_bytes)
+    else:
+        cost = ANALYZE_COST
+    return int(rgb_bytes * cost)
+
+def estimate_request(operation, scheme, buffers, message=None):
+    """
+    Estimated peak bytes of a request over the uploaded `buffers` (in-memory
+    or open files, processed one at a time), the uploads included, and the
+    probe of the largest image.
+    """
+    message_bytes = len(message.encode('utf-8', errors='replace')) if message else 0
+    estimate, info = 0, {}
+    for buffer in buffers:
+        probe = probe_image(buffer)
+        if probe is None:
+            continue  # not an image; the decoder reports it
+        width, height, frames = probe
+        baseline_jpeg = scheme == 'jpeg' and is_baseline_jpeg(buffer)
+        peak = estimate_peak_bytes(operation, scheme, width, height, frames, message_bytes, baseline_jpeg)
+        if peak >= estimate:
+            estimate, info = peak, {'width': width, 'height': height, 'frames': frames}
+    uploads = 0
+    for buffer in buffers:
+        uploads += buffer.seek(0, os.SEEK_END)
+        buffer.seek(0)
+    return uploads + estimate, info
+
+def pin_mmap_threshold(threshold=MMAP_THRESHOLD):
+    """
+    Fix glibc's mmap threshold in this process and, through the environment,
+    in worker processes started later, so RSS growth measures each request.
+    Diagnostics only: large allocations then cost a fresh mapping each time.
+    No-op where mallopt is unavailable.
+    """
+    os.environ.setdefault('MALLOC_MMAP_THRESHOLD_', str(threshold))
+    try:
+        ctypes.CDLL(None).mallopt(M_MMAP_THRESHOLD, threshold)
+    except (OSError, AttributeError):
+        pass
+
+class _MallInfo2(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_size_t) for name in (
+        'arena', 'ordblks', 'smblks', 'hblks', 'hblkhd', 'usmblks', 'fsmblks', 'uordblks', 'fordblks', 'keepcost')]
+
+def _load_mallinfo2():
+    try:
+        mallinfo2 = ctypes.CDLL(None).mallinfo2
+    except (OSError, AttributeError):
+        return None  # not glibc, or glibc < 2.33
+    mallinfo2.restype = _MallInfo2
+    return mallinfo2
+
+_mallinfo2 = _load_mallinfo2()
+
+def heap_in_use():
+    """Bytes malloc has handed out in this process and not yet freed, or None without mallinfo2."""
+    if _mallinfo2 is None:
+        return None
+    info = _mallinfo2()
+    return info.uordblks + info.hblkhd
+
+def _statm_rss(path):
+    with open(path) as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def _children(pid):
+    found = []
+    try:
+        for tid in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{tid}/children') as f:
+                found.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return found
+
+def process_memory():
+    """
+    Memory held by this process (malloc in-use bytes, or RSS without
+    mallinfo2) plus the RSS of its child processes (offload and job
+    workers), or None off Linux.
+    """
+    pid = os.getpid()
+    try:
+        total = _statm_rss(f'/proc/{pid}/statm')
+    except OSError:
+        return None
+    in_use = heap_in_use()
+    if in_use is not None:
+        total = in_use
+    for child in _children(pid):
+        try:
+            total += _statm_rss(f'/proc/{child}/statm')
+        except OSError:
+            continue
+    return total
+
+class Reservation:
+    def __init__(self, budget, nbytes, info):
+        self.budget = budget
+        self.nbytes = nbytes
+        self.info = info
+        self.started = time.monotonic()
+        self.start_memory = process_memory()
+        self.peak_memory = self.start_memory
+        self.concurrent = 1
+        self.start_traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self._released = False
+
+    def release(self):
+        self.budget.release(self)
+
+class MemoryBudget:
+    """
+    Global admission control by estimated peak memory. A request whose
+    estimate does not fit waits in FIFO order for up to `timeout` seconds,
+    then is rejected (429); one larger than the whole budget is rejected
+    at once (413). While reservations are held a sampler thread tracks
+    process_memory so each request's measured peak can be checked against
+    its estimate. With STEGOSUITE_TRACE_MEMORY=1 the tracemalloc peak (NumPy
+    and Python allocations, not PIL/OpenCV buffers) is recorded too, and
+    worker RSS is made comparable by pin_mmap_threshold.
+    """
+
+    def __init__(self, limit_bytes, timeout=30.0, sample_interval=SAMPLE_INTERVAL):
+        self.limit = limit_bytes
+        self.timeout = timeout
+        self.sample_interval = sample_interval
+        self.records = deque(maxlen=RECENT_RECORDS)
+        self._reserved = 0
+        self._queue = deque()
+        self._active = set()
+        self._cond = threading.Condition()
+        self._sampler = None
+
+    @classmethod
+    def from_env(cls):
+        """STEGOSUITE_MEMORY_BUDGET_MB (default: half of physical memory, 0 = unlimited)."""
+        budget_mb = os.environ.get("STEGOSUITE_MEMORY_BUDGET_MB")
+        if budget_mb is None:
+            limit = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2
+        else:
+            limit = int(float(budget_mb) * MB) or float('inf')
+        timeout = float(os.environ.get("STEGOSUITE_ADMISSION_TIMEOUT", 30))
+        if os.environ.get("STEGOSUITE_TRACE_MEMORY") == "1":
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            pin_mmap_threshold()
+        return cls(limit, timeout)
+
+    def reserve(self, nbytes, **info):
+        if nbytes > self.limit:
+            raise AdmissionRejected(
+                f"Request needs about {nbytes // MB} MB, more than the server's {self.limit // MB} MB memory budget", 413)
+        deadline = time.monotonic() + self.timeout
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while self._queue[0] is not ticket or self._reserved + nbytes > self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise AdmissionRejected("Server is at its memory budget, retry later", 429,
+                                                retry_after=max(1, int(self.timeout)))
+                    self._cond.wait(remaining)
+                self._reserved += nbytes
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+            return self._grant(nbytes, info)
+
+    def try_reserve(self, nbytes, **info):
+        """
+        Reserve without waiting: None if the budget is full or requests are
+        queued ahead. Raises AdmissionRejected (413) if `nbytes` can never fit.
+        """
+        if nbytes > self.limit:
+            raise AdmissionRejected(
+                f"Request needs about {nbytes // MB} MB, more than the server's {self.limit // MB} MB memory budget", 413)
+        with self._cond:
+            if self._queue or self._reserved + nbytes > self.limit:
+                return None
+            self._reserved += nbytes
+            return self._grant(nbytes, info)
+
+    def _grant(self, nbytes, info):
+        # Called with self._cond held, after nbytes was added to _reserved
+        if not self._active and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        reservation = Reservation(self, nbytes, info)
+        self._active.add(reservation)
+        for other in self._active:
+            other.concurrent = max(other.concurrent, len(self._active))
+        if reservation.start_memory is not None and self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, name='memory-sampler', daemon=True)
+            self._sampler.start()
+        return reservation
+
+    def release(self, reservation):
+        with self._cond:
+            if reservation._released:
+                return
+            reservation._released = True
+            self._active.discard(reservation)
+            self._reserved -= reservation.nbytes
+            self._cond.notify_all()
+        self._record(reservation)
+
+    def _sample(self):
+        while True:
+            with self._cond:
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = list(self._active)
+            memory = process_memory()
+            if memory is not None:
+                for reservation in active:
+                    reservation.peak_memory = max(reservation.peak_memory, memory)
+            time.sleep(self.sample_interval)
+
+    def _record(self, reservation):
+        memory = process_memory()
+        if memory is not None and reservation.peak_memory is not None:
+            reservation.peak_memory = max(reservation.peak_memory, memory)
+        record = dict(reservation.info)
+        record['estimated_mb'] = round(reservation.nbytes / MB, 1)
+        record['seconds'] = round(time.monotonic() - reservation.started, 3)
+        # Concurrent requests share the memory samples; only records with
+        # concurrent == 1 are a clean measurement of one request.
+        record['concurrent'] = reservation.concurrent
+        if reservation.start_memory is not None:
+            peak = reservation.peak_memory - reservation.start_memory
+            record['peak_mb'] = round(peak / MB, 1)
+            record['ratio'] = round(peak / reservation.nbytes, 3) if reservation.nbytes else None
+        if reservation.start_traced is not None and reservation.concurrent == 1:
+            traced = tracemalloc.get_traced_memory()[1] - reservation.start_traced
+            record['traced_peak_mb'] = round(traced / MB, 1)
+        self.records.append(record)
+        logging.info(f"Admission: {record}")
+
+    def stats(self):
+        with self._cond:
+            return {
+                'budget_mb': None if self.limit == float('inf') else round(self.limit / MB, 1),
+                'reserved_mb': round(self._reserved / MB, 1),
+                'active': len(self._active),
+                'queued': len(self._queue),
+                'records': list(self.records),
+            }
@@ -0,0 +1,104 @@
+import numpy as np
+
+# All payload bits are uint8 arrays holding 0/1, most significant bit first.
+DELIMITER = np.array([1] * 15 + [0], dtype=np.uint8)
+LENGTH_BITS = 32
+PARITY_GROUP = 9  # 8 data bits followed by an even-parity bit
+
+def text_to_bytes(text):
+    """Payload bytes for a message: always UTF-8, so decoding is unambiguous."""
+    try:
+        return text.encode('utf-8')
+    except UnicodeEncodeError:
+        raise ValueError("Message cannot be encoded as UTF-8")
+
+def bytes_to_text(data):
+    """
+    UTF-8. Payloads written before every message was UTF-8 hold latin-1
+    text; those that are not valid UTF-8 are read as latin-1.
+    """
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+def bytes_to_bits(data):
+    return np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+
+def bits_to_bytes(bits):
+    """Pack bits into bytes, zero-padding a trailing partial byte."""
+    return np.packbits(np.asarray(bits, dtype=np.uint8)).tobytes()
+
+def int_to_bits(value, width):
+    return ((value >> np.arange(width - 1, -1, -1, dtype=np.int64)) & 1).astype(np.uint8)
+
+def bits_to_int(bits):
+    return int(np.asarray(bits, dtype=np.int64) @ (1 << np.arange(len(bits) - 1, -1, -1, dtype=np.int64)))
+
+def parity(bits, axis=-1):
+    """Even parity (XOR) of 0/1 values along `axis`."""
+    return (np.sum(bits, axis=axis, dtype=np.int64) & 1).astype(np.uint8)
+
+# --- delimiter framing: payload bits followed by 1111111111111110 ---
+
+def frame_delimited(payload):
+    return np.concatenate([bytes_to_bits(payload), DELIMITER])
+
+def find_delimiter(bits):
+    """
+    Index of the first occurrence of the delimiter at any bit offset, or -1.
+    A delimiter ends at a 0 preceded by at least 15 consecutive 1s.
+    """
+    zeros = np.flatnonzero(np.asarray(bits) == 0)
+    if len(zeros) == 0:
+        return -1
+    previous = np.empty_like(zeros)
+    previous[0] = -1
+    previous[1:] = zeros[:-1]
+    hits = np.flatnonzero(zeros - previous - 1 >= len(DELIMITER) - 1)
+    if len(hits) == 0:
+        return -1
+    return int(zeros[hits[0]]) - (len(DELIMITER) - 1)
+
+# --- length-prefix framing: 32-bit big-endian byte count, then payload ---
+
+def frame_length_prefixed(payload):
+    return np.concatenate([int_to_bits(len(payload), LENGTH_BITS), bytes_to_bits(payload)])
+
+def read_length(bits):
+    """Payload length from the prefix, or None if fewer than 32 bits are available."""
+    if len(bits) < LENGTH_BITS:
+        return None
+    return bits_to_int(bits[:LENGTH_BITS])
+
+def read_length_prefixed(bits):
+    """Payload bytes, or None if `bits` does not hold the whole framed payload."""
+    length = read_length(bits)
+    if length is None or len(bits) < LENGTH_BITS + length * 8:
+        return None
+    return bits_to_bytes(bits[LENGTH_BITS:LENGTH_BITS + length * 8])
+
+# --- parity-group framing: 9-bit groups (byte + parity), zero byte terminates ---
+
+def frame_parity_groups(payload):
+    data = np.frombuffer(bytes(payload) + b'\x00', dtype=np.uint8)
+    groups = np.empty((len(data), PARITY_GROUP), dtype=np.uint8)
+    groups[:, :8] = np.unpackbits(data[:, None], axis=1)
+    groups[:, 8] = parity(groups[:, :8])
+    return groups.reshape(-1)
+
+def read_parity_groups(bits):
+    """
+    Decode whole 9-bit groups. Groups failing the parity check are dropped.
+    Returns (payload, terminated, bits_consumed); `bits_consumed` excludes a
+    trailing partial group so callers can carry it into the next chunk.
+    """
+    count = len(bits) // PARITY_GROUP
+    groups = np.asarray(bits[:count * PARITY_GROUP], dtype=np.uint8).reshape(count, PARITY_GROUP)
+    valid = parity(groups[:, :8]) == groups[:, 8]
+    values = np.packbits(groups[:, :8], axis=1).reshape(-1)
+    terminators = np.flatnonzero(valid & (values == 0))
+    if len(terminators):
+        end = terminators[0]
+        return values[:end][valid[:end]].tobytes(), True, int(end + 1) * PARITY_GROUP
+    return values[valid].tobytes(), False, count * PARITY_GROUP
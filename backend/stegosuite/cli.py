@@ -0,0 +1,318 @@
+import os
+import io
+import sys
+import glob
+import json
+import mmap
+import hashlib
+import time
+import logging
+import argparse
+from multiprocessing import Pool
+from schemes import SCHEMES, UPDATE_SCHEMES, get_encoder, get_updater, get_decoder, get_capacity, output_extension
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.gif', '.webp'}
+
+def collect_inputs(patterns):
+    """Expand directories (recursively) and glob patterns into a sorted list of image paths."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                for name in files:
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                        paths.add(os.path.abspath(os.path.join(root, name)))
+        else:
+            for path in glob.glob(pattern, recursive=True):
+                if os.path.isfile(path):
+                    paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+def options_fingerprint(options):
+    """
+    Hash of the run's options (message, output directory, covers, ...), so a
+    rerun only resumes files that were finished with the same settings.
+    """
+    encoded = json.dumps(options, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+def open_mapped(path):
+    # Workers read inputs through a read-only mapping: the page cache backs the
+    # decoder directly instead of copying each file into a private buffer.
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("Empty file")
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class Manifest:
+    """Append-only JSON Lines record of finished files, used to resume interrupted runs."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by an interrupted run
+                    if record.get('status') == 'ok':
+                        self.done.add(self.key(record['command'], record['scheme'], record['input'],
+                                               record.get('fingerprint')))
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def key(command, scheme, path, fingerprint):
+        return (command, scheme, path, fingerprint)
+
+    def is_done(self, command, scheme, path, fingerprint):
+        return self.key(command, scheme, path, fingerprint) in self.done
+
+    def append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def _write_stego(path, options, embed):
+    mapped = open_mapped(path)
+    try:
+        output_buffer = io.BytesIO()
+        embed(mapped, options['message'], output_buffer)
+    finally:
+        mapped.close()
+    data = output_buffer.getvalue()
+    if not data:
+        raise ValueError("Encoder produced no output")
+    relative = os.path.relpath(path, options['root'])
+    out_path = os.path.join(options['output_dir'], os.path.splitext(relative)[0] + output_extension(options['scheme'], data))
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = out_path + '.part'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, out_path)
+    return {'output': out_path, 'output_bytes': len(data)}
+
+def _encode(path, options):
+    return _write_stego(path, options, get_encoder(options['scheme']))
+
+def _update(path, options):
+    return _write_stego(path, options, get_updater(options['scheme']))
+
+def _decode(path, options):
+    mapped = open_mapped(path)
+    try:
+        result = get_decoder(options['scheme'])(mapped)
+    finally:
+        mapped.close()
+    if result is None:
+        raise ValueError("Decoding failed")
+    if isinstance(result, str) and result.startswith("AutoDecode Error:"):
+        raise ValueError(result)
+    return {'message': result}
+
+def _capacity(path, options):
+    schemes = SCHEMES if options['scheme'] == 'all' else (options['scheme'],)
+    capacity = {}
+    mapped = open_mapped(path)
+    try:
+        for scheme in schemes:
+            mapped.seek(0)
+            try:
+                capacity[scheme] = get_capacity(scheme)(mapped)
+            except Exception as e:
+                logging.warning(f"Capacity for {scheme} failed on {path}: {e}")
+                capacity[scheme] = None
+    finally:
+        mapped.close()
+    if all(value is None for value in capacity.values()):
+        raise ValueError("Capacity could not be computed for any scheme")
+    return {'capacity_bytes': capacity}
+
+def _metrics(path, options):
+    from metrics import calculate_metrics_in_memory
+    cover_path = options['covers'].get(os.path.splitext(os.path.basename(path))[0])
+    if cover_path is None:
+        raise ValueError("No matching cover image found")
+    cover, stego = open_mapped(cover_path), open_mapped(path)
+    try:
+        metrics = calculate_metrics_in_memory(cover, stego, luma_ssim=options['luma_ssim'])
+    finally:
+        cover.close()
+        stego.close()
+    return {'cover': cover_path, 'metrics': metrics}
+
+def _analyze(path, options):
+    from steganalysis import analyze_in_memory
+    mapped = open_mapped(path)
+    try:
+        report = analyze_in_memory(mapped)
+    finally:
+        mapped.close()
+    if options['scheme'] != 'all':
+        report['risk'] = {options['scheme']: report['risk'].get(options['scheme'])}
+    return report
+
+HANDLERS = {
+    'encode': _encode,
+    'update': _update,
+    'decode': _decode,
+    'capacity': _capacity,
+    'metrics': _metrics,
+    'analyze': _analyze,
+}
+
+def _run_task(task):
+    command, path, options = task
+    record = {'command': command, 'scheme': options['scheme'], 'input': path}
+    start = time.perf_counter()
+    try:
+        record['bytes'] = os.path.getsize(path)
+        record.update(HANDLERS[command](path, options))
+        record['status'] = 'ok'
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['seconds'] = round(time.perf_counter() - start, 4)
+    return record
+
+def _init_worker(log_level):
+    logging.getLogger().setLevel(log_level)
+
+class Progress:
+    def __init__(self, total, stream=sys.stderr, interval=0.5):
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self.bytes = 0
+        self.start = time.perf_counter()
+        self._last = 0.0
+
+    def update(self, record):
+        self.done += 1
+        self.bytes += record.get('bytes', 0)
+        if record['status'] != 'ok':
+            self.errors += 1
+        now = time.perf_counter()
+        if now - self._last >= self.interval or self.done == self.total:
+            self._last = now
+            self.stream.write('\r' + self.summary())
+            self.stream.flush()
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return (f"[{self.done}/{self.total}] {self.done / elapsed:.1f} img/s, "
+                f"{self.bytes / elapsed / 1e6:.1f} MB/s, {self.errors} errors, {elapsed:.1f}s")
+
+def run(command, inputs, options, manifest_path, workers, log_level=logging.WARNING):
+    manifest = Manifest(manifest_path)
+    fingerprint = options_fingerprint(options)
+    pending = [p for p in inputs if not manifest.is_done(command, options['scheme'], p, fingerprint)]
+    skipped = len(inputs) - len(pending)
+    if skipped:
+        print(f"Resuming: {skipped} of {len(inputs)} files already done according to {manifest_path}", file=sys.stderr)
+    tasks = [(command, path, options) for path in pending]
+    progress = Progress(len(tasks))
+    try:
+        if workers == 1 or len(tasks) <= 1:
+            results = map(_run_task, tasks)
+            pool = None
+        else:
+            pool = Pool(workers, initializer=_init_worker, initargs=(log_level,))
+            chunksize = max(1, min(64, len(tasks) // (workers * 8)))
+            results = pool.imap_unordered(_run_task, tasks, chunksize)
+        try:
+            for record in results:
+                record['fingerprint'] = fingerprint
+                manifest.append(record)
+                progress.update(record)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+    except KeyboardInterrupt:
+        print(f"\nInterrupted after {progress.done} files; rerun the same command to resume.", file=sys.stderr)
+        return 130
+    finally:
+        manifest.close()
+    if tasks:
+        print(file=sys.stderr)
+    print(f"{progress.done} processed, {progress.errors} errors, {skipped} skipped. Manifest: {manifest_path}", file=sys.stderr)
+    return 1 if progress.errors else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='stegosuite', description="Batch steganography over directories or globs.")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Show encoder/decoder log output")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def common(p, scheme_choices, scheme_default):
+        p.add_argument('inputs', nargs='+', help="Image files, directories or glob patterns")
+        p.add_argument('--scheme', choices=scheme_choices, default=scheme_default)
+        p.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores)")
+        p.add_argument('--manifest', help="JSON Lines manifest used for results and resuming")
+
+    def message_and_output(p):
+        message = p.add_mutually_exclusive_group(required=True)
+        message.add_argument('--message', help="Secret message")
+        message.add_argument('--message-file', help="Read the secret message from a UTF-8 file")
+        p.add_argument('--output-dir', required=True, help="Directory for stego images (input layout is preserved)")
+
+    enc = sub.add_parser('encode', help="Embed a message into every input image")
+    common(enc, SCHEMES, 'lsbm')
+    message_and_output(enc)
+
+    upd = sub.add_parser('update', help="Replace the message in stego images, changing only the bits that differ")
+    common(upd, ('auto',) + UPDATE_SCHEMES, 'auto')
+    message_and_output(upd)
+
+    dec = sub.add_parser('decode', help="Extract messages; results go to the manifest")
+    common(dec, ('auto',) + SCHEMES, 'auto')
+
+    cap = sub.add_parser('capacity', help="Report the maximum message size in bytes per scheme")
+    common(cap, ('all',) + SCHEMES, 'all')
+
+    met = sub.add_parser('metrics', help="PSNR/SSIM/BER of stego images against their covers")
+    common(met, SCHEMES, 'lsbm')
+    met.add_argument('--covers', required=True, help="Directory or glob of cover images, matched to stego images by file stem")
+    met.add_argument('--luma-ssim', action='store_true', help="Compute SSIM on the luma channel only (faster)")
+
+    ana = sub.add_parser('analyze', help="Run steganalysis detectors and score detection risk per scheme")
+    common(ana, ('all',) + SCHEMES, 'all')
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    logging.getLogger().setLevel(log_level)
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("No input images found.", file=sys.stderr)
+        return 2
+
+    options = {'scheme': args.scheme}
+    manifest = args.manifest
+    if args.command in ('encode', 'update'):
+        if args.message_file:
+            with open(args.message_file, 'r', encoding='utf-8') as f:
+                options['message'] = f.read()
+        else:
+            options['message'] = args.message
+        options['output_dir'] = os.path.abspath(args.output_dir)
+        options['root'] = os.path.commonpath([os.path.dirname(p) for p in inputs])
+        manifest = manifest or os.path.join(options['output_dir'], 'manifest.jsonl')
+    elif args.command == 'metrics':
+        options['luma_ssim'] = args.luma_ssim
+        options['covers'] = {os.path.splitext(os.path.basename(p))[0]: p for p in collect_inputs([args.covers])}
+    manifest = manifest or f"stegosuite-{args.command}.jsonl"
+
+    return run(args.command, inputs, options, os.path.abspath(manifest), max(1, args.workers), log_level)
+
+if __name__ == '__main__':
+    sys.exit(main())
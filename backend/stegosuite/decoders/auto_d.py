@@ -1,5 +1,6 @@
 from PIL import Image
 import logging
+from multiframe import container_metadata
 
 def auto_decode_using_metadata_in_memory(input_buffer):
     logging.debug(f"AutoDecode: Starting for input buffer")
@@ -10,6 +11,11 @@ def auto_decode_using_metadata_in_memory(input_buffer):
         logging.debug(f"AutoDecode: Metadata found in image: {metadata}")
         
         codeword = metadata.get("ProcessingInfo")
+        comment = metadata.get("comment")
+        if not codeword and isinstance(comment, bytes) and comment.startswith(b"ProcessingInfo="):
+            codeword = comment.split(b"=", 1)[1].decode('ascii', errors='ignore')  # JPEG COM segment
+        if not codeword:
+            codeword = container_metadata(img_pil).get("ProcessingInfo")  # multi-page TIFF description
         if not codeword:
             logging.error(f"AutoDecode Error: Required metadata tag 'ProcessingInfo' not found in the image.")
             return "AutoDecode Error: Image does not contain required metadata for auto-detection."
@@ -27,9 +33,15 @@ def auto_decode_using_metadata_in_memory(input_buffer):
         elif codeword == "orange":  # PVD
             from .pvd import pvd_decode_in_memory
             result = pvd_decode_in_memory(input_buffer)
+        elif codeword == "tangerine":  # Multi-channel PVD
+            from .mpvd import mpvd_decode_in_memory
+            result = mpvd_decode_in_memory(input_buffer)
         elif codeword == "grape":  # ERDE
             from .erde import erde_decode_in_memory
             result = erde_decode_in_memory(input_buffer)
+        elif codeword == "cherry":  # JPEG
+            from .jpeg import jpeg_decode_in_memory
+            result = jpeg_decode_in_memory(input_buffer)
         else:
             logging.error(f"AutoDecode Error: Unknown or unsupported codeword '{codeword}' found in metadata.")
             return f"AutoDecode Error: Unsupported encoding scheme indicated by metadata ('{codeword}')."
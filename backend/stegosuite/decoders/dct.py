@@ -1,93 +1,69 @@
 import numpy as np
 from PIL import Image
-import cv2
 import logging
+from bitstream import DELIMITER, find_delimiter, bits_to_bytes, bytes_to_text
+from multiframe import is_multiframe, decode_frames
+
+QUALITY = 50
+COEFFS = ((3, 3), (2, 3), (3, 2))
+CHUNK_ROWS = 64  # pixel rows (eight block rows) read per step
+
+def _dct_basis():
+    # Orthonormal DCT-II rows, the scaling cv2.dct uses
+    k = np.arange(8)
+    basis = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / 16) * np.sqrt(2 / 8)
+    basis[0] /= np.sqrt(2)
+    return basis
+
+_BASIS = _dct_basis()
 
 def dct_decode_in_memory(input_buffer):
-    quality = 50
-    
+    if is_multiframe(input_buffer):
+        return decode_frames('dct', input_buffer)
     try:
         img_pil = Image.open(input_buffer)
-        metadata = img_pil.info
         img = np.array(img_pil.convert('YCbCr'))
         img_pil.close()
     except Exception as e:
         logging.error(f"DCT Decode Error: {e}")
         return None
-        
-    h_orig, w_orig = img.shape[:2]
-    h = (h_orig // 8) * 8
-    w = (w_orig // 8) * 8
-    
+
+    return _extract_luma(lambda top, bottom: img[top:bottom, :, 0], *img.shape[:2])
+
+def dct_extract_array(rgb):
+    # Only the rows scanned before the delimiter are converted to YCbCr
+    def luma(top, bottom):
+        return np.asarray(Image.fromarray(rgb[top:bottom], 'RGB').convert('YCbCr'))[:, :, 0]
+    return _extract_luma(luma, *rgb.shape[:2])
+
+def _block_bits(luma):
+    """Payload bits of a strip of whole 8x8 blocks, in the embedder's order."""
+    rows, cols = luma.shape[0] // 8, luma.shape[1] // 8
+    blocks = luma.reshape(rows, 8, cols, 8).transpose(0, 2, 1, 3) - 128.0
+    coeffs = np.stack([np.einsum('a,rcab,b->rc', _BASIS[i], blocks, _BASIS[j]) for i, j in COEFFS], axis=-1)
+    return (np.round(coeffs / QUALITY).astype(np.int64) & 1).astype(np.uint8).reshape(-1)
+
+def _extract_luma(luma_rows, height, width):
+    """
+    Scan the luma plane CHUNK_ROWS at a time, so a short message does not
+    cost a transform of the whole image. `luma_rows(top, bottom)` returns
+    those rows of the Y channel.
+    """
+    h, w = (height // 8) * 8, (width // 8) * 8
     if h == 0 or w == 0:
         return None
-        
-    img = img[:h, :w]
-    
-    binary_msg_bits = []
-    delimiter = '1111111111111110'
-    coeffs_to_use = [(3,3), (2,3), (3,2)]
-    
-    decoding_complete = False
-    for y in range(0, h, 8):
-        if decoding_complete:
-            break
-        for x in range(0, w, 8):
-            if decoding_complete:
-                break
-                
-            block = img[y:y+8, x:x+8, 0].astype(np.float32) - 128.0
-            try:
-                dct_block = cv2.dct(block)
-            except cv2.error:
-                continue
-                
-            for i, j in coeffs_to_use:
-                if decoding_complete:
-                    break
-                    
-                try:
-                    if i >= 8 or j >= 8:
-                        continue
-                        
-                    coeff = dct_block[i, j]
-                    quantized = round(coeff / quality)
-                    extracted_bit = str(quantized % 2)
-                    binary_msg_bits.append(extracted_bit)
-                    
-                    if len(binary_msg_bits) >= len(delimiter):
-                        last_bits = ''.join(binary_msg_bits[-len(delimiter):])
-                        if last_bits == delimiter:
-                            decoding_complete = True
-                            break
-                            
-                except IndexError:
-                    continue
-                except Exception:
-                    continue
-                    
-    bit_str = ''.join(binary_msg_bits)
-    delimiter_pos = bit_str.find(delimiter)
-    
-    if delimiter_pos == -1:
-        return None
-        
-    msg_bin = bit_str[:delimiter_pos]
-    
-    padding = (8 - len(msg_bin) % 8) % 8
-    if padding > 0:
-        msg_bin += '0' * padding
-        
-    try:
-        byte_array = bytearray()
-        for i in range(0, len(msg_bin), 8):
-            byte_chunk = msg_bin[i:i+8]
-            if len(byte_chunk) < 8:
-                continue
-            byte_val = int(byte_chunk, 2)
-            byte_array.append(byte_val)
-            
-        decoded_message = byte_array.decode('utf-8', errors='ignore')
-        return decoded_message
-    except Exception:
-        return None
+
+    overlap = len(DELIMITER) - 1
+    chunks = []
+    tail = np.empty(0, dtype=np.uint8)
+    scanned = 0
+    for top in range(0, h, CHUNK_ROWS):
+        chunk = _block_bits(luma_rows(top, min(top + CHUNK_ROWS, h))[:, :w].astype(np.float64))
+        pos = find_delimiter(np.concatenate([tail, chunk]))
+        if pos != -1:
+            bits = np.concatenate(chunks + [chunk])
+            return bytes_to_text(bits_to_bytes(bits[:scanned - len(tail) + pos]))
+        chunks.append(chunk)
+        scanned += len(chunk)
+        tail = np.concatenate([tail, chunk])[-overlap:]
+    return None
@@ -2,31 +2,33 @@ import cv2
 import numpy as np
 from PIL import Image
 import logging
+from bitstream import read_length_prefixed
+from multiframe import is_multiframe, decode_frames
+
+def erde_extract_array(pixels):
+    g, b = pixels[:,:,1], pixels[:,:,2]
+
+    edges = cv2.Canny(g.astype(np.uint8), 90, 180)
+
+    edge_ys, edge_xs = np.nonzero(edges)
+    bits = b[edge_ys, edge_xs] & 1
+
+    try:
+        payload = read_length_prefixed(bits)
+        if payload is None:
+            raise ValueError("length header exceeds the available edge pixels")
+        return payload.decode('utf-8')
+    except Exception as e:
+        logging.error(f"ERDE Decode Error: Failed to extract message: {e}")
+        return ""
 
 def erde_decode_in_memory(input_buffer):
+    if is_multiframe(input_buffer):
+        return decode_frames('erde', input_buffer)
     logging.debug(f"ERDE Decode: Starting for input buffer")
     try:
         img = Image.open(input_buffer).convert('RGB')
-        pixels = np.array(img)
-        r, g, b = pixels[:,:,0], pixels[:,:,1], pixels[:,:,2]
-        
-        edges = cv2.Canny(g.astype(np.uint8), 90, 180)
-        
-        edge_coords = []
-        for y in range(edges.shape[0]):
-            for x in range(edges.shape[1]):
-                if edges[y, x] > 0:
-                    edge_coords.append((y, x))
-                    
-        binary_str = ''.join(str(b[y, x] & 1) for (y, x) in edge_coords)
-        
-        try:
-            length = int(binary_str[:32], 2)
-            msg_bits = binary_str[32:32+length*8]
-            return bytes(int(msg_bits[i:i+8], 2) for i in range(0, len(msg_bits), 8)).decode('utf-8')
-        except Exception as e:
-            logging.error(f"ERDE Decode Error: Failed to extract message: {e}")
-            return ""
+        return erde_extract_array(np.array(img))
     except Exception as e:
         logging.error(f"ERDE Decode Error: {e}")
         return None
@@ -0,0 +1,29 @@
+import numpy as np
+from jpeg_coeffs import JpegCoefficients
+import logging
+from bitstream import LENGTH_BITS, read_length, read_length_prefixed
+
+def _usable_lsbs(jpeg, needed):
+    values, _ = jpeg.usable_coefficients(needed)
+    return (np.abs(values) & 1).astype(np.uint8)
+
+def jpeg_decode_in_memory(input_buffer):
+    logging.debug(f"JPEG Decode: Starting for input buffer")
+    try:
+        jpeg = JpegCoefficients(input_buffer.read())
+    except Exception as e:
+        logging.error(f"JPEG Decode Error: {e}")
+        return None
+
+    try:
+        length = read_length(_usable_lsbs(jpeg, LENGTH_BITS))
+        if length is None:
+            return ""
+        payload = read_length_prefixed(_usable_lsbs(jpeg, LENGTH_BITS + length * 8))
+        if payload is None:
+            logging.warning("JPEG Decode: Payload shorter than its length header")
+            return ""
+        return payload.decode('utf-8')
+    except Exception as e:
+        logging.error(f"JPEG Decode Error: Failed to extract message: {e}")
+        return ""
@@ -1,29 +1,41 @@
 from PIL import Image
 import numpy as np
 import logging
+from bitstream import DELIMITER, find_delimiter, bits_to_bytes, bytes_to_text
+from multiframe import is_multiframe, decode_frames
+
+CHUNK_BITS = 1 << 20
+
+def lsbm_extract_array(pixels):
+    # Scan the LSB plane chunk by chunk so a short message does not cost a
+    # pass over the whole image.
+    flat = pixels.reshape(-1)
+    overlap = len(DELIMITER) - 1
+    delimiter_pos = -1
+    for start in range(0, len(flat), CHUNK_BITS):
+        window_start = max(start - overlap, 0)
+        pos = find_delimiter(flat[window_start:start + CHUNK_BITS] & 1)
+        if pos != -1:
+            delimiter_pos = window_start + pos
+            break
+
+    if delimiter_pos == -1:
+        logging.warning("LSBM Decode: Delimiter not found in extracted bitstream")
+        return None
+
+    try:
+        return bytes_to_text(bits_to_bytes(flat[:delimiter_pos] & 1))
+    except Exception as e:
+        logging.error(f"LSBM Decode Error: Failed to convert binary to text: {e}")
+        return ""
 
 def lsbm_decode_in_memory(input_buffer):
+    if is_multiframe(input_buffer):
+        return decode_frames('lsbm', input_buffer)
     logging.debug(f"LSBM Decode: Starting for input buffer")
     try:
         img = Image.open(input_buffer)
-        binary_str = ''.join(str(pixel & 1) for pixel in np.array(img).flatten())
-        
-        delimiter = '1111111111111110'
-        delimiter_pos = binary_str.find(delimiter)
-        
-        if delimiter_pos == -1:
-            logging.warning("LSBM Decode: Delimiter not found in extracted bitstream")
-            return None
-            
-        msg_bin = binary_str[:delimiter_pos]
-        
-        try:
-            message = ''.join(chr(int(msg_bin[i:i+8], 2)) 
-                            for i in range(0, len(msg_bin), 8))
-            return message
-        except Exception as e:
-            logging.error(f"LSBM Decode Error: Failed to convert binary to text: {e}")
-            return ""
+        return lsbm_extract_array(np.array(img))
     except Exception as e:
         logging.error(f"LSBM Decode Error: {e}")
         return None
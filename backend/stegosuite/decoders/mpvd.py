@@ -0,0 +1,50 @@
+import numpy as np
+from PIL import Image
+import logging
+from bitstream import LENGTH_BITS, read_length, read_length_prefixed
+from multiframe import is_multiframe, decode_frames
+from pvd_pairs import BAND_ROWS, MAX_PAIR_BITS, RANGE_LOWER, split_pairs, pair_bits
+
+def mpvd_decode_in_memory(input_buffer):
+    if is_multiframe(input_buffer):
+        return decode_frames('mpvd', input_buffer)
+    logging.debug(f"MPVD Decode: Starting for input buffer")
+    try:
+        img = Image.open(input_buffer)
+        pixels = np.array(img.convert('RGB'))
+    except Exception as e:
+        logging.error(f"MPVD Decode Error: {e}")
+        return None
+
+    return mpvd_extract_array(pixels)
+
+def mpvd_extract_array(pixels):
+    height, width = (pixels.shape[0] // 2) * 2, (pixels.shape[1] // 2) * 2
+    shifts = np.arange(MAX_PAIR_BITS - 1, -1, -1)
+    chunks = []
+    available = 0
+    needed = None
+
+    for y0 in range(0, height, BAND_ROWS):
+        first, second = split_pairs(pixels[y0:min(y0 + BAND_ROWS, height), :width], y0 // 2)
+        n = pair_bits(first, second)
+        d = np.abs(second - first)
+        value = d - RANGE_LOWER[d]
+        bits = (value[:, None] >> shifts) & 1
+        chunks.append(bits[shifts < n[:, None]].astype(np.uint8))
+        available += len(chunks[-1])
+
+        if needed is None and available >= LENGTH_BITS:
+            needed = LENGTH_BITS + read_length(np.concatenate(chunks)) * 8
+        if needed is not None and available >= needed:
+            break
+
+    payload = read_length_prefixed(np.concatenate(chunks)) if chunks else None
+    if payload is None:
+        logging.error("MPVD Decode Error: length header exceeds the available pairs")
+        return ""
+    try:
+        return payload.decode('utf-8')
+    except UnicodeDecodeError as e:
+        logging.error(f"MPVD Decode Error: payload is not UTF-8: {e}")
+        return ""
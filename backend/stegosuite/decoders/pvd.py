@@ -1,5 +1,8 @@
+import numpy as np
 from PIL import Image
 import logging
+from bitstream import read_parity_groups, bytes_to_text
+from multiframe import is_multiframe, decode_frames, container_metadata
 
 def get_range(d):
     ranges = [
@@ -15,7 +18,26 @@ def get_range(d):
             return r
     return (0, 7)
 
+RANGE_LOWER = np.array([get_range(d)[0] for d in range(256)], dtype=np.int16)
+PAIR_BITS = np.array([min(3, get_range(d)[1].bit_length() - 1) for d in range(256)], dtype=np.int16)
+BAND_ROWS = 256
+
+def pvd_variant(input_buffer):
+    """'mpvd' if the image's metadata marks multi-channel PVD, else 'pvd'. Leaves the buffer rewound."""
+    try:
+        codeword = container_metadata(Image.open(input_buffer)).get("ProcessingInfo")
+    except Exception:
+        codeword = None
+    input_buffer.seek(0)
+    return 'mpvd' if codeword == "tangerine" else 'pvd'
+
 def pvd_decode_in_memory(input_buffer):
+    if pvd_variant(input_buffer) == 'mpvd':
+        logging.info("PVD Decode: Image uses multi-channel PVD")
+        from .mpvd import mpvd_decode_in_memory
+        return mpvd_decode_in_memory(input_buffer)
+    if is_multiframe(input_buffer):
+        return decode_frames('pvd', input_buffer)
     logging.debug(f"PVD Decode: Starting for input buffer")
     try:
         img = Image.open(input_buffer)
@@ -27,52 +49,40 @@ def pvd_decode_in_memory(input_buffer):
             else:
                 logging.warning(f"PVD Decode: Found metadata with unexpected codeword: {codeword}")
         
-        pixels = img.load()
-        width, height = img.size
+        pixels = np.array(img.convert('RGB'))
     except Exception as e:
         logging.error(f"PVD Decode Error: {e}")
         return None
-        
-    extracted_bits = []
-    current_byte = []
+
+    return pvd_extract_array(pixels)
+
+def pvd_extract_array(pixels):
+    height, width = pixels.shape[:2]
+    blue = pixels[:, :, 2]
+    pair_cols = width // 2
+    payload = []
+    carry = np.zeros(0, dtype=np.uint8)
     
-    for y in range(height):
-        for x in range(0, width - 1, 2):
-            try:
-                p1 = pixels[x, y][2]
-                p2 = pixels[x + 1, y][2]
-                d = abs(p2 - p1)
-                lower, upper = get_range(d)
-                n = min(3, upper.bit_length() - 1)
-                
-                if n <= 0:
-                    continue
-                    
-                value = d - lower
-                if value < 0 or value > (2**n - 1):
-                    continue
-                    
-                bits = format(value, f'0{n}b')
-                extracted_bits.extend(list(bits))
-                
-                while len(extracted_bits) >= 9:
-                    byte_bits = ''.join(extracted_bits[:8])
-                    parity_bit = extracted_bits[8]
-                    extracted_bits = extracted_bits[9:]
-                    
-                    expected_parity = '1' if byte_bits.count('1') % 2 != 0 else '0'
-                    if parity_bit != expected_parity:
-                        logging.warning("PVD Decode: Parity check failed")
-                        continue
-                        
-                    if byte_bits == '00000000':
-                        logging.info("PVD Decode: Found terminator byte")
-                        return ''.join(current_byte)
-                        
-                    current_byte.append(chr(int(byte_bits, 2)))
-            except Exception as e:
-                logging.warning(f"PVD Decode: Error processing pixel pair at ({x},{y}): {e}")
-                continue
+    for y0 in range(0, height, BAND_ROWS):
+        band = blue[y0:y0 + BAND_ROWS, :pair_cols * 2].astype(np.int16)
+        d = np.abs(band[:, 1::2] - band[:, 0::2]).reshape(-1)
+        n = PAIR_BITS[d]
+        value = d - RANGE_LOWER[d]
+        # Pairs whose difference overshoots what n bits can express carry nothing
+        keep = value <= (1 << n) - 1
+        value, n = value[keep], n[keep]
+        
+        shifts = np.arange(2, -1, -1)
+        bits = (value[:, None] >> shifts) & 1
+        bits = bits[shifts < n[:, None]].astype(np.uint8)
+        bits = np.concatenate([carry, bits])
+        
+        data, terminated, consumed = read_parity_groups(bits)
+        payload.append(data)
+        if terminated:
+            logging.info("PVD Decode: Found terminator byte")
+            return bytes_to_text(b''.join(payload))
+        carry = bits[consumed:]
                 
     logging.warning("PVD Decode: No terminator found, message might be incomplete")
-    return ''.join(current_byte) if current_byte else ""
+    return bytes_to_text(b''.join(payload))
@@ -1,21 +1,77 @@
+import io
 import numpy as np
 from PIL import Image, PngImagePlugin
 import cv2
 import logging
+from bitstream import frame_delimited, text_to_bytes
+from multiframe import is_multiframe, capacity_frames, encode_frames
 
 METADATA_TAG_KEY = "ProcessingInfo"
 CODEWORD = "banana"
 
-def dct_encode_in_memory(input_buffer, secret_msg, output_buffer):
-    quality = 50
-    binary_msg = ''.join([format(ord(c), '08b') for c in secret_msg])
-    binary_msg += '1111111111111110'
+def dct_prepare_cover(input_buffer):
+    """
+    Crop the cover to whole 8x8 blocks and return it as a PNG buffer. A cover
+    that is already an RGB PNG of whole blocks is passed through without
+    re-encoding, so callers that keep the cover for metrics can prepare it
+    before get_encoder('dct') at little cost.
+    """
+    if is_multiframe(input_buffer):
+        return input_buffer  # cropped frame by frame in encode_frames
+    with Image.open(input_buffer) as img_pil:
+        if img_pil.format == 'PNG' and img_pil.mode == 'RGB' and img_pil.width % 8 == 0 and img_pil.height % 8 == 0:
+            # A new buffer: the encoder's Image.close() closes the one it reads
+            input_buffer.seek(0)
+            return io.BytesIO(input_buffer.read())
+        img_arr = np.array(img_pil.convert('RGB'))
+    h = (img_arr.shape[0] // 8) * 8
+    w = (img_arr.shape[1] // 8) * 8
+    if h == 0 or w == 0:
+        raise ValueError("Image too small for DCT encoding")
+    img_arr = img_arr[:h, :w]
+    processed_buffer = io.BytesIO()
+    Image.fromarray(img_arr).save(processed_buffer, format='PNG')
+    processed_buffer.seek(0)
+    return processed_buffer
+
+def dct_capacity_in_memory(input_buffer):
+    if is_multiframe(input_buffer):
+        return capacity_frames('dct', input_buffer)
+    with Image.open(input_buffer) as img:
+        w, h = img.size
+    dct_bits = (h // 8) * (w // 8) * 3
+    return max(dct_bits - 16, 0) // 8
+
+def dct_capacity_array(rgb):
+    h, w = rgb.shape[:2]
+    dct_bits = (h // 8) * (w // 8) * 3
+    return max(dct_bits - 16, 0) // 8
+
+def _quantize_bit(coeff, target_bit, quality):
+    # Round the coefficient to the nearest multiple of `quality` whose
+    # quotient has the target bit's parity.
+    quantized = round(coeff / quality)
     
-    img_pil = Image.open(input_buffer)
-    img = np.array(img_pil.convert('YCbCr'))
-    img_pil.close()
+    if (quantized % 2) != target_bit:
+        adjustment = -1 if quantized > 0 else 1
+        if quantized + adjustment == 0 and target_bit == 1:
+            adjustment = adjustment * -1
+        quantized += adjustment
+        if quantized == 0 and target_bit == 1:
+            quantized = 1
+            
+    return float(quantized * quality)
+
+def dct_embed_array(rgb, secret_msg, progress=None, on_write=None):
+    """
+    Embed into an (H, W, 3) RGB uint8 array in place. `progress(fraction)` is called once per block row;
+    `on_write(top, bottom)` before rows top..bottom-1 change.
+    Returns the (top, bottom, left, right) box of rows that were rewritten.
+    """
+    quality = 50
+    binary_msg = frame_delimited(text_to_bytes(secret_msg))
     
-    h, w = img.shape[:2]
+    h, w = rgb.shape[:2]
     
     coeffs_to_use = [(3,3), (2,3), (3,2)]
     num_coeffs_per_block = len(coeffs_to_use)
@@ -28,6 +84,12 @@ def dct_encode_in_memory(input_buffer, secret_msg, output_buffer):
     if len(binary_msg) > dct_bits:
         raise ValueError(f"Message too large for DCT encoding. Max: {dct_bits // 8} bytes.")
     
+    # Only the leading block rows that carry the message go through the
+    # YCbCr round trip; the rest of the image is left byte-identical.
+    bits_per_block_row = full_blocks_w * num_coeffs_per_block
+    h = -(-len(binary_msg) // bits_per_block_row) * 8
+    img = np.array(Image.fromarray(rgb[:h], 'RGB').convert('YCbCr'))
+    
     img_float = img.astype(np.float32)
     msg_index = 0
     encoding_complete = False
@@ -35,6 +97,8 @@ def dct_encode_in_memory(input_buffer, secret_msg, output_buffer):
     for y in range(0, h - 7, 8):
         if encoding_complete:
             break
+        if progress is not None:
+            progress(msg_index / len(binary_msg))
         for x in range(0, w - 7, 8):
             if encoding_complete:
                 break
@@ -54,20 +118,7 @@ def dct_encode_in_memory(input_buffer, secret_msg, output_buffer):
                     if i >= 8 or j >= 8:
                         continue
                         
-                    coeff = dct_block[i, j]
-                    target_bit = int(binary_msg[msg_index])
-                    
-                    quantized = round(coeff / quality)
-                    
-                    if (quantized % 2) != target_bit:
-                        adjustment = -1 if quantized > 0 else 1
-                        if quantized + adjustment == 0 and target_bit == 1:
-                            adjustment = adjustment * -1
-                        quantized += adjustment
-                        if quantized == 0 and target_bit == 1:
-                            quantized = 1
-                            
-                    dct_block[i, j] = float(quantized * quality)
+                    dct_block[i, j] = _quantize_bit(dct_block[i, j], int(binary_msg[msg_index]), quality)
                     msg_index += 1
                     
                 except IndexError:
@@ -87,14 +138,97 @@ def dct_encode_in_memory(input_buffer, secret_msg, output_buffer):
     stego_cr = img[:, :, 2]
     stego_img_array_ycbcr = np.stack((stego_y, stego_cb, stego_cr), axis=-1)
     
+    if on_write is not None:
+        on_write(0, h)
+    rgb[:h] = np.asarray(Image.fromarray(stego_img_array_ycbcr, 'YCbCr').convert('RGB'))
+    return 0, h, 0, w
+
+def dct_update_array(rgb, secret_msg, progress=None):
+    """
+    Replace the payload of a DCT stego array in place. Only blocks where a
+    coefficient's bit differs between the old and new payload are requantized
+    and written back; every other pixel is left byte-identical.
+    Returns the (top, bottom, left, right) box of the blocks that changed.
+    """
+    from decoders.dct import dct_extract_array
+
+    quality = 50
+    coeffs_to_use = [(3,3), (2,3), (3,2)]
+    if dct_extract_array(rgb) is None:
+        raise ValueError("No DCT payload found to update")
+
+    binary_msg = frame_delimited(text_to_bytes(secret_msg))
+    h, w = rgb.shape[:2]
+    full_blocks_w = w // 8
+    dct_bits = (h // 8) * full_blocks_w * len(coeffs_to_use)
+    if len(binary_msg) > dct_bits:
+        raise ValueError(f"Message too large for DCT encoding. Max: {dct_bits // 8} bytes.")
+
+    h = -(-len(binary_msg) // (full_blocks_w * len(coeffs_to_use))) * 8
+    img = np.array(Image.fromarray(rgb[:h], 'RGB').convert('YCbCr'))
+    img_float = img.astype(np.float32)
+    changed = []
+
+    for block_index, msg_index in enumerate(range(0, len(binary_msg), len(coeffs_to_use))):
+        y, x = (block_index // full_blocks_w) * 8, (block_index % full_blocks_w) * 8
+        if progress is not None and x == 0:
+            progress(msg_index / len(binary_msg))
+        targets = binary_msg[msg_index:msg_index + len(coeffs_to_use)]
+        dct_block = cv2.dct(img_float[y:y+8, x:x+8, 0] - 128.0)
+        current = [round(dct_block[i, j] / quality) % 2 for i, j in coeffs_to_use[:len(targets)]]
+        if all(int(bit) == target for bit, target in zip(current, targets)):
+            continue
+
+        for (i, j), target_bit in zip(coeffs_to_use, targets):
+            dct_block[i, j] = _quantize_bit(dct_block[i, j], int(target_bit), quality)
+        img_float[y:y+8, x:x+8, 0] = np.clip(cv2.idct(dct_block) + 128.0, 0, 255)
+        changed.append((y, x))
+
+    logging.info(f"DCT Update: {len(changed)} of {-(-len(binary_msg) // len(coeffs_to_use))} payload blocks changed")
+    if not changed:
+        return 0, 0, 0, 0
+
+    stego_y = np.clip(img_float[:, :, 0], 0, 255).astype(np.uint8)
+    stego_img_array_ycbcr = np.stack((stego_y, img[:, :, 1], img[:, :, 2]), axis=-1)
+    stego_rgb = np.asarray(Image.fromarray(stego_img_array_ycbcr, 'YCbCr').convert('RGB'))
+    for y, x in changed:
+        rgb[y:y+8, x:x+8] = stego_rgb[y:y+8, x:x+8]
+
+    ys = [y for y, _ in changed]
+    xs = [x for _, x in changed]
+    return min(ys), max(ys) + 8, min(xs), max(xs) + 8
+
+def dct_update_in_memory(input_buffer, secret_msg, output_buffer, progress=None):
+    if is_multiframe(input_buffer):
+        raise ValueError("Updating multi-frame images is not supported")
     try:
-        stego_pil_img = Image.fromarray(stego_img_array_ycbcr, 'YCbCr').convert('RGB')
+        rgb = np.array(Image.open(input_buffer).convert('RGB'))
     except Exception as e:
-        logging.error(f"DCT Encode Error: {e}")
+        logging.error(f"DCT Update Error: {e}")
         return None
-        
+
+    region = dct_update_array(rgb, secret_msg, progress)
+
+    metadata = PngImagePlugin.PngInfo()
+    metadata.add_text(METADATA_TAG_KEY, CODEWORD)
+
+    Image.fromarray(rgb).save(output_buffer, format='PNG', pnginfo=metadata)
+    output_buffer.seek(0)
+    return region
+
+def dct_encode_in_memory(input_buffer, secret_msg, output_buffer, progress=None):
+    if is_multiframe(input_buffer):
+        return encode_frames('dct', input_buffer, secret_msg, output_buffer, progress)
+    img_pil = Image.open(input_buffer)
+    rgb = np.array(img_pil.convert('RGB'))
+    img_pil.close()
+
+    region = dct_embed_array(rgb, secret_msg, progress)
+    stego_pil_img = Image.fromarray(rgb)
+
     metadata = PngImagePlugin.PngInfo()
     metadata.add_text(METADATA_TAG_KEY, CODEWORD)
     
     stego_pil_img.save(output_buffer, format='PNG', pnginfo=metadata)
     output_buffer.seek(0)
+    return region
@@ -2,56 +2,111 @@ import cv2
 import numpy as np
 from PIL import Image, PngImagePlugin
 import logging
+from bitstream import frame_length_prefixed, read_length_prefixed, text_to_bytes
+from multiframe import is_multiframe, capacity_frames, encode_frames
 
 METADATA_TAG_KEY = "ProcessingInfo"
 CODEWORD = "grape"
 
-def erde_encode_in_memory(input_buffer, secret_msg, output_buffer):
-    try:
-        img = Image.open(input_buffer).convert('RGB')
-        pixels = np.array(img)
-    except Exception as e:
-        logging.error(f"ERDE Encode Error: {e}")
-        return None
-        
-    r, g, b = pixels[:,:,0], pixels[:,:,1], pixels[:,:,2]
+def erde_capacity_in_memory(input_buffer):
+    if is_multiframe(input_buffer):
+        return capacity_frames('erde', input_buffer)
+    return erde_capacity_array(np.array(Image.open(input_buffer).convert('RGB')))
+
+def erde_capacity_array(pixels):
+    g = np.ascontiguousarray(pixels[:, :, 1])
+    edge_count = int(np.count_nonzero(cv2.Canny(g, 90, 180)))
+    return max(edge_count - 32, 0) // 8
+
+def erde_embed_array(pixels, secret_msg, progress=None, on_write=None):
+    """
+    Embed into an (H, W, 3) RGB uint8 array in place. `progress(fraction)` is called periodically;
+    `on_write(top, bottom)` before rows top..bottom-1 change.
+    Returns the (top, bottom, left, right) box around the edge pixels used.
+    """
+    g, b = pixels[:,:,1], pixels[:,:,2]
     
     edges = cv2.Canny(g.astype(np.uint8), 90, 180)
     
-    try:
-        msg_bytes = secret_msg.encode('utf-8')
-    except UnicodeEncodeError:
-        return None
-        
-    msg_len_bytes = len(msg_bytes)
-    binary_str = f"{msg_len_bytes:032b}" + ''.join(f"{byte:08b}" for byte in msg_bytes)
-    total_bits_to_embed = len(binary_str)
+    bits = frame_length_prefixed(text_to_bytes(secret_msg))
+    total_bits_to_embed = len(bits)
     
-    edge_coords = []
-    for y in range(edges.shape[0]):
-        for x in range(edges.shape[1]):
-            if edges[y, x] > 0:
-                edge_coords.append((y, x))
+    edge_ys, edge_xs = np.nonzero(edges)
                 
-    available_edge_pixels = len(edge_coords)
+    available_edge_pixels = len(edge_ys)
     if total_bits_to_embed > available_edge_pixels:
         raise ValueError(f"Message too large for ERDE. Requires {total_bits_to_embed} edge pixels, but only found {available_edge_pixels}.")
         
-    b_modified = b.copy()
-    
-    for i in range(total_bits_to_embed):
-        y, x = edge_coords[i]
-        bit_to_embed = int(binary_str[i])
-        current_blue_val = b_modified[y, x]
-        
-        new_blue_val = (current_blue_val & 0xFE) | bit_to_embed
-        b_modified[y, x] = new_blue_val
-        
-    stego_array = np.stack((r, g, b_modified), axis=2)
-    stego_image = Image.fromarray(stego_array)
+    if progress is not None:
+        progress(0.0)
+    ys, xs = edge_ys[:total_bits_to_embed], edge_xs[:total_bits_to_embed]
+    if on_write is not None:
+        on_write(int(ys[0]), int(ys[-1]) + 1)
+    b[ys, xs] = (b[ys, xs] & 0xFE) | bits
+    return int(ys[0]), int(ys[-1]) + 1, int(xs.min()), int(xs.max()) + 1
+
+def erde_encode_in_memory(input_buffer, secret_msg, output_buffer, progress=None):
+    if is_multiframe(input_buffer):
+        return encode_frames('erde', input_buffer, secret_msg, output_buffer, progress)
+    try:
+        img = Image.open(input_buffer).convert('RGB')
+        pixels = np.array(img)
+    except Exception as e:
+        logging.error(f"ERDE Encode Error: {e}")
+        return None
+
+    region = erde_embed_array(pixels, secret_msg, progress)
+    stego_image = Image.fromarray(pixels)
     
     metadata = PngImagePlugin.PngInfo()
     metadata.add_text(METADATA_TAG_KEY, CODEWORD)
     
     stego_image.save(output_buffer, format='PNG', pnginfo=metadata)
     output_buffer.seek(0)
+    return region
+
+def erde_update_array(pixels, secret_msg, progress=None):
+    """
+    Replace the payload of an ERDE stego array in place, flipping only the
+    edge pixels whose blue LSB differs between the old and new payload.
+    Edges come from the green channel, so they stay where the decoder finds them.
+    Returns the (top, bottom, left, right) box around the changed pixels.
+    """
+    g, b = pixels[:,:,1], pixels[:,:,2]
+    edge_ys, edge_xs = np.nonzero(cv2.Canny(g.astype(np.uint8), 90, 180))
+    current = b[edge_ys, edge_xs] & 1
+    if read_length_prefixed(current) is None:
+        raise ValueError("No ERDE payload found to update")
+
+    bits = frame_length_prefixed(text_to_bytes(secret_msg))
+    if len(bits) > len(edge_ys):
+        raise ValueError(f"Message too large for ERDE. Requires {len(bits)} edge pixels, but only found {len(edge_ys)}.")
+
+    if progress is not None:
+        progress(0.0)
+    changed = np.flatnonzero(current[:len(bits)] != bits)
+    logging.info(f"ERDE Update: {len(changed)} of {len(bits)} payload edge pixels changed")
+    if len(changed) == 0:
+        return 0, 0, 0, 0
+    ys, xs = edge_ys[changed], edge_xs[changed]
+    b[ys, xs] ^= 1
+    return int(ys[0]), int(ys[-1]) + 1, int(xs.min()), int(xs.max()) + 1
+
+def erde_update_in_memory(input_buffer, secret_msg, output_buffer, progress=None):
+    if is_multiframe(input_buffer):
+        raise ValueError("Updating multi-frame images is not supported")
+    try:
+        img = Image.open(input_buffer).convert('RGB')
+        pixels = np.array(img)
+    except Exception as e:
+        logging.error(f"ERDE Update Error: {e}")
+        return None
+
+    region = erde_update_array(pixels, secret_msg, progress)
+
+    metadata = PngImagePlugin.PngInfo()
+    metadata.add_text(METADATA_TAG_KEY, CODEWORD)
+
+    Image.fromarray(pixels).save(output_buffer, format='PNG', pnginfo=metadata)
+    output_buffer.seek(0)
+    return region
@@ -0,0 +1,61 @@
+import io
+import numpy as np
+from PIL import Image
+from jpeg_coeffs import JpegCoefficients
+import logging
+from bitstream import frame_length_prefixed, text_to_bytes
+
+METADATA_TAG_KEY = "ProcessingInfo"
+CODEWORD = "cherry"
+
+def _load_baseline_jpeg(data):
+    # Non-JPEG (or progressive) covers are transcoded once to a baseline JPEG;
+    # genuine baseline JPEGs are embedded into without any recompression.
+    # Returns the JPEG and whether it was transcoded.
+    try:
+        return JpegCoefficients(data), False
+    except ValueError:
+        pass
+    img = Image.open(io.BytesIO(data)).convert('RGB')
+    transcoded = io.BytesIO()
+    img.save(transcoded, format='JPEG', quality=90)
+    logging.info("JPEG Encode: cover is not a baseline JPEG, transcoded at quality 90")
+    return JpegCoefficients(transcoded.getvalue()), True
+
+def jpeg_capacity_in_memory(input_buffer):
+    jpeg, _ = _load_baseline_jpeg(input_buffer.read())
+    ac = jpeg.decode()[:, 1:]
+    return max(int(np.count_nonzero(np.abs(ac) >= 2)) - 32, 0) // 8
+
+def jpeg_encode_in_memory(input_buffer, secret_msg, output_buffer, progress=None):
+    """
+    Embed into the cover's quantized coefficients and write a JPEG. Returns
+    the (top, bottom, left, right) box of rows that may have changed, or None
+    if the cover had to be transcoded (every pixel may differ then).
+    """
+    try:
+        jpeg, transcoded = _load_baseline_jpeg(input_buffer.read())
+    except Exception as e:
+        logging.error(f"JPEG Encode Error: {e}")
+        return None
+
+    bits = frame_length_prefixed(text_to_bytes(secret_msg))
+
+    # JSteg-style: AC coefficients with |c| >= 2 carry one bit in the LSB of
+    # their magnitude. That keeps every coefficient in its Huffman size
+    # category and never creates or removes zeros, so only the leading blocks
+    # that carry the payload are decoded and the rest of the scan is copied.
+    values, positions = jpeg.usable_coefficients(len(bits))
+    if len(values) < len(bits):
+        raise ValueError(f"Message too large for JPEG encoding. Max: {max(len(values) - 32, 0) // 8} bytes.")
+    if progress is not None:
+        progress(0.5)
+
+    changed = np.flatnonzero((np.abs(values) & 1) != bits)
+    comment = f"{METADATA_TAG_KEY}={CODEWORD}".encode('ascii')
+    output_buffer.write(jpeg.to_bytes(comment=comment, flips=[positions[i] for i in changed]))
+    output_buffer.seek(0)
+    if transcoded:
+        return None
+    per_block = np.count_nonzero(np.abs(jpeg.blocks[:, 1:]) >= 2, axis=1)
+    return jpeg.leading_rows(int(np.searchsorted(np.cumsum(per_block), len(bits))) + 1)
@@ -1,61 +1,134 @@
 from PIL import Image, PngImagePlugin
 import numpy as np
-import random
 import logging
+from bitstream import frame_delimited, text_to_bytes
+from multiframe import is_multiframe, capacity_frames, encode_frames
 
 METADATA_TAG_KEY = "ProcessingInfo"
 CODEWORD = "apple"
+CHUNK_BITS = 1 << 20
 
-def lsbm_encode_in_memory(input_buffer, secret_msg, output_buffer):
-    try:
-        img = Image.open(input_buffer).convert("RGB")
-        img_array = np.array(img, dtype=np.uint8)
-    except Exception as e:
-        logging.error(f"LSBM Encode Error: {e}")
-        return None
-        
-    binary_msg = ''.join([format(ord(c), '08b') for c in secret_msg])
-    binary_msg += '1111111111111110'
+def lsbm_capacity_in_memory(input_buffer):
+    if is_multiframe(input_buffer):
+        return capacity_frames('lsbm', input_buffer)
+    with Image.open(input_buffer) as img:
+        w, h = img.size
+    return max(w * h * 3 - 16, 0) // 8
+
+def lsbm_capacity_array(pixels):
+    h, w = pixels.shape[:2]
+    return max(w * h * 3 - 16, 0) // 8
+
+def lsbm_embed_array(img_array, secret_msg, progress=None, on_write=None):
+    """
+    Embed into an (H, W, C) uint8 array in place. `progress(fraction)` is called periodically;
+    `on_write(top, bottom)` before rows top..bottom-1 change.
+    Returns the (top, bottom, left, right) box of rows that may have changed.
+    """
+    binary_msg = frame_delimited(text_to_bytes(secret_msg))
     
     h, w, channels = img_array.shape
     total_pixels = h * w * channels
     
     if len(binary_msg) > total_pixels:
         raise ValueError(f"Message too large for LSB-M encoding. Max bits: {total_pixels}, Required: {len(binary_msg)}")
+    if not img_array.flags.c_contiguous:
+        raise ValueError("LSB-M embedding needs a contiguous pixel array")
         
-    flat = img_array.copy().flatten()
+    bottom = -(-len(binary_msg) // (w * channels))
+    if on_write is not None:
+        on_write(0, bottom)
+    _match_lsbs(img_array.reshape(-1), binary_msg, progress)
     
-    for i in range(len(binary_msg)):
-        target_bit = int(binary_msg[i])
-        pixel_val = int(flat[i])
+    return 0, bottom, 0, w
+
+def _match_lsbs(flat, binary_msg, progress=None):
+    # LSB matching: only samples whose LSB differs from the payload change,
+    # by +/-1 at random. Returns (count, first, last) of the changed samples.
+    rng = np.random.default_rng()
+    count, first, last = 0, None, None
+    
+    for start in range(0, len(binary_msg), CHUNK_BITS):
+        if progress is not None:
+            progress(start / len(binary_msg))
+        target = binary_msg[start:start + CHUNK_BITS]
+        segment = flat[start:start + len(target)]
         
-        if (pixel_val & 1) != target_bit:
-            adjustments = []
-            
-            if pixel_val > 0:
-                adjustments.append(-1)
-            if pixel_val < 255:
-                adjustments.append(1)
-                
-            if not adjustments:
-                if pixel_val == 0:
-                    adjustment = 1
-                elif pixel_val == 255:
-                    adjustment = -1
-                else:
-                    continue
-            else:
-                adjustment = random.choice(adjustments)
-                
-            new_val = pixel_val + adjustment
-            new_val = max(0, min(255, new_val))
-            flat[i] = np.uint8(new_val)
-            
-    stego_array = np.uint8(flat.reshape(img_array.shape))
-    stego_image = Image.fromarray(stego_array)
+        mismatch = np.flatnonzero((segment & 1) != target)
+        values = segment[mismatch]
+        # +/-1 at random, except where that would leave the 0..255 range
+        adjustment = np.where(rng.integers(0, 2, len(mismatch)) == 0, -1, 1)
+        adjustment[values == 0] = 1
+        adjustment[values == 255] = -1
+        segment[mismatch] = (values.astype(np.int16) + adjustment).astype(np.uint8)
+        if len(mismatch):
+            count += len(mismatch)
+            first = start + int(mismatch[0]) if first is None else first
+            last = start + int(mismatch[-1])
+    
+    return count, first, last
+
+def lsbm_update_array(img_array, secret_msg, progress=None):
+    """
+    Replace the payload of an LSB-M stego array in place, changing only the
+    samples whose LSB differs between the old and new payload. A shorter
+    message leaves the old bits past its delimiter as they were.
+    Returns the (top, bottom, left, right) box of rows that changed.
+    """
+    from decoders.lsbm import lsbm_extract_array
+    
+    if not img_array.flags.c_contiguous:
+        raise ValueError("LSB-M embedding needs a contiguous pixel array")
+    old_msg = lsbm_extract_array(img_array)
+    if old_msg is None:
+        raise ValueError("No LSB-M payload found to update")
+    
+    binary_msg = frame_delimited(text_to_bytes(secret_msg))
+    h, w, channels = img_array.shape
+    if len(binary_msg) > h * w * channels:
+        raise ValueError(f"Message too large for LSB-M encoding. Max bits: {h * w * channels}, Required: {len(binary_msg)}")
+    
+    count, first, last = _match_lsbs(img_array.reshape(-1), binary_msg, progress)
+    logging.info(f"LSBM Update: {count} of {len(binary_msg)} payload samples changed")
+    if count == 0:
+        return 0, 0, 0, w
+    return first // (w * channels), last // (w * channels) + 1, 0, w
+
+def lsbm_update_in_memory(input_buffer, secret_msg, output_buffer, progress=None):
+    if is_multiframe(input_buffer):
+        raise ValueError("Updating multi-frame images is not supported")
+    try:
+        img = Image.open(input_buffer).convert("RGB")
+        img_array = np.array(img, dtype=np.uint8)
+    except Exception as e:
+        logging.error(f"LSBM Update Error: {e}")
+        return None
+
+    region = lsbm_update_array(img_array, secret_msg, progress)
+    
+    metadata = PngImagePlugin.PngInfo()
+    metadata.add_text(METADATA_TAG_KEY, CODEWORD)
+    
+    Image.fromarray(img_array).save(output_buffer, format='PNG', pnginfo=metadata)
+    output_buffer.seek(0)
+    return region
+
+def lsbm_encode_in_memory(input_buffer, secret_msg, output_buffer, progress=None):
+    if is_multiframe(input_buffer):
+        return encode_frames('lsbm', input_buffer, secret_msg, output_buffer, progress)
+    try:
+        img = Image.open(input_buffer).convert("RGB")
+        img_array = np.array(img, dtype=np.uint8)
+    except Exception as e:
+        logging.error(f"LSBM Encode Error: {e}")
+        return None
+
+    region = lsbm_embed_array(img_array, secret_msg, progress)
+    stego_image = Image.fromarray(img_array)
     
     metadata = PngImagePlugin.PngInfo()
     metadata.add_text(METADATA_TAG_KEY, CODEWORD)
     
     stego_image.save(output_buffer, format='PNG', pnginfo=metadata)
     output_buffer.seek(0)
+    return region
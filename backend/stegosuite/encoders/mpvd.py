@@ -0,0 +1,89 @@
+import numpy as np
+from PIL import Image, PngImagePlugin
+import logging
+from bitstream import frame_length_prefixed, text_to_bytes
+from multiframe import is_multiframe, capacity_frames, encode_frames
+from pvd_pairs import BAND_ROWS, MAX_PAIR_BITS, split_pairs, merge_pairs, pair_bits, set_differences
+
+METADATA_TAG_KEY = "ProcessingInfo"
+CODEWORD = "tangerine"
+
+def mpvd_capacity_in_memory(input_buffer):
+    if is_multiframe(input_buffer):
+        return capacity_frames('mpvd', input_buffer)
+    return mpvd_capacity_array(np.array(Image.open(input_buffer).convert('RGB')))
+
+def mpvd_capacity_array(pixels):
+    height, width = (pixels.shape[0] // 2) * 2, (pixels.shape[1] // 2) * 2
+    total_bits = 0
+    for y0 in range(0, height, BAND_ROWS):
+        first, second = split_pairs(pixels[y0:min(y0 + BAND_ROWS, height), :width], y0 // 2)
+        total_bits += int(pair_bits(first, second).sum())
+    # 32-bit length header, then 8 bits per byte
+    return max(total_bits - 32, 0) // 8
+
+def mpvd_embed_array(pixels, secret_msg, progress=None, on_write=None):
+    """
+    Embed into an (H, W, 3) RGB uint8 array in place. `progress(fraction)` is called once per row band;
+    `on_write(top, bottom)` before rows top..bottom-1 change.
+    Returns the (top, bottom, left, right) box of rows that may have changed.
+
+    Multi-channel PVD: all three channels, horizontal and vertical pairs in
+    a checkerboard of 2x2 blocks (see pvd_pairs), full Wu-Tsai range widths.
+    """
+    height, width = (pixels.shape[0] // 2) * 2, (pixels.shape[1] // 2) * 2
+    msg_bits = frame_length_prefixed(text_to_bytes(secret_msg))
+    total_bits = len(msg_bits)
+    padded = np.concatenate([msg_bits, np.zeros(MAX_PAIR_BITS, dtype=np.uint8)])
+    shifts = np.arange(MAX_PAIR_BITS)
+    bit_index = 0
+    bottom = 0
+
+    for y0 in range(0, height, BAND_ROWS):
+        if bit_index >= total_bits:
+            break
+        if progress is not None:
+            progress(bit_index / total_bits)
+        band = pixels[y0:min(y0 + BAND_ROWS, height), :width]
+        first, second = split_pairs(band, y0 // 2)
+        n = pair_bits(first, second)
+        offsets = bit_index + np.cumsum(n) - n
+        used = int(np.searchsorted(offsets, total_bits))
+
+        # n bits per pair, most significant first
+        chunk = padded[offsets[:used, None] + shifts].astype(np.int16)
+        weights = np.where(shifts < n[:used, None], 1 << np.maximum(n[:used, None] - 1 - shifts, 0), 0)
+        values = (chunk * weights).sum(axis=1)
+        first[:used], second[:used] = set_differences(first[:used], second[:used], values)
+
+        if used:
+            # 6 pairs (2 per channel) per 2x2 block
+            bottom = y0 + ((used - 1) // (width * 3) + 1) * 2
+            if on_write is not None:
+                on_write(y0, bottom)
+        merge_pairs(band, first, second, y0 // 2)
+        bit_index += int(n[:used].sum())
+
+    if bit_index < total_bits:
+        raise ValueError(f"Message too large for multi-channel PVD encoding. Max: {max(bit_index - 32, 0) // 8} bytes.")
+    return 0, bottom, 0, width
+
+def mpvd_encode_in_memory(input_buffer, secret_msg, output_buffer, progress=None):
+    if is_multiframe(input_buffer):
+        return encode_frames('mpvd', input_buffer, secret_msg, output_buffer, progress)
+    try:
+        img = Image.open(input_buffer).convert('RGB')
+        pixels = np.array(img)
+    except Exception as e:
+        logging.error(f"MPVD Encode Error: {e}")
+        return None
+
+    region = mpvd_embed_array(pixels, secret_msg, progress)
+    img = Image.fromarray(pixels)
+
+    metadata = PngImagePlugin.PngInfo()
+    metadata.add_text(METADATA_TAG_KEY, CODEWORD)
+
+    img.save(output_buffer, format='PNG', pnginfo=metadata)
+    output_buffer.seek(0)
+    return region
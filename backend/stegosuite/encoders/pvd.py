@@ -1,5 +1,8 @@
+import numpy as np
 from PIL import Image, PngImagePlugin
 import logging
+from bitstream import frame_parity_groups, text_to_bytes
+from multiframe import is_multiframe, capacity_frames, encode_frames
 
 METADATA_TAG_KEY = "ProcessingInfo"
 CODEWORD = "orange"
@@ -18,58 +21,91 @@ def get_range(d):
             return r
     return (0, 7)
 
-def pvd_encode_in_memory(input_buffer, secret_msg, output_buffer):
+# Per-difference lookup tables built from get_range: range bounds and the
+# number of bits a pair with that difference carries.
+RANGE_LOWER = np.array([get_range(d)[0] for d in range(256)], dtype=np.int16)
+RANGE_UPPER = np.array([get_range(d)[1] for d in range(256)], dtype=np.int16)
+PAIR_BITS = np.array([min(3, get_range(d)[1].bit_length() - 1) for d in range(256)], dtype=np.int64)
+BAND_ROWS = 256
+
+def pvd_capacity_in_memory(input_buffer):
+    if is_multiframe(input_buffer):
+        return capacity_frames('pvd', input_buffer)
+    return pvd_capacity_array(np.array(Image.open(input_buffer).convert('RGB')))
+
+def pvd_capacity_array(pixels):
+    blue = pixels[:, :, 2].astype(np.int16)
+    pairs = blue[:, :(blue.shape[1] // 2) * 2]
+    d = np.abs(pairs[:, 1::2] - pairs[:, 0::2])
+    total_bits = int(PAIR_BITS[d].sum())
+    # Each character costs 8 bits plus a parity bit; the terminator costs 9 more.
+    return max(total_bits - 9, 0) // 9
+
+def pvd_embed_array(pixels, secret_msg, progress=None, on_write=None):
+    """
+    Embed into an (H, W, 3) RGB uint8 array in place. `progress(fraction)` is called once per row band;
+    `on_write(top, bottom)` before rows top..bottom-1 change.
+    Returns the (top, bottom, left, right) box of rows that may have changed.
+    """
+    height, width = pixels.shape[:2]
+    blue = pixels[:, :, 2]
+    pair_cols = width // 2
+    
+    msg_bits = frame_parity_groups(text_to_bytes(secret_msg))
+    total_bits = len(msg_bits)
+    padded = np.concatenate([msg_bits, np.zeros(3, dtype=np.uint8)])
+    bit_index = 0
+    bottom = 0
+    
+    # Pairs are independent (only the second pixel changes, and only by its
+    # own pair's bits), so each band of rows is embedded with array ops.
+    for y0 in range(0, height, BAND_ROWS):
+        if bit_index >= total_bits or pair_cols == 0:
+            break
+        if progress is not None:
+            progress(bit_index / total_bits)
+        band = blue[y0:y0 + BAND_ROWS, :pair_cols * 2].astype(np.int16)
+        p1 = band[:, 0::2].reshape(-1)
+        p2 = band[:, 1::2].reshape(-1)
+        d = np.abs(p2 - p1)
+        n = PAIR_BITS[d]
+        offsets = bit_index + np.cumsum(n) - n
+        used = int(np.searchsorted(offsets, total_bits))
+        p1, p2, d, n, offsets = p1[:used], p2[:used], d[:used], n[:used], offsets[:used]
+        
+        chunk = padded[offsets[:, None] + np.arange(3)].astype(np.int16)
+        value = np.where(n == 3, chunk[:, 0] * 4 + chunk[:, 1] * 2 + chunk[:, 2], chunk[:, 0] * 2 + chunk[:, 1])
+        new_d = np.minimum(RANGE_LOWER[d] + value, RANGE_UPPER[d])
+        new_p2 = np.where(p2 > p1, np.minimum(p1 + new_d, 255), np.maximum(p1 - new_d, 0))
+        
+        rows, cols = np.divmod(np.arange(used), pair_cols)
+        if used:
+            bottom = y0 + int(rows[-1]) + 1
+            if on_write is not None:
+                on_write(y0, bottom)
+        blue[y0 + rows, cols * 2 + 1] = new_p2
+        bit_index += int(n.sum())
+    
+    if bit_index < total_bits:
+        raise ValueError(f"Message too large for PVD encoding. Max: {max(bit_index - 9, 0) // 9} bytes.")
+    return 0, bottom, 0, pair_cols * 2
+
+def pvd_encode_in_memory(input_buffer, secret_msg, output_buffer, progress=None):
+    if is_multiframe(input_buffer):
+        return encode_frames('pvd', input_buffer, secret_msg, output_buffer, progress)
     try:
         img = Image.open(input_buffer).convert('RGB')
+        pixels = np.array(img)
     except Exception as e:
         logging.error(f"PVD Encode Error: {e}")
         return None
-        
-    pixels = img.load()
-    width, height = img.size
-    
-    msg_bits = []
-    for c in secret_msg:
-        byte = format(ord(c), '08b')
-        parity = '1' if byte.count('1') % 2 else '0'
-        msg_bits.append(byte + parity)
-    msg_bits = ''.join(msg_bits)
-    msg_bits += '000000000'
-    
-    bit_index = 0
-    total_bits = len(msg_bits)
-    
-    for y in range(height):
-        for x in range(0, width - 1, 2):
-            if bit_index >= total_bits:
-                break
-                
-            p1 = pixels[x, y][2]
-            p2 = pixels[x + 1, y][2]
-            d = abs(p2 - p1)
-            lower, upper = get_range(d)
-            n = min(3, upper.bit_length() - 1)
-            
-            if n <= 0:
-                continue
-                
-            bits = msg_bits[bit_index:bit_index+n]
-            if len(bits) < n:
-                bits = bits.ljust(n, '0')
-            bit_index += n
-            
-            new_d = lower + int(bits, 2)
-            new_d = min(new_d, upper)
-            
-            if p2 > p1:
-                new_p2 = min(p1 + new_d, 255)
-            else:
-                new_p2 = max(p1 - new_d, 0)
-                
-            pixels[x + 1, y] = (pixels[x + 1, y][0], pixels[x + 1, y][1], new_p2)
-            
+
+    region = pvd_embed_array(pixels, secret_msg, progress)
+    img = Image.fromarray(pixels)
+
     metadata = PngImagePlugin.PngInfo()
     metadata.add_text(METADATA_TAG_KEY, CODEWORD)
     
     img.save(output_buffer, format='PNG', pnginfo=metadata)
     output_buffer.seek(0)
+    return region
@@ -0,0 +1,389 @@
+import os
+import io
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from schemes import SCHEMES, get_encoder, get_decoder, output_extension
+from admission import AdmissionRejected, estimate_request
+
+# A running job whose heartbeat is older than this belongs to a server process
+# that died; it is put back in the queue.
+STALE_AFTER_SECONDS = 60
+HEARTBEAT_SECONDS = 10
+
+class JobCancelled(Exception):
+    pass
+
+class JobStore:
+    """
+    SQLite-backed job table plus a directory holding job inputs and results.
+    Every call opens its own connection, so the store can be shared between
+    request threads, the dispatcher thread and worker processes.
+    """
+
+    def __init__(self, jobs_dir):
+        self.jobs_dir = os.path.abspath(jobs_dir)
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.db_path = os.path.join(self.jobs_dir, 'jobs.sqlite3')
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    operation TEXT NOT NULL,
+                    scheme TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    input_path TEXT NOT NULL,
+                    result_path TEXT,
+                    result_text TEXT,
+                    metrics TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    heartbeat_at REAL
+                )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params)
+        finally:
+            conn.close()
+
+    def create(self, operation, scheme, image_bytes, message=None):
+        job_id = uuid.uuid4().hex
+        input_path = os.path.join(self.jobs_dir, f"{job_id}.input")
+        with open(input_path, 'wb') as f:
+            f.write(image_bytes)
+        now = time.time()
+        self._execute(
+            'INSERT INTO jobs (id, operation, scheme, status, message, input_path, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, operation, scheme, 'queued', message, input_path, now, now))
+        return job_id
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def claim_next(self):
+        """Atomically move the oldest queued job to running and return it."""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', progress = 0, updated_at = ?, heartbeat_at = ? WHERE id = ?",
+                (now, now, row['id']))
+            conn.execute('COMMIT')
+            return row['id']
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def update_progress(self, job_id, percent):
+        """Record progress and return True if cancellation was requested."""
+        now = time.time()
+        self._execute('UPDATE jobs SET progress = ?, updated_at = ?, heartbeat_at = ? WHERE id = ?',
+                      (round(percent, 1), now, now, job_id))
+        return self.cancel_requested(job_id)
+
+    def cancel_requested(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return bool(row and row['cancel_requested'])
+
+    def heartbeat(self, job_ids):
+        now = time.time()
+        for job_id in job_ids:
+            self._execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'", (now, job_id))
+
+    def finish(self, job_id, status, result_path=None, result_text=None, metrics=None, error=None):
+        # The secret message and the uploaded cover are not kept once a job ends.
+        job = self.get(job_id)
+        self._execute(
+            'UPDATE jobs SET status = ?, progress = CASE WHEN ? = \'done\' THEN 100 ELSE progress END, '
+            'result_path = ?, result_text = ?, metrics = ?, error = ?, message = NULL, updated_at = ? WHERE id = ?',
+            (status, status, result_path, result_text, metrics, error, time.time(), job_id))
+        if job and os.path.exists(job['input_path']):
+            os.remove(job['input_path'])
+
+    def request_cancel(self, job_id):
+        """Cancel a queued job immediately, or flag a running one. Returns the new status."""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            status = row['status']
+            if status == 'queued':
+                status = 'cancelled'
+                conn.execute("UPDATE jobs SET status = 'cancelled', message = NULL, updated_at = ? WHERE id = ?",
+                             (time.time(), job_id))
+            elif status == 'running':
+                conn.execute('UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ?',
+                             (time.time(), job_id))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        if status == 'cancelled':
+            job = self.get(job_id)
+            if job and os.path.exists(job['input_path']):
+                os.remove(job['input_path'])
+        return status
+
+    def requeue(self, job_id):
+        """Put a claimed job that has not started back in the queue."""
+        self._execute("UPDATE jobs SET status = 'queued', heartbeat_at = NULL, updated_at = ? "
+                      "WHERE id = ? AND status = 'running'", (time.time(), job_id))
+
+    def requeue_stale(self):
+        cutoff = time.time() - STALE_AFTER_SECONDS
+        cursor = self._execute(
+            "UPDATE jobs SET status = 'queued', progress = 0, updated_at = ? "
+            "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+            (time.time(), cutoff))
+        if cursor.rowcount:
+            logging.warning(f"Jobs: requeued {cursor.rowcount} interrupted job(s)")
+
+class _ProgressReporter:
+    def __init__(self, store, job_id, interval=0.5):
+        self.store = store
+        self.job_id = job_id
+        self.interval = interval
+        self._last = 0.0
+
+    def __call__(self, fraction):
+        now = time.monotonic()
+        if now - self._last < self.interval:
+            return
+        self._last = now
+        if self.store.update_progress(self.job_id, fraction * 100):
+            raise JobCancelled()
+
+def _run_job(jobs_dir, job_id):
+    """Worker-process entry point: run one claimed job to completion."""
+    from metrics import calculate_metrics_in_memory
+    store = JobStore(jobs_dir)
+    job = store.get(job_id)
+    reporter = _ProgressReporter(store, job_id)
+    try:
+        with open(job['input_path'], 'rb') as f:
+            input_buffer = io.BytesIO(f.read())
+        if job['operation'] == 'decode':
+            result = get_decoder(job['scheme'])(input_buffer)
+            if result is None or (isinstance(result, str) and result.startswith("AutoDecode Error:")):
+                raise ValueError(result or "Decoding failed")
+            store.finish(job_id, 'done', result_text=result)
+            return
+
+        if job['scheme'] == 'dct':
+            # Metrics below compare against the cropped cover the stego is made from
+            from encoders.dct import dct_prepare_cover
+            input_buffer = dct_prepare_cover(input_buffer)
+        output_buffer = io.BytesIO()
+        region = get_encoder(job['scheme'])(input_buffer, job['message'], output_buffer, progress=reporter)
+        if not output_buffer.getbuffer().nbytes:
+            raise ValueError("Encoder produced no output")
+        if store.cancel_requested(job_id):
+            raise JobCancelled()
+        result_path = os.path.join(store.jobs_dir, f"{job_id}.result{output_extension(job['scheme'], output_buffer.getbuffer())}")
+        with open(result_path + '.part', 'wb') as f:
+            f.write(output_buffer.getbuffer())
+        os.replace(result_path + '.part', result_path)
+        metrics = None
+        try:
+            input_buffer.seek(0)
+            output_buffer.seek(0)
+            metrics = json.dumps(calculate_metrics_in_memory(input_buffer, output_buffer, region))
+        except Exception as metrics_err:
+            logging.warning(f"Job {job_id}: metrics calculation failed: {metrics_err}")
+        store.finish(job_id, 'done', result_path=result_path, metrics=metrics)
+    except JobCancelled:
+        store.finish(job_id, 'cancelled')
+    except ValueError as ve:
+        store.finish(job_id, 'failed', error=f"Input Error: {ve}")
+    except Exception as e:
+        logging.exception(f"Job {job_id} failed")
+        store.finish(job_id, 'failed', error=str(e))
+
+class JobRunner:
+    """
+    Dispatcher thread that claims queued jobs from the store and runs them on
+    a local process pool. Jobs queued (or interrupted) before a restart are
+    picked up again when the runner starts. With a `budget` (MemoryBudget)
+    each job holds a reservation for its estimated peak while it runs; a job
+    that does not fit yet stays queued, one larger than the budget fails.
+    """
+
+    def __init__(self, store, max_workers=1, poll_interval=1.0, budget=None):
+        self.store = store
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.budget = budget
+        self._executor = None
+        self._in_flight = {}
+        self._reservations = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.store.requeue_stale()
+        self._thread = threading.Thread(target=self._loop, name='stegosuite-jobs', daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def submit(self, operation, scheme, image_bytes, message=None):
+        if operation not in ('encode', 'decode'):
+            raise ValueError("Operation must be 'encode' or 'decode'")
+        allowed = SCHEMES if operation == 'encode' else ('auto',) + SCHEMES
+        if scheme not in allowed:
+            raise ValueError(f"Invalid {operation} scheme")
+        if operation == 'encode' and not message:
+            raise ValueError("Missing message")
+        job_id = self.store.create(operation, scheme, image_bytes, message)
+        self.notify()
+        return job_id
+
+    def _loop(self):
+        last_maintenance = 0.0
+        while not self._stop.is_set():
+            try:
+                self._reap()
+                while len(self._in_flight) < self.max_workers:
+                    job_id = self.store.claim_next()
+                    if job_id is None:
+                        break
+                    if not self._reserve(job_id):
+                        break
+                    try:
+                        if self._executor is None:
+                            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                        self._in_flight[job_id] = self._executor.submit(_run_job, self.store.jobs_dir, job_id)
+                    except Exception:
+                        self._release(job_id)
+                        raise
+                now = time.monotonic()
+                if now - last_maintenance >= HEARTBEAT_SECONDS:
+                    last_maintenance = now
+                    self.store.heartbeat(list(self._in_flight))
+                    self.store.requeue_stale()
+            except Exception as e:
+                logging.error(f"Jobs: dispatcher error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _reserve(self, job_id):
+        """
+        Reserve memory for a claimed job. False if it went back to the queue
+        (budget full) or failed (larger than the whole budget).
+        """
+        if self.budget is None:
+            return True
+        job = self.store.get(job_id)
+        try:
+            with open(job['input_path'], 'rb') as f:
+                nbytes, info = estimate_request(job['operation'], job['scheme'], [f], job['message'])
+            reservation = self.budget.try_reserve(nbytes, operation=job['operation'], scheme=job['scheme'],
+                                                  job_id=job_id, **info)
+        except AdmissionRejected as e:
+            self.store.finish(job_id, 'failed', error=str(e))
+            return False
+        if reservation is None:
+            self.store.requeue(job_id)
+            return False
+        self._reservations[job_id] = reservation
+        return True
+
+    def _release(self, job_id):
+        reservation = self._reservations.pop(job_id, None)
+        if reservation is not None:
+            reservation.release()
+
+    def _reap(self):
+        for job_id, future in list(self._in_flight.items()):
+            if not future.done():
+                continue
+            del self._in_flight[job_id]
+            self._release(job_id)
+            try:
+                future.result()
+            except BrokenProcessPool:
+                self.store.finish(job_id, 'failed', error="Worker process crashed")
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+            except Exception as e:
+                self.store.finish(job_id, 'failed', error=str(e))
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        for job_id in list(self._reservations):
+            self._release(job_id)
+
+def job_status(job):
+    """Public JSON view of a job row."""
+    status = {
+        'job_id': job['id'],
+        'operation': job['operation'],
+        'scheme': job['scheme'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+    }
+    if job['error']:
+        status['error'] = job['error']
+    if job['status'] == 'done':
+        if job['operation'] == 'decode':
+            status['message'] = job['result_text']
+        else:
+            status['result_url'] = f"/api/jobs/{job['id']}/result"
+        if job['metrics']:
+            status['metrics'] = json.loads(job['metrics'])
+    return status
@@ -0,0 +1,344 @@
+import re
+import numpy as np
+
+ZIGZAG = np.array([
+    0, 1, 8, 16, 9, 2, 3, 10,
+    17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34,
+    27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36,
+    29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46,
+    53, 60, 61, 54, 47, 55, 62, 63
+])
+
+_SOF_BASELINE = (0xC0, 0xC1)
+_SOF_UNSUPPORTED = (0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+# Split on RSTn markers, keeping them: even pieces are restart intervals
+_RST_SPLIT = re.compile(b'(\xff[\xd0-\xd7])')
+_SCAN_END = re.compile(b'\xff[^\x00\xd0-\xd7]')
+
+
+class HuffmanTable:
+    def __init__(self, counts, symbols):
+        self.lookup = [0] * 65536
+        self.codes = [None] * 256
+        code = 0
+        k = 0
+        for length in range(1, 17):
+            for _ in range(counts[length - 1]):
+                symbol = symbols[k]
+                k += 1
+                self.codes[symbol] = (code, length)
+                start = code << (16 - length)
+                end = (code + 1) << (16 - length)
+                self.lookup[start:end] = [(length << 8) | symbol] * (end - start)
+                code += 1
+            code <<= 1
+
+
+class JpegCoefficients:
+    """
+    Quantized DCT coefficients of a baseline JPEG, kept alongside the
+    original file so it can be rewritten with some coefficients changed.
+
+    `blocks` has shape (n_blocks, 64) in zigzag order, with blocks listed in
+    the order they appear in the entropy-coded scan. `block_component` gives
+    the component index of each block.
+
+    The scan is never re-encoded: flipping the magnitude LSB of a coefficient
+    with |c| >= 2 keeps its Huffman size category, so every code stays where
+    it is and only that one amplitude bit changes. decode() records where
+    those bits are and to_bytes() toggles them in a copy of the scan.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.components = []
+        self.huffman = {}
+        self.restart_interval = 0
+        self.width = 0
+        self.height = 0
+        self._parse_markers()
+        self._layout_blocks()
+        self.blocks = None
+
+    def _parse_markers(self):
+        data = self.data
+        if data[:2] != b'\xff\xd8':
+            raise ValueError("Not a JPEG file")
+        pos = 2
+        frame_seen = False
+        while True:
+            while pos < len(data) and data[pos] == 0xFF and data[pos + 1] == 0xFF:
+                pos += 1
+            if pos + 4 > len(data) or data[pos] != 0xFF:
+                raise ValueError("Corrupt JPEG: marker expected")
+            marker = data[pos + 1]
+            length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+            segment = data[pos + 4:pos + 2 + length]
+            if marker in _SOF_UNSUPPORTED:
+                raise ValueError("Only baseline (sequential Huffman) JPEGs are supported")
+            if marker in _SOF_BASELINE:
+                self._parse_sof(segment)
+                frame_seen = True
+            elif marker == 0xC4:
+                self._parse_dht(segment)
+            elif marker == 0xDD:
+                self.restart_interval = int.from_bytes(segment[:2], 'big')
+            elif marker == 0xDA:
+                if not frame_seen:
+                    raise ValueError("Corrupt JPEG: scan before frame header")
+                self.header_end = pos
+                self.scan_start = pos + 2 + length
+                self._parse_sos(segment)
+                break
+            elif marker == 0xD9:
+                raise ValueError("Corrupt JPEG: no scan data")
+            pos += 2 + length
+
+        match = _SCAN_END.search(data, self.scan_start)
+        if match is None:
+            raise ValueError("Corrupt JPEG: unterminated scan")
+        self.scan_end = match.start()
+        marker_pos = self.scan_end
+        while data[marker_pos + 1] == 0xFF:
+            marker_pos += 1
+        if data[marker_pos + 1] != 0xD9:
+            raise ValueError("Only single-scan baseline JPEGs are supported")
+
+    def _parse_sof(self, segment):
+        if segment[0] != 8:
+            raise ValueError("Only 8-bit JPEGs are supported")
+        self.height = int.from_bytes(segment[1:3], 'big')
+        self.width = int.from_bytes(segment[3:5], 'big')
+        for i in range(segment[5]):
+            cid, sampling, _ = segment[6 + 3 * i:9 + 3 * i]
+            self.components.append({'id': cid, 'h': sampling >> 4, 'v': sampling & 15})
+
+    def _parse_dht(self, segment):
+        pos = 0
+        while pos < len(segment):
+            table_class, table_id = segment[pos] >> 4, segment[pos] & 15
+            counts = segment[pos + 1:pos + 17]
+            total = sum(counts)
+            symbols = segment[pos + 17:pos + 17 + total]
+            self.huffman[(table_class, table_id)] = HuffmanTable(counts, symbols)
+            pos += 17 + total
+
+    def _parse_sos(self, segment):
+        by_id = {c['id']: c for c in self.components}
+        scan_components = []
+        for i in range(segment[0]):
+            cid, tables = segment[1 + 2 * i:3 + 2 * i]
+            if cid not in by_id:
+                raise ValueError("Corrupt JPEG: scan references unknown component")
+            by_id[cid]['dc'] = self.huffman[(0, tables >> 4)]
+            by_id[cid]['ac'] = self.huffman[(1, tables & 15)]
+            scan_components.append(by_id[cid])
+        if len(scan_components) != len(self.components):
+            raise ValueError("Only single-scan baseline JPEGs are supported")
+
+    def _layout_blocks(self):
+        hmax = max(c['h'] for c in self.components)
+        vmax = max(c['v'] for c in self.components)
+        for c in self.components:
+            comp_w = -(-self.width * c['h'] // hmax)
+            comp_h = -(-self.height * c['v'] // vmax)
+            c['blocks_w'] = -(-comp_w // 8)
+            c['blocks_h'] = -(-comp_h // 8)
+
+        if len(self.components) == 1:
+            comp = self.components[0]
+            rows, cols = np.divmod(np.arange(comp['blocks_h'] * comp['blocks_w']), comp['blocks_w'])
+            self.mcu_layout = [(0, 1, 1)]
+            self.n_mcus = comp['blocks_h'] * comp['blocks_w']
+            self.mcus_x, self.mcu_height = comp['blocks_w'], 8
+            self.block_component = np.zeros(self.n_mcus, dtype=np.int32)
+            self.block_row, self.block_col = rows, cols
+            return
+
+        mcus_x = -(-self.width // (8 * hmax))
+        mcus_y = -(-self.height // (8 * vmax))
+        self.n_mcus = mcus_x * mcus_y
+        self.mcus_x, self.mcu_height = mcus_x, 8 * vmax
+        self.mcu_layout = [(ci, c['v'], c['h']) for ci, c in enumerate(self.components)]
+        my, mx = np.divmod(np.arange(self.n_mcus), mcus_x)
+        comp_idx, rows, cols = [], [], []
+        for ci, v, h in self.mcu_layout:
+            for iy in range(v):
+                for ix in range(h):
+                    comp_idx.append(np.full(self.n_mcus, ci))
+                    rows.append(my * v + iy)
+                    cols.append(mx * h + ix)
+        self.block_component = np.stack(comp_idx, axis=1).reshape(-1).astype(np.int32)
+        self.block_row = np.stack(rows, axis=1).reshape(-1)
+        self.block_col = np.stack(cols, axis=1).reshape(-1)
+        for c in self.components:
+            c['blocks_w'] = mcus_x * c['h']
+            c['blocks_h'] = mcus_y * c['v']
+
+    @property
+    def blocks_per_mcu(self):
+        return sum(v * h for _, v, h in self.mcu_layout)
+
+    def leading_rows(self, n_blocks):
+        """
+        (top, bottom, left, right) box of the pixels that changing any of the
+        first `n_blocks` blocks of the scan can affect. One extra MCU row is
+        included: chroma upsampling blends in the neighbouring blocks.
+        """
+        mcus = -(-n_blocks // self.blocks_per_mcu)
+        mcu_rows = -(-mcus // self.mcus_x)
+        return 0, min(self.height, (mcu_rows + 1) * self.mcu_height), 0, self.width
+
+    def _intervals(self):
+        raw = self.data[self.scan_start:self.scan_end]
+        pieces = _RST_SPLIT.split(raw)[0::2] if self.restart_interval else [raw]
+        return [p.replace(b'\xff\x00', b'\xff') for p in pieces]
+
+    def decode(self, max_blocks=None, lsb_positions=None):
+        """
+        Entropy-decode the scan into `self.blocks`. With `max_blocks`, only
+        the leading blocks (rounded up to whole MCUs) are decoded. A list
+        passed as `lsb_positions` receives, for every AC coefficient with
+        |c| >= 2 in scan order, the (interval, bit) position of its magnitude
+        LSB in the unstuffed restart interval.
+        """
+        per_mcu = self.blocks_per_mcu
+        n_mcus = self.n_mcus
+        if max_blocks is not None:
+            n_mcus = min(n_mcus, -(-max_blocks // per_mcu))
+        blocks = np.zeros((n_mcus * per_mcu, 64), dtype=np.int32)
+        interval = self.restart_interval or n_mcus
+        tables = [(self.components[ci]['dc'], self.components[ci]['ac'], ci, v * h)
+                  for ci, v, h in self.mcu_layout]
+
+        block_index = 0
+        for interval_index, (start, buf) in enumerate(zip(range(0, n_mcus, interval), self._intervals())):
+            buf = buf + b'\xff\xff\xff'
+            pos = 0
+            preds = [0] * len(self.components)
+            for _ in range(min(interval, n_mcus - start)):
+                for dc_table, ac_table, ci, count in tables:
+                    dc_lookup = dc_table.lookup
+                    ac_lookup = ac_table.lookup
+                    for _ in range(count):
+                        out = blocks[block_index]
+                        block_index += 1
+
+                        entry = dc_lookup[(int.from_bytes(buf[pos >> 3:(pos >> 3) + 3], 'big') >> (8 - (pos & 7))) & 0xFFFF]
+                        if entry == 0:
+                            raise ValueError("Corrupt JPEG: bad Huffman code")
+                        pos += entry >> 8
+                        s = entry & 0xFF
+                        diff = 0
+                        if s:
+                            diff = ((int.from_bytes(buf[pos >> 3:(pos >> 3) + 3], 'big') >> (8 - (pos & 7))) & 0xFFFF) >> (16 - s)
+                            pos += s
+                            if diff < (1 << (s - 1)):
+                                diff -= (1 << s) - 1
+                        preds[ci] += diff
+                        out[0] = preds[ci]
+
+                        k = 1
+                        while k < 64:
+                            entry = ac_lookup[(int.from_bytes(buf[pos >> 3:(pos >> 3) + 3], 'big') >> (8 - (pos & 7))) & 0xFFFF]
+                            if entry == 0:
+                                raise ValueError("Corrupt JPEG: bad Huffman code")
+                            pos += entry >> 8
+                            rs = entry & 0xFF
+                            s = rs & 15
+                            if s == 0:
+                                if rs != 0xF0:
+                                    break
+                                k += 16
+                                continue
+                            k += rs >> 4
+                            value = ((int.from_bytes(buf[pos >> 3:(pos >> 3) + 3], 'big') >> (8 - (pos & 7))) & 0xFFFF) >> (16 - s)
+                            if s > 1 and lsb_positions is not None:
+                                lsb_positions.append((interval_index, pos + s - 1))
+                            pos += s
+                            if value < (1 << (s - 1)):
+                                value -= (1 << s) - 1
+                            out[k] = value
+                            k += 1
+
+        self.blocks = blocks
+        return blocks
+
+    def usable_coefficients(self, needed):
+        """
+        The first `needed` AC coefficients with |c| >= 2 in scan order (fewer
+        if the image has fewer) and the positions of their magnitude LSBs.
+        Only as many leading blocks are decoded as that takes: the window
+        doubles until enough usable coefficients have been seen.
+        """
+        total_blocks = self.n_mcus * self.blocks_per_mcu
+        max_blocks = max(self.blocks_per_mcu, needed // 16)
+        while True:
+            positions = []
+            blocks = self.decode(max_blocks, positions)
+            ac = blocks[:, 1:].reshape(-1)
+            usable = ac[np.abs(ac) >= 2]
+            if len(usable) >= needed or len(blocks) >= total_blocks:
+                return usable[:needed], positions[:needed]
+            max_blocks = len(blocks) * 2
+
+    def component_blocks(self, component):
+        """Return one component's coefficients as a (blocks_h, blocks_w, 64) grid."""
+        comp = self.components[component]
+        grid = np.zeros((comp['blocks_h'], comp['blocks_w'], 64), dtype=np.int32)
+        n = len(self.blocks)
+        mask = self.block_component[:n] == component
+        grid[self.block_row[:n][mask], self.block_col[:n][mask]] = self.blocks[mask]
+        return grid
+
+    def _patched_scan(self, flips):
+        raw = self.data[self.scan_start:self.scan_end]
+        by_interval = {}
+        for interval, bit in flips:
+            by_interval.setdefault(interval, []).append(bit)
+        if not by_interval:
+            return raw
+        pieces = _RST_SPLIT.split(raw) if self.restart_interval else [raw]
+        for interval, bits in by_interval.items():
+            buf = bytearray(pieces[2 * interval].replace(b'\xff\x00', b'\xff'))
+            for bit in bits:
+                buf[bit >> 3] ^= 0x80 >> (bit & 7)
+            pieces[2 * interval] = bytes(buf).replace(b'\xff', b'\xff\x00')
+        return b''.join(pieces)
+
+    def to_bytes(self, comment=None, flips=()):
+        """
+        Rebuild the JPEG with the scan bits at `flips` ((interval, bit)
+        positions from decode) toggled. Only the restart intervals holding a
+        flip are unstuffed and re-stuffed; the rest of the file is copied.
+        `comment` (bytes) is written as a COM segment ahead of the frame.
+        """
+        header = self.data[:self.header_end]
+        if comment is not None:
+            header = _insert_comment(header, comment)
+        return header + self.data[self.header_end:self.scan_start] + self._patched_scan(flips) + self.data[self.scan_end:]
+
+
+def _insert_comment(header, comment):
+    pos = 2
+    out = bytearray(header[:2])
+    inserted = False
+    while pos < len(header):
+        marker = header[pos + 1]
+        length = int.from_bytes(header[pos + 2:pos + 4], 'big')
+        segment = header[pos:pos + 2 + length]
+        if marker == 0xFE and segment[4:].startswith(comment.split(b'=')[0] + b'='):
+            pos += 2 + length
+            continue
+        if not inserted and not (0xE0 <= marker <= 0xEF):
+            out += b'\xff\xfe' + (len(comment) + 2).to_bytes(2, 'big') + comment
+            inserted = True
+        out += segment
+        pos += 2 + length
+    if not inserted:
+        out += b'\xff\xfe' + (len(comment) + 2).to_bytes(2, 'big') + comment
+    return bytes(out)
+
@@ -0,0 +1,408 @@
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+import numpy as np
+from PIL import Image
+
+DEFAULT_MIX = "encode:lsbm=4,encode:dct=1,encode:pvd=1,decode:auto=2"
+DEFAULT_SIZES = "256x256=3,1024x768=1"
+SAMPLE_INTERVAL = 0.5
+
+def parse_weighted(spec, parse_key):
+    """'a=3,b=1' -> [(parse_key('a'), 3.0), (parse_key('b'), 1.0)]"""
+    items = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        key, _, weight = part.partition('=')
+        weight = float(weight) if weight else 1.0
+        if weight <= 0:
+            raise ValueError(f"Weight must be positive: {part}")
+        items.append((parse_key(key.strip()), weight))
+    if not items:
+        raise ValueError(f"Empty specification: {spec!r}")
+    return items
+
+def parse_operation(key):
+    operation, _, scheme = key.partition(':')
+    if operation not in ('encode', 'decode') or not scheme:
+        raise ValueError(f"Expected encode:<scheme> or decode:<scheme>, got {key!r}")
+    return operation, scheme
+
+def parse_size(key):
+    width, _, height = key.lower().partition('x')
+    return int(width), int(height)
+
+def synthetic_image(width, height, seed):
+    # Smooth gradients plus mild noise: enough texture for the edge and
+    # difference based schemes without saturating PVD or DCT.
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([xx * 200 / max(width, 1), yy * 200 / max(height, 1), (xx + yy) * 100 / max(width + height, 1)], axis=-1)
+    pixels = np.clip(base + 28 + rng.normal(0, 4, base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def multipart(fields, files):
+    """Encode form fields and (name, filename, bytes) files as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode())
+        body.write(str(value).encode('utf-8') + b'\r\n')
+    for name, filename, data in files:
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        body.write(data + b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+class Workload:
+    """Pre-built request bodies; decode requests get stego images made up front."""
+
+    def __init__(self, mix, sizes, message_bytes, seed=0):
+        from schemes import get_encoder
+        self.mix = mix
+        self.sizes = sizes
+        self.random = random.Random(seed)
+        message = ('load test payload ' * (message_bytes // 18 + 1))[:message_bytes]
+        self.requests = {}
+        for (operation, scheme), _ in mix:
+            for size, _ in sizes:
+                cover = synthetic_image(*size, seed=hash(size) & 0xFFFF)
+                if operation == 'encode':
+                    fields, image = {'scheme': scheme, 'message': message}, cover
+                else:
+                    source = 'lsbm' if scheme == 'auto' else scheme
+                    stego = io.BytesIO()
+                    get_encoder(source)(io.BytesIO(cover), message, stego)
+                    fields, image = {'scheme': scheme}, stego.getvalue()
+                self.requests[(operation, scheme, size)] = multipart(fields, [('image', 'image.png', image)])
+
+    def _pick(self, items):
+        return self.random.choices([item for item, _ in items], weights=[w for _, w in items])[0]
+
+    def next(self):
+        operation, scheme = self._pick(self.mix)
+        size = self._pick(self.sizes)
+        return operation, scheme, size, self.requests[(operation, scheme, size)]
+
+class WsgiTarget:
+    """Drive the Flask app in-process through its WSGI interface."""
+
+    def __init__(self):
+        from werkzeug.test import Client
+        import main
+        self.app = main.app
+        self._client = Client
+        self.pid = os.getpid()
+
+    def client(self):
+        client = self._client(self.app)
+
+        def send(path, body, content_type):
+            response = client.post(path, data=body, content_type=content_type)
+            size = sum(len(chunk) for chunk in response.iter_encoded())
+            response.close()
+            return response.status_code, size
+        return send
+
+class HttpTarget:
+    """Drive a running server over HTTP (one keep-alive connection per worker)."""
+
+    def __init__(self, url, pid=None):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.pid = pid
+
+    def client(self):
+        connection = [None]
+
+        def send(path, body, content_type):
+            if connection[0] is None:
+                connection[0] = http.client.HTTPConnection(self.host, self.port, timeout=300)
+            try:
+                connection[0].request('POST', self.prefix + path, body=body, headers={'Content-Type': content_type})
+                response = connection[0].getresponse()
+                size = len(response.read())
+                return response.status, size
+            except Exception:
+                connection[0].close()
+                connection[0] = None
+                raise
+        return send
+
+def _descendants(pid):
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        ppid = int(stat[stat.rindex(')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        found.append(current)
+        stack.extend(children.get(current, []))
+    return found
+
+def _process_sample(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    rss = int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+    return cpu_seconds, rss
+
+class ResourceSampler(threading.Thread):
+    """
+    Samples CPU time and RSS of the server process and all its descendants
+    (offload, job and gunicorn workers) from /proc. Linux only; elsewhere it
+    records nothing.
+    """
+
+    def __init__(self, pid, interval=SAMPLE_INTERVAL):
+        super().__init__(name='loadtest-sampler', daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.stats = {}
+        self._stopping = threading.Event()
+
+    def sample(self):
+        now = time.monotonic()
+        for pid in _descendants(self.pid):
+            try:
+                cpu_seconds, rss = _process_sample(pid)
+            except (OSError, ValueError, IndexError):
+                continue
+            entry = self.stats.setdefault(pid, {'first': (now, cpu_seconds), 'rss': []})
+            entry['last'] = (now, cpu_seconds)
+            entry['rss'].append(rss)
+
+    def run(self):
+        if self.pid is None or not os.path.isdir('/proc'):
+            return
+        while not self._stopping.is_set():
+            self.sample()
+            self._stopping.wait(self.interval)
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+        if self.pid is not None and os.path.isdir('/proc'):
+            self.sample()
+
+    def report(self):
+        workers = []
+        for pid, entry in sorted(self.stats.items()):
+            (t0, cpu0), (t1, cpu1) = entry['first'], entry['last']
+            workers.append({
+                'pid': pid,
+                'cpu_seconds': round(cpu1 - cpu0, 3),
+                'cpu_percent': round(100 * (cpu1 - cpu0) / (t1 - t0), 1) if t1 > t0 else None,
+                'rss_mb_mean': round(sum(entry['rss']) / len(entry['rss']) / 2**20, 1),
+                'rss_mb_peak': round(max(entry['rss']) / 2**20, 1),
+            })
+        return workers
+
+def _percentiles(latencies):
+    if not latencies:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None, 'max': None}
+    values = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': round(p50, 2), 'p95': round(p95, 2), 'p99': round(p99, 2),
+            'mean': round(values.mean(), 2), 'max': round(values.max(), 2)}
+
+def _summarize(records, elapsed):
+    count = len(records)
+    statuses = [r['status'] for r in records]
+    rejected = sum(1 for s in statuses if s == 429)
+    errors = sum(1 for s in statuses if s is None or (s >= 400 and s != 429))
+    ok = [r for r in records if r['status'] is not None and r['status'] < 400]
+    return {
+        'requests': count,
+        'throughput_rps': round(count / elapsed, 2) if elapsed else None,
+        'ok_rps': round(len(ok) / elapsed, 2) if elapsed else None,
+        'error_rate': round(errors / count, 4) if count else 0.0,
+        'rate_429': round(rejected / count, 4) if count else 0.0,
+        'latency_ms': _percentiles([r['latency'] for r in ok]),
+        'response_mb': round(sum(r['bytes'] for r in ok) / 2**20, 2),
+    }
+
+def run_load(target, workload, concurrency, duration=None, total=None):
+    """Run the workload until `duration` seconds pass or `total` requests are sent."""
+    records = []
+    lock = threading.Lock()
+    issued = [0]
+    deadline = time.monotonic() + duration if duration else None
+
+    def worker():
+        send = target.client()
+        while True:
+            with lock:
+                if total is not None and issued[0] >= total:
+                    return
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                issued[0] += 1
+                operation, scheme, size, (body, content_type) = workload.next()
+            start = time.perf_counter()
+            status, size_bytes, error = None, 0, None
+            try:
+                status, size_bytes = send(f'/api/{operation}', body, content_type)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            record = {'operation': operation, 'scheme': scheme, 'size': f'{size[0]}x{size[1]}',
+                      'status': status, 'latency': time.perf_counter() - start, 'bytes': size_bytes, 'error': error}
+            with lock:
+                records.append(record)
+
+    sampler = ResourceSampler(target.pid)
+    sampler.start()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, name=f'loadtest-{i}', daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+
+    groups = {}
+    for record in records:
+        groups.setdefault(f"{record['operation']}:{record['scheme']}@{record['size']}", []).append(record)
+    errors = {}
+    for record in records:
+        if record['error'] or (record['status'] or 0) >= 400:
+            key = record['error'] or f"HTTP {record['status']}"
+            errors[key] = errors.get(key, 0) + 1
+    return {
+        'elapsed_seconds': round(elapsed, 3),
+        'overall': _summarize(records, elapsed),
+        'by_request': {key: _summarize(group, elapsed) for key, group in sorted(groups.items())},
+        'errors': errors,
+        'workers': sampler.report(),
+    }
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def format_report(result, baseline=None):
+    lines = []
+    overall = result['overall']
+    lines.append(f"{overall['requests']} requests in {result['elapsed_seconds']}s: "
+                 f"{overall['throughput_rps']} req/s, errors {overall['error_rate']:.2%}, 429 {overall['rate_429']:.2%}")
+    header = f"{'request':<32}{'n':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'err':>8}{'429':>8}"
+    lines.append(header)
+    rows = [('all', overall)] + list(result['by_request'].items())
+    for key, summary in rows:
+        latency = summary['latency_ms']
+        lines.append(f"{key:<32}{summary['requests']:>6}{summary['throughput_rps'] or 0:>9.2f}"
+                     f"{latency['p50'] or 0:>9.1f}{latency['p95'] or 0:>9.1f}{latency['p99'] or 0:>9.1f}"
+                     f"{summary['error_rate']:>8.2%}{summary['rate_429']:>8.2%}")
+        if baseline is not None:
+            old = baseline['overall'] if key == 'all' else baseline['by_request'].get(key)
+            if old and old['latency_ms']['p50'] and latency['p50']:
+                lines.append(f"{'  vs baseline':<32}{'':>6}{_delta(summary['throughput_rps'], old['throughput_rps']):>9}"
+                             f"{_delta(latency['p50'], old['latency_ms']['p50']):>9}"
+                             f"{_delta(latency['p95'], old['latency_ms']['p95']):>9}"
+                             f"{_delta(latency['p99'], old['latency_ms']['p99']):>9}")
+    if result['errors']:
+        lines.append("errors: " + ", ".join(f"{k} x{v}" for k, v in sorted(result['errors'].items(), key=lambda kv: -kv[1])))
+    if result['workers']:
+        lines.append(f"{'pid':>8}{'cpu s':>9}{'cpu %':>8}{'rss MB':>9}{'peak MB':>9}")
+        for worker in result['workers']:
+            lines.append(f"{worker['pid']:>8}{worker['cpu_seconds']:>9.2f}{worker['cpu_percent'] or 0:>8.1f}"
+                         f"{worker['rss_mb_mean']:>9.1f}{worker['rss_mb_peak']:>9.1f}")
+    return '\n'.join(lines)
+
+def _delta(new, old):
+    if new is None or not old:
+        return '-'
+    return f"{(new - old) / old:+.0%}"
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='stegosuite-loadtest', description="Load-test /api/encode and /api/decode.")
+    parser.add_argument('--url', help="Base URL of a running server (default: drive the app in-process over WSGI)")
+    parser.add_argument('--server-pid', type=int, help="PID of the server in --url mode, for CPU/RSS of it and its workers")
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help="Concurrent clients")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument('-d', '--duration', type=float, help="Seconds to run (default: 30)")
+    limit.add_argument('-n', '--requests', type=int, help="Total requests to send")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Weighted operation:scheme mix (default: {DEFAULT_MIX})")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f"Weighted WIDTHxHEIGHT image sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument('--message-bytes', type=int, default=64, help="Secret message length")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the request sequence")
+    parser.add_argument('--output', help="Save the results as JSON")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        mix = parse_weighted(args.mix, parse_operation)
+        sizes = parse_weighted(args.sizes, parse_size)
+    except ValueError as e:
+        print(f"Invalid argument: {e}", file=sys.stderr)
+        return 2
+
+    print("Preparing request bodies...", file=sys.stderr)
+    workload = Workload(mix, sizes, args.message_bytes, args.seed)
+    target = HttpTarget(args.url, args.server_pid) if args.url else WsgiTarget()
+    logging.getLogger().setLevel(logging.WARNING)  # importing main resets the level
+
+    duration = args.duration if args.duration or args.requests else 30.0
+    result = run_load(target, workload, args.concurrency, duration, args.requests)
+    result['config'] = {
+        'target': args.url or 'wsgi',
+        'concurrency': args.concurrency,
+        'duration': duration,
+        'requests': args.requests,
+        'mix': args.mix,
+        'sizes': args.sizes,
+        'message_bytes': args.message_bytes,
+        'seed': args.seed,
+    }
+    result['environment'] = {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print(format_report(result, baseline))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results saved to {args.output}", file=sys.stderr)
+    return 1 if result['overall']['error_rate'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
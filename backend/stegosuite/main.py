@@ -3,20 +3,119 @@ import io
 import json
 import logging
 import traceback
-from flask import Flask, request, jsonify, send_file, send_from_directory
+import numpy as np
+from flask import Flask, Response, g, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
-from PIL import Image
-from metrics import calculate_metrics_in_memory
+from PIL import Image, UnidentifiedImageError
+from metrics import calculate_metrics_in_memory, calculate_metrics_arrays, context_box
+from schemes import PIXEL_SCHEMES, UPDATE_SCHEMES, get_encoder, get_updater, get_embedder, get_codeword, output_extension
+from multiframe import is_multiframe
+from png_stream import iter_png
+from encoders.dct import dct_prepare_cover
+from jobs import JobStore, JobRunner, job_status
+from admission import MemoryBudget, AdmissionRejected, estimate_request
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
 
 app = Flask(__name__, static_folder="../frontend/dist", static_url_path="")
-CORS(app, expose_headers=['X-Metrics'])
+CORS(app, expose_headers=['X-Metrics', 'Location'])
+
+# Requests and jobs reserve their estimated peak memory against a global
+# budget (STEGOSUITE_MEMORY_BUDGET_MB); see admission.py. Created before the
+# worker pools so they inherit its STEGOSUITE_TRACE_MEMORY allocator settings.
+memory_budget = MemoryBudget.from_env()
+
+# With STEGOSUITE_OFFLOAD_WORKERS > 0, pixel-domain encodes/decodes run on a
+# process pool; images cross the process boundary through shared memory.
+OFFLOAD_WORKERS = int(os.environ.get("STEGOSUITE_OFFLOAD_WORKERS", 0))
+offload_pool = None
+if OFFLOAD_WORKERS > 0:
+    from shm_transport import OffloadPool
+    offload_pool = OffloadPool(OFFLOAD_WORKERS)
+
+# Asynchronous jobs for inputs too large to finish within a proxy timeout.
+JOBS_DIR = os.environ.get("STEGOSUITE_JOBS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs"))
+JOB_WORKERS = int(os.environ.get("STEGOSUITE_JOB_WORKERS", 1))
+job_runner = JobRunner(JobStore(JOBS_DIR), max_workers=JOB_WORKERS, budget=memory_budget)
+job_runner.start()
+
+STEGO_FILE_TYPES = {
+    '.png': ('image/png', 'stego.png'),
+    '.jpg': ('image/jpeg', 'stego.jpg'),
+    '.tif': ('image/tiff', 'stego.tif'),
+}
+
+def admit(operation, scheme, buffers, message=None):
+    """
+    Reserve memory for a request over the uploaded `buffers` (processed one
+    at a time). Blocks while the budget is full; the reservation is released
+    when the response has been sent, so streamed bodies stay covered.
+    """
+    nbytes, info = estimate_request(operation, scheme, buffers, message)
+    g.reservation = memory_budget.reserve(nbytes, operation=operation, scheme=scheme, **info)
+
+@app.errorhandler(AdmissionRejected)
+def handle_admission_rejected(e):
+    headers = {'Retry-After': str(e.retry_after)} if e.retry_after else {}
+    return jsonify({'error': str(e)}), e.status, headers
+
+@app.after_request
+def release_reservation(response):
+    reservation = g.pop('reservation', None)
+    if reservation is None:
+        return response
+    if response.is_streamed and not response.direct_passthrough:
+        # Generated bodies (stream_pixel_encode) still hold the pixels
+        response.call_on_close(reservation.release)
+    else:
+        # Finished bodies; send_file passes its file wrapper straight to the
+        # server, which bypasses call_on_close
+        reservation.release()
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'}), 200
 
+def stream_pixel_encode(scheme, input_buffer, message, luma_ssim=False):
+    """
+    Embed into the decoded pixel array and stream the PNG back band by band,
+    so the compressed image is never buffered. Metrics go in the X-Metrics
+    header like every other encode path, so the embed and the metrics over
+    its region finish before the first byte; only the rows the embedder
+    changes are copied to keep the cover for them.
+    """
+    try:
+        if scheme == 'dct':
+            input_buffer = dct_prepare_cover(input_buffer)
+        with Image.open(input_buffer) as img:
+            pixels = np.array(img.convert('RGB'))
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"Cannot read image: {e}")
+
+    saved = []  # (top, rows) of the cover, copied just before the embedder changes them
+
+    def on_write(top, bottom):
+        saved.append((top, pixels[top:bottom].copy()))
+
+    region = get_embedder(scheme)(pixels, message, on_write=on_write)
+    top, bottom, left, right = context_box(region, pixels.shape)
+    cover = pixels[top:bottom, left:right].copy()
+    for row, rows in saved:
+        lo, hi = max(row, top), min(row + len(rows), bottom)
+        if lo < hi:
+            cover[lo - top:hi - top] = rows[lo - row:hi - row, left:right]
+    del saved
+
+    headers = {'Content-Disposition': 'attachment; filename=stego.png'}
+    try:
+        headers['X-Metrics'] = json.dumps(calculate_metrics_arrays(cover, pixels, region, luma_ssim, (top, left)))
+    except Exception as metrics_err:
+        logging.warning(f"Metrics calculation failed: {metrics_err}")
+    del cover
+    text = {'ProcessingInfo': get_codeword(scheme)}
+    return Response(iter_png(pixels, text), mimetype='image/png', headers=headers)
+
 @app.route('/api/encode', methods=['POST'])
 def handle_encode():
     metrics = None
@@ -24,40 +123,32 @@ def handle_encode():
         scheme = request.form.get('scheme')
         message = request.form.get('message')
         image_file = request.files.get('image')
+        luma_ssim = request.form.get('ssim') == 'luma'
         if not all([scheme, message, image_file]):
             return jsonify({'error': 'Missing required fields'}), 400
         input_buffer = io.BytesIO(image_file.read())
+        admit('encode', scheme, [input_buffer], message)
         output_buffer = io.BytesIO()
-        if scheme == 'dct':
-            img_pil = Image.open(input_buffer)
-            img_pil = img_pil.convert('YCbCr')
-            img_arr = np.array(img_pil)
-            img_pil.close()
-            h = (img_arr.shape[0] // 8) * 8
-            w = (img_arr.shape[1] // 8) * 8
-            if h == 0 or w == 0:
-                raise ValueError("Image too small for DCT encoding")
-            img_arr = img_arr[:h, :w]
-            processed_buffer = io.BytesIO()
-            Image.fromarray(img_arr, 'YCbCr').convert('RGB').save(processed_buffer, format='PNG')
-            processed_buffer.seek(0)
-            from encoders.dct import dct_encode_in_memory
-            dct_encode_in_memory(processed_buffer, message, output_buffer)
-        elif scheme == 'pvd':
-            from encoders.pvd import pvd_encode_in_memory
-            pvd_encode_in_memory(input_buffer, message, output_buffer)
-        elif scheme == 'erde':
-            from encoders.erde import erde_encode_in_memory
-            erde_encode_in_memory(input_buffer, message, output_buffer)
-        elif scheme == 'lsbm':
-            from encoders.lsbm import lsbm_encode_in_memory
-            lsbm_encode_in_memory(input_buffer, message, output_buffer)
+        region = None
+        if scheme in PIXEL_SCHEMES:
+            if offload_pool is not None:
+                if scheme == 'dct':
+                    # Metrics below compare against the cropped cover the stego is made from
+                    input_buffer = dct_prepare_cover(input_buffer)
+                region = offload_pool.encode_in_memory(scheme, input_buffer, message, output_buffer)
+            elif is_multiframe(input_buffer):
+                region = get_encoder(scheme)(input_buffer, message, output_buffer)
+            else:
+                return stream_pixel_encode(scheme, input_buffer, message, luma_ssim)
+        elif scheme == 'jpeg':
+            from encoders.jpeg import jpeg_encode_in_memory
+            region = jpeg_encode_in_memory(input_buffer, message, output_buffer)
         else:
             return jsonify({'error': 'Invalid encoding scheme'}), 400
         input_buffer.seek(0)
         output_buffer.seek(0)
         try:
-            metrics = calculate_metrics_in_memory(input_buffer, output_buffer)
+            metrics = calculate_metrics_in_memory(input_buffer, output_buffer, region, luma_ssim)
         except Exception as metrics_err:
             logging.warning(f"Metrics calculation failed: {metrics_err}")
             metrics = None
@@ -68,17 +159,62 @@ def handle_encode():
                 headers['X-Metrics'] = json.dumps(metrics)
             except Exception as json_err:
                 logging.warning(f"Failed to serialize metrics: {json_err}")
+        mimetype, download_name = STEGO_FILE_TYPES[output_extension(scheme, output_buffer.getbuffer())]
+        return send_file(
+            output_buffer,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name
+        ), 200, headers
+    except AdmissionRejected:
+        raise
+    except ValueError as ve:
+        return jsonify({'error': f'Input Error: {ve}'}), 400
+    except Exception as e:
+        error_details = traceback.format_exc()
+        logging.error(f"Encoding error: {e}\n{error_details}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/update', methods=['POST'])
+def handle_update():
+    """Replace the message in an existing stego image, touching only the bits that differ."""
+    try:
+        scheme = request.form.get('scheme', 'auto')
+        message = request.form.get('message')
+        image_file = request.files.get('image')
+        luma_ssim = request.form.get('ssim') == 'luma'
+        if not all([message, image_file]):
+            return jsonify({'error': 'Missing required fields'}), 400
+        if scheme != 'auto' and scheme not in UPDATE_SCHEMES:
+            return jsonify({'error': f"Updates support: auto, {', '.join(UPDATE_SCHEMES)}"}), 400
+        input_buffer = io.BytesIO(image_file.read())
+        admit('update', scheme, [input_buffer], message)
+        output_buffer = io.BytesIO()
+        region = get_updater(scheme)(input_buffer, message, output_buffer)
+        if region is None:
+            return jsonify({'error': 'Could not read the image'}), 400
+        input_buffer.seek(0)
+        output_buffer.seek(0)
+        headers = {}
+        try:
+            # Against the previous stego image, so these measure the update alone
+            headers['X-Metrics'] = json.dumps(calculate_metrics_in_memory(input_buffer, output_buffer, region, luma_ssim))
+        except Exception as metrics_err:
+            logging.warning(f"Metrics calculation failed: {metrics_err}")
+        output_buffer.seek(0)
         return send_file(
             output_buffer,
             mimetype='image/png',
             as_attachment=True,
             download_name='stego.png'
         ), 200, headers
+    except AdmissionRejected:
+        raise
     except ValueError as ve:
         return jsonify({'error': f'Input Error: {ve}'}), 400
     except Exception as e:
         error_details = traceback.format_exc()
-        logging.error(f"Encoding error: {e}\n{error_details}")
+        logging.error(f"Update error: {e}\n{error_details}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/decode', methods=['POST'])
@@ -89,7 +225,14 @@ def handle_decode():
         if not all([scheme, image_file]):
             return jsonify({'error': 'Missing required fields'}), 400
         input_buffer = io.BytesIO(image_file.read())
-        if scheme == 'auto':
+        admit('decode', scheme, [input_buffer])
+        if offload_pool is not None and scheme in PIXEL_SCHEMES:
+            if scheme == 'pvd':
+                from decoders.pvd import pvd_variant
+                result = offload_pool.decode_in_memory(pvd_variant(input_buffer), input_buffer)
+            else:
+                result = offload_pool.decode_in_memory(scheme, input_buffer)
+        elif scheme == 'auto':
             from decoders.auto_d import auto_decode_using_metadata_in_memory
             result = auto_decode_using_metadata_in_memory(input_buffer)
         elif scheme == 'dct':
@@ -98,12 +241,18 @@ def handle_decode():
         elif scheme == 'pvd':
             from decoders.pvd import pvd_decode_in_memory
             result = pvd_decode_in_memory(input_buffer)
+        elif scheme == 'mpvd':
+            from decoders.mpvd import mpvd_decode_in_memory
+            result = mpvd_decode_in_memory(input_buffer)
         elif scheme == 'erde':
             from decoders.erde import erde_decode_in_memory
             result = erde_decode_in_memory(input_buffer)
         elif scheme == 'lsbm':
             from decoders.lsbm import lsbm_decode_in_memory
             result = lsbm_decode_in_memory(input_buffer)
+        elif scheme == 'jpeg':
+            from decoders.jpeg import jpeg_decode_in_memory
+            result = jpeg_decode_in_memory(input_buffer)
         else:
             return jsonify({'error': 'Invalid decoding scheme'}), 400
         if isinstance(result, str) and result.startswith("AutoDecode Error:"):
@@ -116,11 +265,85 @@ def handle_decode():
             'message': result_message,
             'scheme': scheme
         })
+    except AdmissionRejected:
+        raise
     except Exception as e:
         error_details = traceback.format_exc()
         logging.error(f"Decoding error: {e}\n{error_details}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analyze', methods=['POST'])
+def handle_analyze():
+    from steganalysis import analyze_in_memory
+    image_files = request.files.getlist('images') + request.files.getlist('image')
+    if not image_files:
+        return jsonify({'error': 'Missing required fields'}), 400
+    buffers = [io.BytesIO(image_file.read()) for image_file in image_files]
+    admit('analyze', None, buffers)
+    results = []
+    for image_file, buffer in zip(image_files, buffers):
+        try:
+            report = analyze_in_memory(buffer)
+            results.append({'filename': image_file.filename, **report})
+        except Exception as e:
+            logging.warning(f"Analysis failed for {image_file.filename}: {e}")
+            results.append({'filename': image_file.filename, 'error': str(e)})
+    return jsonify({'results': results})
+
+@app.route('/api/memory', methods=['GET'])
+def handle_memory():
+    """Budget usage and estimated vs. measured peak memory of recent requests."""
+    return jsonify(memory_budget.stats())
+
+@app.route('/api/jobs', methods=['POST'])
+def handle_create_job():
+    try:
+        operation = request.form.get('operation', 'encode')
+        scheme = request.form.get('scheme')
+        message = request.form.get('message')
+        image_file = request.files.get('image')
+        if not all([scheme, image_file]):
+            return jsonify({'error': 'Missing required fields'}), 400
+        job_id = job_runner.submit(operation, scheme, image_file.read(), message)
+        return jsonify({'job_id': job_id, 'status': 'queued'}), 202, {'Location': f'/api/jobs/{job_id}'}
+    except ValueError as ve:
+        return jsonify({'error': f'Input Error: {ve}'}), 400
+    except Exception as e:
+        logging.error(f"Job submission error: {e}\n{traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def handle_job_status(job_id):
+    job = job_runner.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_status(job))
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def handle_cancel_job(job_id):
+    status = job_runner.store.request_cancel(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_status(job_runner.store.get(job_id)))
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def handle_job_result(job_id):
+    job = job_runner.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify(job_status(job)), 409
+    if job['operation'] == 'decode':
+        return jsonify({'message': job['result_text'], 'scheme': job['scheme']})
+    headers = {'X-Metrics': job['metrics']} if job['metrics'] else {}
+    mimetype, download_name = STEGO_FILE_TYPES[os.path.splitext(job['result_path'])[1]]
+    return send_file(
+        job['result_path'],
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name
+    ), 200, headers
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_react_app(path):
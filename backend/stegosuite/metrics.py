@@ -1,16 +1,20 @@
 import cv2
 import numpy as np
-from skimage.metrics import peak_signal_noise_ratio as psnr
 from skimage.metrics import structural_similarity as ssim
 import logging
+from multiframe import is_multiframe, calculate_metrics_frames
 
-def calculate_metrics_in_memory(cover_buffer, stego_buffer):
+SSIM_WIN_SIZE = 7
+
+def calculate_metrics_in_memory(cover_buffer, stego_buffer, region=None, luma_ssim=False):
     """
     Calculate image quality metrics between cover and stego images.
     
     Args:
         cover_buffer: BytesIO buffer containing the cover image
         stego_buffer: BytesIO buffer containing the stego image
+        region: optional (top, bottom, left, right) box the encoder modified
+        luma_ssim: compute SSIM on the luma channel only
         
     Returns:
         Dictionary with PSNR, SSIM, and BER metrics
@@ -18,6 +22,9 @@ def calculate_metrics_in_memory(cover_buffer, stego_buffer):
     logging.debug("Calculating metrics between cover and stego images")
     
     try:
+        if is_multiframe(cover_buffer):
+            return calculate_metrics_frames(cover_buffer, stego_buffer, luma_ssim)
+
         # Open images from buffers
         cover_buffer.seek(0)
         stego_buffer.seek(0)
@@ -29,19 +36,116 @@ def calculate_metrics_in_memory(cover_buffer, stego_buffer):
         
         if cover_img is None or stego_img is None:
             raise ValueError("Failed to decode image from buffer")
-            
+
+        # cv2 decodes to BGR; the array metrics expect RGB
+        return calculate_metrics_arrays(cover_img[:, :, ::-1], stego_img[:, :, ::-1], region, luma_ssim)
+
+    except Exception as e:
+        logging.error(f"Metrics calculation failed: {e}")
+        return {
+            'psnr': 0.0,
+            'ssim': 0.0,
+            'ber': 0.0
+        }
+
+def _clip_region(region, shape):
+    top, bottom, left, right = region
+    height, width = shape[:2]
+    top, bottom = max(0, min(top, height)), max(0, min(bottom, height))
+    left, right = max(0, min(left, width)), max(0, min(right, width))
+    return top, max(top, bottom), left, max(left, right)
+
+def _luma(img):
+    weights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return img.astype(np.float32) @ weights / 255.0
+
+def _to_float(img, luma_ssim):
+    return _luma(img) if luma_ssim else img.astype(np.float32) / 255.0
+
+def context_box(region, shape):
+    """
+    The (top, bottom, left, right) part of the cover that calculate_metrics_arrays
+    reads for `region`: the region plus an SSIM window of margin. Everything
+    outside it may be dropped and passed as `cover_origin`.
+    """
+    height, width = shape[:2]
+    if region is None or min(height, width) < SSIM_WIN_SIZE:
+        return 0, height, 0, width
+    top, bottom, left, right = _clip_region(region, shape)
+    margin = SSIM_WIN_SIZE - 1
+    return _clip_region((top - margin, bottom + margin, left - margin, right + margin), shape)
+
+def _region_ssim(cover_img, stego_img, region, luma_ssim, cover_origin=(0, 0)):
+    """
+    Mean SSIM of the whole image computed from the modified region only.
+
+    Outside `region` grown by half a window the two images share every
+    window, so their SSIM map is exactly 1 there. Only the grown region is
+    evaluated (on a crop with a further half-window of context, so each
+    window there sees the same pixels as in the full image) and the rest
+    contributes its pixel count. skimage drops a half-window border from
+    the mean; the same border is excluded here.
+    """
+    pad = (SSIM_WIN_SIZE - 1) // 2
+    height, width = stego_img.shape[:2]
+    top, bottom, left, right = region
+    rows = max(top - pad, pad), min(bottom + pad, height - pad)
+    cols = max(left - pad, pad), min(right + pad, width - pad)
+    valid = (height - 2 * pad) * (width - 2 * pad)
+    if rows[0] >= rows[1] or cols[0] >= cols[1]:
+        return 1.0
+
+    crop = np.s_[rows[0] - pad:rows[1] + pad, cols[0] - pad:cols[1] + pad]
+    y0, x0 = cover_origin
+    cover_crop = cover_img[rows[0] - pad - y0:rows[1] + pad - y0, cols[0] - pad - x0:cols[1] + pad - x0]
+    # Only the crop is converted to float, never the whole image
+    _, ssim_map = ssim(_to_float(cover_crop, luma_ssim), _to_float(stego_img[crop], luma_ssim), data_range=1.0,
+                       channel_axis=None if luma_ssim else 2, win_size=SSIM_WIN_SIZE, full=True)
+    inner = ssim_map[pad:-pad, pad:-pad]
+    channels = 1 if luma_ssim else inner.shape[2]
+    changed = (rows[1] - rows[0]) * (cols[1] - cols[0])
+    return (inner.sum(dtype=np.float64) / channels + (valid - changed)) / valid
+
+def calculate_metrics_arrays(cover_img, stego_img, region=None, luma_ssim=False, cover_origin=None):
+    """
+    Calculate image quality metrics between two decoded uint8 image arrays.
+
+    Args:
+        cover_img: (H, W, 3) uint8 array of the cover image (RGB)
+        stego_img: (H, W, 3) uint8 array of the stego image (RGB)
+        region: optional (top, bottom, left, right) half-open box outside
+            which the two images are known to be identical. Only that box
+            (plus the SSIM window margin) is evaluated; results match the
+            full-image computation.
+        luma_ssim: compute SSIM on the luma channel only (about 3x faster)
+        cover_origin: (row, col) of `cover_img` within the full image when
+            only the context_box(region) crop of the cover is passed; the
+            rest of the cover is then taken to equal the stego image
+
+    Returns:
+        Dictionary with PSNR, SSIM, and BER metrics
+    """
+    try:
         # Ensure same dimensions for comparison
-        if cover_img.shape != stego_img.shape:
+        if cover_origin is None and cover_img.shape != stego_img.shape:
             logging.warning(f"Cover ({cover_img.shape}) and stego ({stego_img.shape}) dimensions differ. Resizing stego for comparison.")
             stego_img = cv2.resize(stego_img, (cover_img.shape[1], cover_img.shape[0]))
+            region = None
             
-        # Convert to float for calculations
-        cover_float = cover_img.astype(np.float32) / 255.0
-        stego_float = stego_img.astype(np.float32) / 255.0
+        height, width = stego_img.shape[:2]
+        if region is None or min(height, width) < SSIM_WIN_SIZE:
+            region = (0, height, 0, width)
+        region = _clip_region(region, stego_img.shape)
+        top, bottom, left, right = region
+        total_values = stego_img.size
+        y0, x0 = cover_origin or (0, 0)
+        cover_region = cover_img[top - y0:bottom - y0, left - x0:right - x0]
         
-        # Calculate PSNR
+        # Calculate PSNR (the untouched remainder adds nothing to the error sum)
         try:
-            psnr_value = psnr(cover_float, stego_float, data_range=1.0)
+            diff = (cover_region.astype(np.float32) - stego_img[top:bottom, left:right]) / 255.0
+            mse = np.sum(diff * diff, dtype=np.float64) / total_values
+            psnr_value = 10 * np.log10(1.0 / mse) if mse > 0 else np.inf
             if np.isinf(psnr_value):
                 psnr_value = 100.0  # Cap infinite PSNR
         except Exception as e:
@@ -50,24 +154,20 @@ def calculate_metrics_in_memory(cover_buffer, stego_buffer):
             
         # Calculate SSIM
         try:
-            ssim_value = ssim(cover_float, stego_float, data_range=1.0, channel_axis=2, win_size=7)
+            if region == (0, height, 0, width):
+                ssim_value = ssim(_to_float(cover_img, luma_ssim), _to_float(stego_img, luma_ssim), data_range=1.0,
+                                  channel_axis=None if luma_ssim else 2, win_size=SSIM_WIN_SIZE)
+            else:
+                ssim_value = _region_ssim(cover_img, stego_img, region, luma_ssim, (y0, x0))
         except Exception as e:
             logging.error(f"SSIM calculation failed: {e}")
             ssim_value = 0.0
             
         # Calculate BER (Bit Error Rate)
         try:
-            # Flatten arrays and convert to binary
-            cover_bits = np.unpackbits(cover_img.flatten().astype(np.uint8))
-            stego_bits = np.unpackbits(stego_img.flatten().astype(np.uint8))
-            
-            # Ensure same length
-            min_len = min(len(cover_bits), len(stego_bits))
-            cover_bits = cover_bits[:min_len]
-            stego_bits = stego_bits[:min_len]
-            
-            # Calculate BER
-            ber_value = np.sum(cover_bits != stego_bits) / min_len
+            # Differing bits inside the region over all bits of the image
+            flipped = np.bitwise_xor(cover_region, stego_img[top:bottom, left:right])
+            ber_value = np.count_nonzero(np.unpackbits(flipped)) / (total_values * 8)
         except Exception as e:
             logging.error(f"BER calculation failed: {e}")
             ber_value = 0.0
@@ -0,0 +1,235 @@
+import os
+import logging
+import multiprocessing
+from contextlib import ExitStack
+import numpy as np
+from PIL import Image, PngImagePlugin
+from schemes import get_array_capacity, get_embedder, get_extractor, get_codeword
+from bitstream import text_to_bytes
+
+METADATA_TAG_KEY = "ProcessingInfo"
+FRAME_COUNT_KEY = "FrameCount"
+FRAME_PAYLOAD_KEY = "FramePayload"
+TIFF_DESCRIPTION_TAG = 270
+TIFF_MAGIC = (b'II*\x00', b'MM\x00*')
+
+# Callers with a pool of their own (main.py's offload pool) pass it in.
+# Otherwise frames are embedded/extracted on a process pool of
+# STEGOSUITE_FRAME_WORKERS processes, or in turn if that is 0 (the default).
+FRAME_WORKERS = int(os.environ.get("STEGOSUITE_FRAME_WORKERS", 0))
+_frame_pool = None
+
+def is_multiframe(input_buffer):
+    """True for animated GIF/APNG and multi-page TIFF inputs. Leaves the buffer rewound."""
+    input_buffer.seek(0)
+    try:
+        img = Image.open(input_buffer)
+        return getattr(img, 'n_frames', 1) > 1
+    except Exception:
+        return False
+    finally:
+        input_buffer.seek(0)
+
+def container_metadata(img):
+    """Stego metadata from PNG text chunks or, for TIFF, the ImageDescription tag."""
+    metadata = {key: img.info[key] for key in (METADATA_TAG_KEY, FRAME_COUNT_KEY, FRAME_PAYLOAD_KEY) if key in img.info}
+    if not metadata and img.format == 'TIFF':
+        description = img.tag_v2.get(TIFF_DESCRIPTION_TAG)
+        if isinstance(description, str):
+            for field in description.split(';'):
+                key, _, value = field.partition('=')
+                if key in (METADATA_TAG_KEY, FRAME_COUNT_KEY, FRAME_PAYLOAD_KEY):
+                    metadata[key] = value
+    return metadata
+
+def read_frames(input_buffer, scheme=None):
+    """
+    Decode every frame to RGB. Returns (format, frames, durations, loop).
+
+    APNG and GIF writers drop a frame identical to the one before it, so
+    such runs are merged here (durations added) to keep the frame list
+    aligned with what will be written. DCT frames are cropped to 8x8 blocks.
+    """
+    img = Image.open(input_buffer)
+    image_format = img.format
+    loop = img.info.get('loop', 0)
+    frames, durations = [], []
+    for index in range(getattr(img, 'n_frames', 1)):
+        img.seek(index)
+        pixels = np.array(img.convert('RGB'))
+        duration = img.info.get('duration', 0) or 0
+        if image_format != 'TIFF' and frames and np.array_equal(frames[-1], pixels):
+            durations[-1] += duration
+            continue
+        frames.append(pixels)
+        durations.append(duration)
+    if scheme == 'dct':
+        h, w = (frames[0].shape[0] // 8) * 8, (frames[0].shape[1] // 8) * 8
+        if h == 0 or w == 0:
+            raise ValueError("Image too small for DCT encoding")
+        frames = [np.ascontiguousarray(frame[:h, :w]) for frame in frames]
+    return image_format, frames, durations, loop
+
+def split_payload(secret_msg, capacities):
+    """
+    Split the message into one chunk per frame, each at most that frame's
+    capacity in UTF-8 bytes. Chunks are proportional to capacity so every
+    frame gets work; near full capacity this falls back to filling frames
+    in order.
+    """
+    char_bytes = np.array([len(text_to_bytes(c)) for c in secret_msg], dtype=np.int64)
+    total = int(char_bytes.sum())
+    capacities = np.asarray(capacities, dtype=np.int64)
+    if total > capacities.sum():
+        raise ValueError(f"Message too large for this image. Max: {int(capacities.sum())} bytes across {len(capacities)} frames.")
+    ends = np.cumsum(char_bytes)
+
+    bounds = np.cumsum(capacities) * total / max(int(capacities.sum()), 1)
+    cuts = np.searchsorted(ends, bounds, side='right')
+    cuts[-1] = len(secret_msg)
+    starts = np.concatenate([[0], cuts[:-1]])
+    chunks = [secret_msg[a:b] for a, b in zip(starts, cuts)]
+    if all(len(text_to_bytes(c)) <= cap for c, cap in zip(chunks, capacities)):
+        return chunks
+
+    chunks, start = [], 0
+    for cap in capacities:
+        used = int(ends[start - 1]) if start else 0
+        end = int(np.searchsorted(ends, used + cap, side='right'))
+        chunks.append(secret_msg[start:end])
+        start = end
+    if start < len(secret_msg):
+        raise ValueError("Message does not split into the frames' capacities")
+    return chunks
+
+def _pool(pool):
+    # Only the top-level process fans out; job, batch and offload workers
+    # already run in parallel with each other and embed their frames in turn.
+    global _frame_pool
+    if pool is not None or FRAME_WORKERS <= 0 or multiprocessing.parent_process() is not None:
+        return pool
+    if _frame_pool is None:
+        from shm_transport import OffloadPool
+        _frame_pool = OffloadPool(FRAME_WORKERS)
+    return _frame_pool
+
+def _embed_frames(scheme, frames, chunks, progress, pool):
+    jobs = [(index, chunk) for index, chunk in enumerate(chunks) if chunk]
+    pool = _pool(pool) if len(jobs) > 1 else None
+    if pool is None:
+        embed = get_embedder(scheme)
+        for done, (index, chunk) in enumerate(jobs):
+            if progress is not None:
+                progress(done / len(jobs))
+            embed(frames[index], chunk)
+        return
+    from shm_transport import SharedArray
+    with ExitStack() as stack:
+        shareds = []
+        for index, _ in jobs:
+            shared = stack.enter_context(SharedArray(frames[index].shape))
+            shared.array[...] = frames[index]
+            shareds.append(shared)
+        pool.embed_many(scheme, shareds, [chunk for _, chunk in jobs], progress)
+        for (index, _), shared in zip(jobs, shareds):
+            frames[index][...] = shared.array
+
+def _extract_frames(scheme, frames, pool):
+    pool = _pool(pool) if len(frames) > 1 else None
+    if pool is None:
+        extract = get_extractor(scheme)
+        return [extract(frame) for frame in frames]
+    from shm_transport import SharedArray
+    with ExitStack() as stack:
+        shareds = []
+        for frame in frames:
+            shared = stack.enter_context(SharedArray(frame.shape))
+            shared.array[...] = frame
+            shareds.append(shared)
+        return pool.extract_many(scheme, shareds)
+
+def capacity_frames(scheme, input_buffer):
+    _, frames, _, _ = read_frames(input_buffer, scheme)
+    capacity = get_array_capacity(scheme)
+    return sum(capacity(frame) for frame in frames)
+
+def encode_frames(scheme, input_buffer, secret_msg, output_buffer, progress=None, pool=None):
+    """
+    Embed across all frames of a multi-frame container. GIF and APNG are
+    written as APNG (GIF's palette would destroy the payload), multi-page
+    TIFF as TIFF. The frame count and per-frame character counts go into
+    the metadata next to the scheme codeword.
+    """
+    image_format, frames, durations, loop = read_frames(input_buffer, scheme)
+    capacity = get_array_capacity(scheme)
+    chunks = split_payload(secret_msg, [capacity(frame) for frame in frames])
+    logging.info(f"MultiFrame Encode: {scheme} over {len(frames)} frames, payload map {[len(c) for c in chunks]}")
+    _embed_frames(scheme, frames, chunks, progress, pool)
+
+    metadata = {
+        METADATA_TAG_KEY: get_codeword(scheme),
+        FRAME_COUNT_KEY: str(len(frames)),
+        FRAME_PAYLOAD_KEY: ','.join(str(len(chunk)) for chunk in chunks),
+    }
+    images = [Image.fromarray(frame) for frame in frames]
+    if image_format == 'TIFF':
+        description = ';'.join(f"{key}={value}" for key, value in metadata.items())
+        images[0].save(output_buffer, format='TIFF', save_all=True, append_images=images[1:],
+                       description=description, compression='tiff_deflate')
+    else:
+        pnginfo = PngImagePlugin.PngInfo()
+        for key, value in metadata.items():
+            pnginfo.add_text(key, value)
+        images[0].save(output_buffer, format='PNG', save_all=True, append_images=images[1:],
+                       duration=durations, loop=loop, pnginfo=pnginfo)
+    output_buffer.seek(0)
+    written = getattr(Image.open(output_buffer), 'n_frames', 1)
+    output_buffer.seek(0)
+    if written != len(frames):
+        raise RuntimeError(f"Container writer produced {written} frames instead of {len(frames)}")
+
+def decode_frames(scheme, input_buffer, pool=None):
+    """Extract every frame's chunk (in parallel) and reassemble the message."""
+    img = Image.open(input_buffer)
+    metadata = container_metadata(img)
+    input_buffer.seek(0)
+    _, frames, _, _ = read_frames(input_buffer)
+
+    payload_map = None
+    if FRAME_PAYLOAD_KEY in metadata:
+        try:
+            payload_map = [int(count) for count in metadata[FRAME_PAYLOAD_KEY].split(',')]
+        except ValueError:
+            logging.warning("MultiFrame Decode: unreadable payload map, scanning every frame")
+    if payload_map is not None and len(payload_map) != len(frames):
+        logging.warning(f"MultiFrame Decode: payload map lists {len(payload_map)} frames, image has {len(frames)}")
+        payload_map = None
+    indices = [i for i in range(len(frames)) if payload_map is None or payload_map[i] > 0]
+
+    results = _extract_frames(scheme, [frames[i] for i in indices], pool)
+    chunks = []
+    for index, result in zip(indices, results):
+        if result is None:
+            continue
+        if payload_map is not None and len(result) != payload_map[index]:
+            logging.warning(f"MultiFrame Decode: frame {index} gave {len(result)} characters, expected {payload_map[index]}")
+        chunks.append(result)
+    return ''.join(chunks)
+
+def calculate_metrics_frames(cover_buffer, stego_buffer, luma_ssim=False):
+    """Frame-averaged PSNR/SSIM/BER between a multi-frame cover and its stego container."""
+    from metrics import calculate_metrics_arrays
+    cover_buffer.seek(0)
+    stego_buffer.seek(0)
+    _, cover_frames, _, _ = read_frames(cover_buffer)
+    _, stego_frames, _, _ = read_frames(stego_buffer)
+    if len(cover_frames) != len(stego_frames):
+        raise ValueError(f"Cover has {len(cover_frames)} frames, stego image {len(stego_frames)}")
+    per_frame = []
+    for cover, stego in zip(cover_frames, stego_frames):
+        # DCT output is cropped to whole 8x8 blocks
+        cover = np.ascontiguousarray(cover[:stego.shape[0], :stego.shape[1]])
+        per_frame.append(calculate_metrics_arrays(cover, stego, luma_ssim=luma_ssim))
+    metrics = {key: float(np.mean([m[key] for m in per_frame])) for key in ('psnr', 'ssim', 'ber')}
+    metrics['frames'] = len(per_frame)
+    return metrics
@@ -0,0 +1,68 @@
+import zlib
+import struct
+import numpy as np
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+COLOR_TYPES = {1: 0, 3: 2, 4: 6}  # channels -> PNG colour type (L, RGB, RGBA)
+FILTER_TYPES = np.array([0, 1, 2, 4], dtype=np.uint8)  # None, Sub, Up, Paeth
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+def _filter_band(band, prev_row, bpp):
+    """
+    Filter a (rows, row_bytes) band, choosing per row the filter with the
+    smallest sum of absolute residuals (the libpng heuristic).
+    """
+    rows = band.shape[0]
+    x = band.astype(np.int16)
+    up = np.empty_like(x)
+    up[0] = prev_row
+    up[1:] = x[:-1]
+    left = np.zeros_like(x)
+    left[:, bpp:] = x[:, :-bpp]
+    upleft = np.zeros_like(x)
+    upleft[:, bpp:] = up[:, :-bpp]
+
+    p = left + up - upleft
+    pa, pb, pc = np.abs(p - left), np.abs(p - up), np.abs(p - upleft)
+    paeth_pred = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, upleft))
+
+    candidates = np.stack([x, x - left, x - up, x - paeth_pred]) & 0xFF
+    score = np.minimum(candidates, 256 - candidates).sum(axis=2, dtype=np.int64)
+    choice = score.argmin(axis=0)
+
+    out = np.empty((rows, band.shape[1] + 1), dtype=np.uint8)
+    out[:, 0] = FILTER_TYPES[choice]
+    out[:, 1:] = candidates[choice, np.arange(rows)]
+    return out
+
+def iter_png(pixels, text=None, band_rows=64, compress_level=6):
+    """
+    Yield a PNG for an (H, W[, C]) uint8 array piece by piece.
+
+    The signature, IHDR and tEXt chunks come first, then one or more IDAT
+    chunks per band of `band_rows` rows as the deflate stream produces
+    output. The compressed image is never held in memory as a whole.
+    `text` is a dict of tEXt keyword/value pairs.
+    """
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    height, width, channels = pixels.shape
+    if channels not in COLOR_TYPES or pixels.dtype != np.uint8:
+        raise ValueError("iter_png expects an 8-bit L, RGB or RGBA array")
+
+    header = PNG_SIGNATURE + _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, COLOR_TYPES[channels], 0, 0, 0))
+    for key, value in (text or {}).items():
+        header += _chunk(b'tEXt', key.encode('latin-1') + b'\x00' + value.encode('latin-1'))
+    yield header
+
+    compressor = zlib.compressobj(compress_level)
+    prev_row = np.zeros(width * channels, dtype=np.int16)
+    for y in range(0, height, band_rows):
+        band = pixels[y:y + band_rows].reshape(-1, width * channels)
+        data = compressor.compress(_filter_band(band, prev_row, channels).tobytes())
+        prev_row = band[-1].astype(np.int16)
+        if data:
+            yield _chunk(b'IDAT', data)
+    yield _chunk(b'IDAT', compressor.flush()) + _chunk(b'IEND', b'')
@@ -0,0 +1,71 @@
+import numpy as np
+
+# Wu-Tsai ranges at their full widths: a pair whose difference falls in a
+# range of width 2^k carries k bits (3, 3, 4, 5, 6, 7).
+RANGES = ((0, 7), (8, 15), (16, 31), (32, 63), (64, 127), (128, 255))
+RANGE_LOWER = np.zeros(256, dtype=np.int16)
+RANGE_UPPER = np.zeros(256, dtype=np.int16)
+RANGE_BITS = np.zeros(256, dtype=np.int64)
+for _lower, _upper in RANGES:
+    RANGE_LOWER[_lower:_upper + 1] = _lower
+    RANGE_UPPER[_lower:_upper + 1] = _upper
+    RANGE_BITS[_lower:_upper + 1] = (_upper - _lower + 1).bit_length() - 1
+MAX_PAIR_BITS = int(RANGE_BITS.max())
+BAND_ROWS = 256  # even, so bands split into whole 2x2 blocks
+
+def _checkerboard(block_rows, block_cols, block_row0):
+    rows = block_row0 + np.arange(block_rows)
+    return ((rows[:, None] + np.arange(block_cols)) % 2 == 0)[:, :, None]
+
+def split_pairs(band, block_row0):
+    """
+    Pair up the pixels of an (rows, cols, 3) band, rows and cols even. The
+    image is tiled into 2x2 blocks that alternate, like a checkerboard,
+    between two horizontal and two vertical pairs; every channel is used.
+    `block_row0` is the band's first block row, which keeps the pattern
+    aligned across bands. Returns (first, second) as flat int16 arrays in
+    block raster order, then pair, then channel.
+    """
+    rows, cols = band.shape[:2]
+    q = band.reshape(rows // 2, 2, cols // 2, 2, 3).astype(np.int16)
+    horizontal = _checkerboard(rows // 2, cols // 2, block_row0)
+    q00, q01, q10, q11 = q[:, 0, :, 0], q[:, 0, :, 1], q[:, 1, :, 0], q[:, 1, :, 1]
+    first = np.stack([q00, np.where(horizontal, q10, q01)], axis=2)
+    second = np.stack([np.where(horizontal, q01, q10), q11], axis=2)
+    return first.reshape(-1), second.reshape(-1)
+
+def merge_pairs(band, first, second, block_row0):
+    """Write pairs produced by split_pairs back into `band` in place."""
+    rows, cols = band.shape[:2]
+    shape = (rows // 2, cols // 2, 2, 3)
+    first, second = first.reshape(shape), second.reshape(shape)
+    horizontal = _checkerboard(rows // 2, cols // 2, block_row0)
+    q = band.reshape(rows // 2, 2, cols // 2, 2, 3)
+    q[:, 0, :, 0] = first[:, :, 0]
+    q[:, 1, :, 1] = second[:, :, 1]
+    q[:, 0, :, 1] = np.where(horizontal, second[:, :, 0], first[:, :, 1])
+    q[:, 1, :, 0] = np.where(horizontal, first[:, :, 1], second[:, :, 0])
+
+def pair_bits(first, second):
+    """
+    Bits each pair carries, 0 for pairs that are skipped. Embedding keeps
+    the pair's mean floor((p1 + p2) / 2) and its range, so a pair is usable
+    only if every difference in its range fits around that mean; the
+    decoder repeats the same test on the stego pair.
+    """
+    d = np.abs(second - first)
+    mean = (first + second) >> 1
+    upper = RANGE_UPPER[d]
+    usable = (mean - upper // 2 >= 0) & (mean + (upper + 1) // 2 <= 255)
+    return np.where(usable, RANGE_BITS[d], 0)
+
+def set_differences(first, second, values):
+    """
+    New (first, second) whose difference is the range's lower bound plus
+    `values`, keeping the sign and floor((p1 + p2) / 2) of each pair.
+    """
+    d = second - first
+    mean = (first + second) >> 1
+    new_d = np.where(d < 0, -1, 1) * (RANGE_LOWER[np.abs(d)] + values)
+    new_first = mean - np.floor_divide(new_d, 2)
+    return new_first, new_first + new_d
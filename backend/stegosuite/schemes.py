@@ -0,0 +1,80 @@
+import importlib
+
+SCHEMES = ('lsbm', 'erde', 'dct', 'pvd', 'mpvd', 'jpeg')
+
+# Schemes that embed into a decoded RGB pixel array (and so expose
+# *_embed_array / *_extract_array working in place on that array).
+PIXEL_SCHEMES = ('lsbm', 'erde', 'dct', 'pvd', 'mpvd')
+
+# Schemes whose payload can be rewritten in place (*_update_in_memory),
+# changing only the samples whose bits differ from the old payload.
+UPDATE_SCHEMES = ('lsbm', 'erde', 'dct')
+
+OUTPUT_EXTENSIONS = {'jpeg': '.jpg'}
+
+def _load(package, scheme, suffix, allowed=SCHEMES):
+    if scheme not in allowed:
+        raise ValueError(f"Unknown scheme '{scheme}'. Choose from: {', '.join(allowed)}")
+    module = importlib.import_module(f"{package}.{scheme}")
+    return getattr(module, f"{scheme}_{suffix}")
+
+def get_encoder(scheme):
+    encode = _load('encoders', scheme, 'encode_in_memory')
+    if scheme != 'dct':
+        return encode
+    from encoders.dct import dct_prepare_cover
+
+    def encode_dct(input_buffer, secret_msg, output_buffer, progress=None):
+        return encode(dct_prepare_cover(input_buffer), secret_msg, output_buffer, progress)
+    return encode_dct
+
+def get_decoder(scheme):
+    if scheme == 'auto':
+        from decoders.auto_d import auto_decode_using_metadata_in_memory
+        return auto_decode_using_metadata_in_memory
+    return _load('decoders', scheme, 'decode_in_memory')
+
+def get_updater(scheme):
+    if scheme != 'auto':
+        return _load('encoders', scheme, 'update_in_memory', UPDATE_SCHEMES)
+
+    def update_auto(input_buffer, secret_msg, output_buffer, progress=None):
+        detected = scheme_from_metadata(input_buffer)
+        if detected is None:
+            raise ValueError("Image has no stego codeword to identify its scheme")
+        return get_updater(detected)(input_buffer, secret_msg, output_buffer, progress)
+    return update_auto
+
+def get_capacity(scheme):
+    return _load('encoders', scheme, 'capacity_in_memory')
+
+def get_array_capacity(scheme):
+    return _load('encoders', scheme, 'capacity_array', PIXEL_SCHEMES)
+
+def get_embedder(scheme):
+    return _load('encoders', scheme, 'embed_array', PIXEL_SCHEMES)
+
+def get_extractor(scheme):
+    return _load('decoders', scheme, 'extract_array', PIXEL_SCHEMES)
+
+def get_codeword(scheme):
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown scheme '{scheme}'. Choose from: {', '.join(SCHEMES)}")
+    return importlib.import_module(f"encoders.{scheme}").CODEWORD
+
+def scheme_from_metadata(input_buffer):
+    """Scheme named by the image's 'ProcessingInfo' codeword, or None."""
+    from PIL import Image
+    input_buffer.seek(0)
+    try:
+        codeword = Image.open(input_buffer).info.get('ProcessingInfo')
+    except Exception:
+        codeword = None
+    input_buffer.seek(0)
+    return next((scheme for scheme in SCHEMES if get_codeword(scheme) == codeword), None)
+
+def output_extension(scheme, data=None):
+    """File extension for encoder output; pass the bytes to recognise multi-page TIFF output."""
+    if data is not None and bytes(data[:4]) in (b'II*\x00', b'MM\x00*'):
+        return '.tif'
+    return OUTPUT_EXTENSIONS.get(scheme, '.png')
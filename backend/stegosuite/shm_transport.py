@@ -0,0 +1,172 @@
+import sys
+import logging
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from PIL import Image, PngImagePlugin
+from schemes import get_embedder, get_extractor, get_codeword
+from multiframe import is_multiframe, encode_frames, decode_frames
+
+METADATA_TAG_KEY = "ProcessingInfo"
+
+# Workers only borrow segments; the creating process owns and unlinks them.
+_ATTACH_KWARGS = {'track': False} if sys.version_info >= (3, 13) else {}
+
+class SharedArray:
+    """
+    NumPy array backed by a shared memory segment owned by the creating
+    process. Only `descriptor` (name, shape, dtype) crosses the process
+    boundary. The segment is unlinked on close(), which the context manager
+    guarantees even when a worker died mid-task.
+    """
+
+    def __init__(self, shape, dtype=np.uint8):
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf)
+        self.descriptor = (self._shm.name, tuple(shape), dtype.str)
+
+    @classmethod
+    def from_image(cls, input_buffer, mode='RGB'):
+        with Image.open(input_buffer) as img:
+            if img.mode != mode:
+                img = img.convert(mode)
+            shared = cls((img.height, img.width, len(mode)))
+            try:
+                shared.array[...] = np.asarray(img)
+            except Exception:
+                shared.close()
+                raise
+        return shared
+
+    def close(self):
+        if self._shm is None:
+            return
+        self.array = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def attach(descriptor):
+    """Map an existing segment in a worker. Returns (shm, array); close shm when done."""
+    name, shape, dtype = descriptor
+    shm = shared_memory.SharedMemory(name=name, **_ATTACH_KWARGS)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+def _run_attached(func, descriptor, *args):
+    shm, array = attach(descriptor)
+    error = None
+    try:
+        result = func(array, *args)
+    except Exception as e:
+        # Keep only the message: the traceback would pin views of the segment
+        # and make shm.close() fail.
+        is_value_error = isinstance(e, ValueError)
+        result, error = None, (is_value_error, str(e) if is_value_error else f"{type(e).__name__}: {e}")
+    del array
+    shm.close()
+    if error is not None:
+        is_value_error, message = error
+        raise (ValueError if is_value_error else RuntimeError)(message)
+    return result
+
+def _embed_worker(scheme, descriptor, secret_msg):
+    return _run_attached(get_embedder(scheme), descriptor, secret_msg)
+
+def _extract_worker(scheme, descriptor):
+    return _run_attached(get_extractor(scheme), descriptor)
+
+class OffloadPool:
+    """
+    Process pool for CPU-bound embedding. Pixel arrays travel through shared
+    memory in both directions, so only descriptors and the message are
+    pickled. A crashed worker surfaces as RuntimeError and the pool is
+    recreated on the next call.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _submit(self, fn, *args):
+        return self._submit_many(fn, [args])[0]
+
+    def _submit_many(self, fn, arg_lists, progress=None):
+        """Run fn(*args) for every entry concurrently; results come back in order."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            executor = self._executor
+        futures = []
+        try:
+            futures = [executor.submit(fn, *args) for args in arg_lists]
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                if progress is not None:
+                    progress(done / len(futures))
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            logging.error("OffloadPool: worker process died, pool will be recreated")
+            raise RuntimeError("Worker process crashed while processing the image") from None
+        finally:
+            # On failure, drop queued work; running tasks finish before their
+            # segments are released by the caller's context managers.
+            for future in futures:
+                future.cancel()
+            wait(futures)
+
+    def embed(self, scheme, shared, secret_msg):
+        """Embed into `shared.array` in place on a worker."""
+        return self._submit(_embed_worker, scheme, shared.descriptor, secret_msg)
+
+    def extract(self, scheme, shared):
+        return self._submit(_extract_worker, scheme, shared.descriptor)
+
+    def embed_many(self, scheme, shareds, secret_msgs, progress=None):
+        """Embed one message per shared array, all in parallel. Returns the regions."""
+        return self._submit_many(_embed_worker, [(scheme, shared.descriptor, msg) for shared, msg in zip(shareds, secret_msgs)], progress)
+
+    def extract_many(self, scheme, shareds):
+        return self._submit_many(_extract_worker, [(scheme, shared.descriptor) for shared in shareds])
+
+    def encode_in_memory(self, scheme, input_buffer, secret_msg, output_buffer):
+        if is_multiframe(input_buffer):
+            return encode_frames(scheme, input_buffer, secret_msg, output_buffer, pool=self)
+        if scheme == 'dct':
+            from encoders.dct import dct_prepare_cover
+            input_buffer = dct_prepare_cover(input_buffer)
+        with SharedArray.from_image(input_buffer) as shared:
+            region = self.embed(scheme, shared, secret_msg)
+            metadata = PngImagePlugin.PngInfo()
+            metadata.add_text(METADATA_TAG_KEY, get_codeword(scheme))
+            stego_image = Image.fromarray(shared.array)
+            stego_image.save(output_buffer, format='PNG', pnginfo=metadata)
+            del stego_image  # shares the segment's memory
+        output_buffer.seek(0)
+        return region
+
+    def decode_in_memory(self, scheme, input_buffer):
+        if is_multiframe(input_buffer):
+            return decode_frames(scheme, input_buffer, pool=self)
+        with SharedArray.from_image(input_buffer) as shared:
+            return self.extract(scheme, shared)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
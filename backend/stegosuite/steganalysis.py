@@ -0,0 +1,289 @@
+import io
+import logging
+import numpy as np
+from PIL import Image
+from scipy.special import gammaincc
+from jpeg_coeffs import JpegCoefficients
+from pvd_pairs import split_pairs
+
+# Sequential chi-square: the statistic is evaluated on growing prefixes of the
+# sample stream (every scheme here embeds from the start of the image).
+CHI_SEGMENTS = 16
+CHI_MIN_EXPECTED = 5  # bins sparser than this make the chi-square approximation unreliable
+LEADING_MIN_ROWS = 16
+# RS analysis: groups of four neighbouring pixels, flipping the middle two.
+RS_MASK = np.array([False, True, True, False])
+# DCT grid check for the pixel-domain DCT scheme (quantiser step 50).
+DCT_STEP = 50
+DCT_GRID_TOLERANCE = 3
+DCT_EMBED_COEFFS = ((3, 3), (2, 3), (3, 2))
+DCT_CONTROL_COEFFS = ((4, 4), (2, 4), (4, 2))
+DCT_MIN_SAMPLES = 20
+# Pixel-difference histogram tests for the PVD schemes. Both rewrite a pair's
+# difference uniformly within a range: PVD (3 bits a pair) moves every
+# difference of 16..31 into 16..23, leaving 24..31 empty; multi-channel PVD
+# flattens 0..7 and 8..15 into steps. Scores from natural covers stay below
+# *_CLEAN; *_ALARM and above score as certain detection.
+PVD_MIN_PAIRS = 200  # pairs with a difference in 8..31 needed for a score
+PVD_GAP_CLEAN, PVD_GAP_ALARM = 0.5, 2.0
+MPVD_STEP_CLEAN, MPVD_STEP_ALARM = 0.2, 0.8
+# LSB-M (+/-1 matching) and ERDE (blue LSBs of a few edge pixels) have no
+# detector here that separates stego from natural covers without training;
+# their risk is reported as None rather than a misleading number. RS, SPA and
+# chi-square only see LSB replacement and are reported as raw outputs.
+UNSCORED_SCHEMES = ('lsbm', 'erde')
+
+def _dct_basis():
+    k = np.arange(8)
+    basis = np.cos((2 * k[None, :] + 1) * k[:, None] * np.pi / 16) * np.sqrt(2 / 8)
+    basis[0] /= np.sqrt(2)
+    return basis
+
+DCT_BASIS = _dct_basis()  # orthonormal DCT-II, matches cv2.dct
+
+def _chi_square_sequential(values, bins, start=0):
+    """
+    Westfeld-Pfitzmann pairs-of-values test on growing prefixes of `values`
+    (non-negative ints below `bins`). Pairs are (start, start+1), (start+2, ...).
+    Returns the embedding probability for each of CHI_SEGMENTS prefixes.
+    """
+    n = len(values)
+    if n == 0:
+        return np.zeros(CHI_SEGMENTS)
+    segment = np.arange(n, dtype=np.int64) * CHI_SEGMENTS // n
+    hist = np.bincount(segment * bins + values, minlength=CHI_SEGMENTS * bins)
+    hist = hist.reshape(CHI_SEGMENTS, bins).cumsum(axis=0)[:, start:]
+    pairs = hist[:, :hist.shape[1] // 2 * 2].reshape(CHI_SEGMENTS, -1, 2)
+    expected = pairs.sum(axis=2) / 2.0
+    used = expected >= CHI_MIN_EXPECTED
+    safe = np.where(used, expected, 1.0)
+    chi = np.where(used, (pairs[:, :, 0] - expected) ** 2 / safe, 0.0).sum(axis=1)
+    dof = used.sum(axis=1) - 1
+    probability = np.where(dof > 0, gammaincc(np.maximum(dof, 1) / 2.0, chi / 2.0), 0.0)
+    return probability
+
+def _chi_square_summary(probability):
+    # Fraction of the stream, from the start, over which embedding is likely.
+    leading = np.argmax(probability <= 0.5) if np.any(probability <= 0.5) else len(probability)
+    return {
+        'probability': float(probability[0]),
+        'embedded_fraction': leading / len(probability),
+    }
+
+def chi_square_lsb(channel):
+    """Sequential chi-square attack on the LSBs of a uint8 array, in raster order."""
+    return _chi_square_summary(_chi_square_sequential(channel.reshape(-1).astype(np.int64), 256))
+
+def _rs_counts(channel):
+    height, width = channel.shape
+    groups = channel[:, :width // 4 * 4].astype(np.int16).reshape(height, -1, 4)
+    if groups.size == 0:
+        return np.zeros(4)
+    base = np.abs(np.diff(groups, axis=-1)).sum(axis=-1)
+    flipped = groups.copy()
+    flipped[..., RS_MASK] ^= 1
+    shifted = groups.copy()
+    shifted[..., RS_MASK] = ((shifted[..., RS_MASK] + 1) ^ 1) - 1
+    pos = np.abs(np.diff(flipped, axis=-1)).sum(axis=-1)
+    neg = np.abs(np.diff(shifted, axis=-1)).sum(axis=-1)
+    total = base.size
+    return np.array([
+        np.count_nonzero(pos > base), np.count_nonzero(pos < base),
+        np.count_nonzero(neg > base), np.count_nonzero(neg < base),
+    ]) / total
+
+def rs_analysis(channel):
+    """
+    Fridrich's RS steganalysis. Returns the estimated fraction of pixels
+    carrying an LSB-replacement payload (0 for a clean cover).
+    """
+    r_m, s_m, r_n, s_n = _rs_counts(channel)
+    r_m1, s_m1, r_n1, s_n1 = _rs_counts(channel ^ 1)
+    d0, d1 = r_m - s_m, r_m1 - s_m1
+    dn0, dn1 = r_n - s_n, r_n1 - s_n1
+    a = 2 * (d1 + d0)
+    b = dn0 - dn1 - d1 - 3 * d0
+    c = d0 - dn0
+    if abs(a) < 1e-12:
+        if abs(b) < 1e-12:
+            return 0.0
+        z = -c / b
+    else:
+        root = np.sqrt(max(b * b - 4 * a * c, 0.0))
+        z = min((-b + root) / (2 * a), (-b - root) / (2 * a), key=abs)
+    if abs(z - 0.5) < 1e-12:
+        return 1.0
+    return float(np.clip(z / (z - 0.5), 0.0, 1.0))
+
+def sample_pair_analysis(channel):
+    """
+    Sample pair analysis (Dumitrescu, Wu and Wang) over horizontal and
+    vertical neighbours. Returns the estimated LSB-replacement rate.
+
+    With q = p/2 of the LSBs flipped and s = 1 - 2q, pairs one apart that
+    stay inside a 2k/2k+1 bucket (Y1) and that straddle two buckets (X1)
+    are equally common in natural images, which gives
+        -(C0 - C1/2) s^2 + (X1 - Y3) s + X1 + Y3 - 2 Y1 + C0 - C1/2 = 0
+    where C0/C1 count pairs whose upper seven bits differ by 0/1 and Y3
+    counts pairs three apart within C1.
+    """
+    wide = channel.astype(np.int16)
+    u = np.concatenate([wide[:, :-1].reshape(-1), wide[:-1, :].reshape(-1)])
+    v = np.concatenate([wide[:, 1:].reshape(-1), wide[1:, :].reshape(-1)])
+    diff = np.abs(u - v)
+    high = np.abs((u >> 1) - (v >> 1))
+    c0 = np.count_nonzero(high == 0)
+    c1 = np.count_nonzero(high == 1)
+    x1 = np.count_nonzero((diff == 1) & (high == 1))
+    y1 = np.count_nonzero((diff == 1) & (high == 0))
+    y3 = np.count_nonzero((diff == 3) & (high == 1))
+    a = -(c0 - c1 / 2)
+    b = x1 - y3
+    c = x1 + y3 - 2 * y1 + c0 - c1 / 2
+    if abs(a) < 1e-12:
+        return 0.0
+    root = np.sqrt(max(b * b - 4 * a * c, 0.0))
+    rates = [1 - (-b + root) / (2 * a), 1 - (-b - root) / (2 * a)]
+    return float(np.clip(min(rates, key=abs), 0.0, 1.0))
+
+def dct_grid_check(rgb):
+    """
+    Detect coefficients forced onto the DCT scheme's quantisation grid.
+    Compares how often the embedding coefficients of each 8x8 luma block
+    sit on a multiple of DCT_STEP with the same rate at control positions.
+    """
+    luma = np.asarray(Image.fromarray(rgb, 'RGB').convert('YCbCr'))[:, :, 0]
+    h, w = (luma.shape[0] // 8) * 8, (luma.shape[1] // 8) * 8
+    blocks = luma[:h, :w].astype(np.float64).reshape(h // 8, 8, w // 8, 8) - 128.0
+
+    def on_grid_share(positions):
+        coeffs = np.concatenate([
+            np.einsum('ajbk,j,k->ab', blocks, DCT_BASIS[i], DCT_BASIS[j]).reshape(-1) for i, j in positions
+        ])
+        large = coeffs[np.abs(coeffs) >= DCT_STEP / 2]
+        if len(large) < DCT_MIN_SAMPLES:
+            return None, len(large)
+        offset = np.abs(large - DCT_STEP * np.round(large / DCT_STEP))
+        return float(np.mean(offset <= DCT_GRID_TOLERANCE)), len(large)
+
+    embed_share, samples = on_grid_share(DCT_EMBED_COEFFS)
+    control_share, _ = on_grid_share(DCT_CONTROL_COEFFS)
+    if embed_share is None:
+        return {'score': 0.0, 'on_grid': None, 'baseline': control_share, 'samples': samples}
+    if control_share is None:
+        control_share = (2 * DCT_GRID_TOLERANCE + 1) / DCT_STEP
+    score = (embed_share - control_share) / max(1.0 - control_share, 1e-9)
+    return {
+        'score': float(np.clip(score, 0.0, 1.0)),
+        'on_grid': embed_share,
+        'baseline': control_share,
+        'samples': samples,
+    }
+
+def jpeg_chi_square(data):
+    """Sequential chi-square over AC magnitude pairs (2,3), (4,5), ... of a baseline JPEG."""
+    jpeg = JpegCoefficients(data)
+    magnitudes = np.abs(jpeg.decode()[:, 1:]).reshape(-1)
+    magnitudes = np.minimum(magnitudes[magnitudes >= 2], 2047).astype(np.int64)
+    return _chi_square_summary(_chi_square_sequential(magnitudes, 2048, start=2))
+
+def _difference_histogram(first, second):
+    return np.bincount(np.abs(second - first).reshape(-1), minlength=256)[:32].astype(np.float64)
+
+def _enough_pairs(hist):
+    return hist[8:32].sum() >= PVD_MIN_PAIRS
+
+def pvd_gap_statistic(blue):
+    """
+    How much faster the blue-pair difference histogram falls from 16..23 to
+    24..31 than from 8..15 to 16..23 (log units). Near 0 for natural
+    covers, whose difference histogram decays smoothly; None with too few pairs.
+    """
+    wide = blue[:, :blue.shape[1] // 2 * 2].astype(np.int16)
+    hist = _difference_histogram(wide[:, 0::2], wide[:, 1::2])
+    if not _enough_pairs(hist):
+        return None
+    m8, m16, m24 = hist[8:16].sum() + 1, hist[16:24].sum() + 1, hist[24:32].sum() + 1
+    return float(np.log(m16 / m24) - np.log(m8 / m16))
+
+def mpvd_step_statistic(rgb):
+    """
+    Excess drop of the log difference histogram at the range boundaries 8
+    and 16 over the mean slope on either side, for multi-channel PVD pairs.
+    Near 0 for natural covers; None with too few pairs.
+    """
+    height, width = rgb.shape[0] // 2 * 2, rgb.shape[1] // 2 * 2
+    if height == 0 or width == 0:
+        return None
+    hist = _difference_histogram(*split_pairs(rgb[:height, :width], 0))
+    if not _enough_pairs(hist):
+        return None
+    log_hist = np.log(hist + 1)
+    steps = [(log_hist[b - 1] - log_hist[b]) - ((log_hist[b - 8] - log_hist[b - 1]) + (log_hist[b] - log_hist[b + 7])) / 14
+             for b in (8, 16)]
+    return float(np.mean(steps))
+
+def _risk(values, clean, alarm):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return float(np.clip((max(values) - clean) / (alarm - clean), 0.0, 1.0))
+
+def analyze_pixels(rgb):
+    """Run the pixel-domain detectors on an (H, W, 3) uint8 RGB array."""
+    # Every scheme fills the image from the top, so the leading band is
+    # also measured on its own: a short payload is invisible in the
+    # whole-image rate but dense there.
+    leading_rows = max(LEADING_MIN_ROWS, rgb.shape[0] // CHI_SEGMENTS)
+    channels = {}
+    for index, name in enumerate(('red', 'green', 'blue')):
+        channel = np.ascontiguousarray(rgb[:, :, index])
+        channels[name] = {
+            'chi_square': chi_square_lsb(channel),
+            'rs': rs_analysis(channel),
+            'spa': sample_pair_analysis(channel),
+            'rs_leading': rs_analysis(channel[:leading_rows]),
+            'spa_leading': sample_pair_analysis(channel[:leading_rows]),
+        }
+    # LSB-M walks all channels in raster order, so test the interleaved stream too
+    interleaved = chi_square_lsb(rgb)
+    dct = dct_grid_check(rgb)
+    leading_rows += leading_rows % 2  # whole 2x2 blocks for the multi-channel PVD pairs
+    pvd = {
+        'gap': pvd_gap_statistic(rgb[:, :, 2]),
+        'gap_leading': pvd_gap_statistic(rgb[:leading_rows, :, 2]),
+    }
+    mpvd = {
+        'step': mpvd_step_statistic(rgb),
+        'step_leading': mpvd_step_statistic(rgb[:leading_rows]),
+    }
+    risk = {scheme: None for scheme in UNSCORED_SCHEMES}
+    risk['pvd'] = _risk(pvd.values(), PVD_GAP_CLEAN, PVD_GAP_ALARM)
+    risk['mpvd'] = _risk(mpvd.values(), MPVD_STEP_CLEAN, MPVD_STEP_ALARM)
+    risk['dct'] = dct['score']
+    return {
+        'detectors': {'channels': channels, 'chi_square_interleaved': interleaved, 'dct_grid': dct,
+                      'pvd_histogram': pvd, 'mpvd_histogram': mpvd},
+        'risk': risk,
+    }
+
+def analyze_in_memory(input_buffer):
+    """
+    Steganalysis report for one image: raw detector outputs plus a 0..1
+    detection risk per scheme, None for UNSCORED_SCHEMES or too little data.
+    JPEG inputs are also checked in the coefficient domain.
+    """
+    data = input_buffer.read()
+    with Image.open(io.BytesIO(data)) as img:
+        image_format = img.format
+        rgb = np.array(img.convert('RGB'))
+    report = analyze_pixels(rgb)
+    report['format'] = image_format
+    if image_format == 'JPEG':
+        try:
+            jpeg = jpeg_chi_square(data)
+            report['detectors']['jpeg_chi_square'] = jpeg
+            report['risk']['jpeg'] = jpeg['probability']
+        except ValueError as e:
+            logging.info(f"Steganalysis: coefficient check skipped ({e})")
+    return report
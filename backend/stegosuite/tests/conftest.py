@@ -0,0 +1,38 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# The backend imports its modules flat (`from schemes import ...`), as main.py does.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def cover_array():
+    """
+    A 128x160 RGB image with a checkerboard in green, so ERDE finds edges,
+    and mid-range gradients elsewhere, away from the 0/255 clipping bounds.
+    """
+    y, x = np.mgrid[0:128, 0:160]
+    return np.stack([x + 40, ((x // 16 + y // 16) % 2) * 120 + 60, (x + y) // 2 + 30], -1).astype(np.uint8)
+
+@pytest.fixture
+def cover_dir(tmp_path, cover_array):
+    covers = tmp_path / 'covers'
+    covers.mkdir()
+    Image.fromarray(cover_array).save(covers / 'a.png')
+    Image.fromarray(cover_array[::-1].copy()).save(covers / 'b.png')
+    return covers
+
+@pytest.fixture(scope='session')
+def main_module(tmp_path_factory):
+    """The Flask app module, with its job store in a temporary directory."""
+    os.environ['STEGOSUITE_JOBS_DIR'] = str(tmp_path_factory.mktemp('jobs'))
+    import main
+    yield main
+    main.job_runner.stop()
+
+@pytest.fixture
+def client(main_module):
+    return main_module.app.test_client()
@@ -0,0 +1,26 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from admission import MB, MemoryBudget, heap_in_use
+
+@pytest.mark.skipif(heap_in_use() is None, reason="needs glibc mallinfo2")
+def test_repeated_requests_record_their_own_growth():
+    budget = MemoryBudget(1024 * MB, sample_interval=0.001)
+    for _ in range(3):
+        reservation = budget.reserve(64 * MB)
+        array = np.ones(48 * MB, dtype=np.uint8)
+        time.sleep(0.05)  # let the sampler see it
+        del array
+        reservation.release()
+    # The allocator keeps freed arrays around after the first request; the
+    # later ones must still see their 48 MB.
+    assert [record['peak_mb'] >= 40 for record in budget.records] == [True, True, True]
+
+def test_allocator_is_left_alone_by_default(monkeypatch):
+    monkeypatch.delenv('STEGOSUITE_TRACE_MEMORY', raising=False)
+    monkeypatch.delenv('MALLOC_MMAP_THRESHOLD_', raising=False)
+    MemoryBudget.from_env()
+    assert 'MALLOC_MMAP_THRESHOLD_' not in os.environ
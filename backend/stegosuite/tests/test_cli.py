@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import cli
+from schemes import get_decoder
+
+def decoded_messages(directory):
+    messages = []
+    for path in sorted(directory.glob('*.png')):
+        with open(path, 'rb') as f:
+            messages.append(get_decoder('auto')(f))
+    return messages
+
+def manifest_records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+@pytest.mark.parametrize('scheme', ['lsbm', 'erde', 'dct'])
+def test_encode_rerun_with_new_message_is_not_skipped(tmp_path, cover_dir, scheme):
+    out, manifest = tmp_path / 'out', tmp_path / 'manifest.jsonl'
+    for message in ('token-1', 'token-2'):
+        assert cli.main(['encode', str(cover_dir), '--scheme', scheme, '--message', message,
+                         '--output-dir', str(out), '--manifest', str(manifest), '--workers', '1']) == 0
+    assert decoded_messages(out) == ['token-2', 'token-2']
+    assert len(manifest_records(manifest)) == 4
+
+def test_encode_rerun_with_same_options_resumes(tmp_path, cover_dir):
+    out, manifest = tmp_path / 'out', tmp_path / 'manifest.jsonl'
+    args = ['encode', str(cover_dir), '--message', 'token-1', '--output-dir', str(out),
+            '--manifest', str(manifest), '--workers', '1']
+    assert cli.main(args) == 0
+    assert cli.main(args) == 0
+    assert len(manifest_records(manifest)) == 2
+
+def test_encode_rerun_with_new_output_dir_is_not_skipped(tmp_path, cover_dir):
+    manifest = tmp_path / 'manifest.jsonl'
+    for out in (tmp_path / 'first', tmp_path / 'second'):
+        assert cli.main(['encode', str(cover_dir), '--message', 'token-1', '--output-dir', str(out),
+                         '--manifest', str(manifest), '--workers', '1']) == 0
+    assert decoded_messages(tmp_path / 'second') == ['token-1', 'token-1']
+
+@pytest.mark.parametrize('scheme', ['lsbm', 'erde', 'dct'])
+def test_update_rerun_with_new_message_is_not_skipped(tmp_path, cover_dir, scheme):
+    stego, out, manifest = tmp_path / 'stego', tmp_path / 'out', tmp_path / 'manifest.jsonl'
+    assert cli.main(['encode', str(cover_dir), '--scheme', scheme, '--message', 'token-1',
+                     '--output-dir', str(stego), '--manifest', str(manifest), '--workers', '1']) == 0
+    for message in ('token-2', 'token-3'):
+        assert cli.main(['update', str(stego), '--scheme', scheme, '--message', message,
+                         '--output-dir', str(out), '--manifest', str(manifest), '--workers', '1']) == 0
+        assert decoded_messages(out) == [message, message]
+    assert len(manifest_records(manifest)) == 6
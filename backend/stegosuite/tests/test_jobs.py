@@ -0,0 +1,69 @@
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from admission import MemoryBudget, MB
+from jobs import JobStore, JobRunner, _run_job
+from metrics import calculate_metrics_arrays
+
+def png_bytes(array):
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('scheme', ['lsbm', 'erde', 'dct', 'pvd', 'mpvd'])
+def test_cancelling_running_encode_job_records_cancelled(tmp_path, cover_array, scheme):
+    store = JobStore(str(tmp_path))
+    job_id = store.create('encode', scheme, png_bytes(cover_array), 'secret')
+    assert store.claim_next() == job_id
+    assert store.request_cancel(job_id) == 'running'
+
+    # The encoder's first progress report sees the flag and stops the job
+    _run_job(str(tmp_path), job_id)
+
+    job = store.get(job_id)
+    assert job['status'] == 'cancelled'
+    assert not job['error']
+
+def test_job_waits_in_queue_while_budget_is_full(tmp_path, cover_array):
+    budget = MemoryBudget(64 * MB)
+    runner = JobRunner(JobStore(str(tmp_path)), budget=budget)
+    job_id = runner.store.create('encode', 'lsbm', png_bytes(cover_array), 'secret')
+    held = budget.reserve(64 * MB - 1024)
+
+    assert runner.store.claim_next() == job_id
+    assert not runner._reserve(job_id)
+    assert runner.store.get(job_id)['status'] == 'queued'
+
+    held.release()
+    assert runner.store.claim_next() == job_id
+    assert runner._reserve(job_id)
+    assert budget.stats()['reserved_mb'] > 0
+    runner.stop()
+    assert budget.stats()['reserved_mb'] == 0
+
+def test_job_larger_than_budget_fails(tmp_path, cover_array):
+    runner = JobRunner(JobStore(str(tmp_path)), budget=MemoryBudget(MB // 4))
+    job_id = runner.store.create('encode', 'lsbm', png_bytes(cover_array), 'secret')
+
+    assert runner.store.claim_next() == job_id
+    assert not runner._reserve(job_id)
+    job = runner.store.get(job_id)
+    assert job['status'] == 'failed'
+    assert 'memory budget' in job['error']
+
+def test_dct_job_metrics_use_cropped_cover(tmp_path, cover_array):
+    cover = cover_array[:125, :157]
+    store = JobStore(str(tmp_path))
+    job_id = store.create('encode', 'dct', png_bytes(cover), 'secret')
+    assert store.claim_next() == job_id
+    _run_job(str(tmp_path), job_id)
+
+    job = store.get(job_id)
+    assert job['status'] == 'done'
+    stego = np.array(Image.open(job['result_path']))
+    expected = calculate_metrics_arrays(cover[:120, :152], stego, None)
+    assert json.loads(job['metrics']) == pytest.approx(expected, abs=1e-4)
@@ -0,0 +1,109 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+from skimage import data
+
+from decoders.jpeg import jpeg_decode_in_memory
+from encoders.jpeg import jpeg_encode_in_memory
+from jpeg_coeffs import ZIGZAG, JpegCoefficients
+
+# Odd-sized, so the last MCU row and column are padded
+PHOTO = data.astronaut()[40:157, 200:370]
+
+FORMATS = {
+    '4:4:4': {'subsampling': 0},
+    '4:2:0': {'subsampling': 2},
+    '4:2:2': {'subsampling': 1},
+    'grayscale': {},
+    'restart intervals': {'restart_marker_blocks': 2},
+    'optimized Huffman tables': {'optimize': True},
+}
+
+def cover_jpeg(name, photo=PHOTO, **options):
+    image = Image.fromarray(photo)
+    if name == 'grayscale':
+        image = image.convert('L')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85, **FORMATS.get(name, {}), **options)
+    return buffer.getvalue()
+
+def encode(cover, message):
+    stego = io.BytesIO()
+    region = jpeg_encode_in_memory(io.BytesIO(cover), message, stego)
+    return stego.getvalue(), region
+
+def assert_luma_matches_libjpeg(jpeg_bytes):
+    # Dequantize and inverse-DCT our coefficients; libjpeg's Y plane must agree
+    jpeg = JpegCoefficients(jpeg_bytes)
+    jpeg.decode()
+    image = Image.open(io.BytesIO(jpeg_bytes))
+    quant = np.array(image.quantization[0], dtype=np.float32)
+    if image.mode != 'L':
+        image.draft('YCbCr', image.size)
+    luma = np.array(image)
+    luma = luma if luma.ndim == 2 else luma[:, :, 0]
+    grid = jpeg.component_blocks(0)
+    natural = np.zeros(grid.shape, dtype=np.float32)
+    natural[:, :, ZIGZAG] = grid
+    for by in range(-(-jpeg.height // 8)):
+        for bx in range(-(-jpeg.width // 8)):
+            block = cv2.idct(natural[by, bx].reshape(8, 8) * quant.reshape(8, 8)) + 128
+            expected = luma[by * 8:by * 8 + 8, bx * 8:bx * 8 + 8]
+            block = np.clip(np.round(block), 0, 255)[:expected.shape[0], :expected.shape[1]]
+            assert np.abs(block - expected).max() <= 2, (by, bx)
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_decode_matches_libjpeg(name):
+    cover = cover_jpeg(name)
+    if name == 'restart intervals':
+        assert b'\xff\xdd' in cover
+    assert_luma_matches_libjpeg(cover)
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_round_trip(name):
+    cover = cover_jpeg(name)
+    message = 'café ✓ ' * 12
+    stego, region = encode(cover, message)
+    assert jpeg_decode_in_memory(io.BytesIO(stego)) == message
+    assert_luma_matches_libjpeg(stego)
+
+    # Only magnitude LSBs of |c| >= 2 AC coefficients changed
+    before, after = JpegCoefficients(cover).decode(), JpegCoefficients(stego).decode()
+    changed = before != after
+    assert changed.any() and not changed[:, 0].any()
+    assert (np.abs(before[changed]) >= 2).all()
+    assert (np.abs(before[changed]) ^ np.abs(after[changed]) == 1).all()
+    assert (np.sign(before[changed]) == np.sign(after[changed])).all()
+
+    # Pixels outside the reported region are untouched
+    top, bottom, left, right = region
+    cover_pixels = np.array(Image.open(io.BytesIO(cover)))
+    stego_pixels = np.array(Image.open(io.BytesIO(stego)))
+    assert bottom < cover_pixels.shape[0]
+    assert np.array_equal(cover_pixels[bottom:], stego_pixels[bottom:])
+
+def test_short_message_leaves_the_rest_of_the_scan_alone():
+    cover = cover_jpeg('4:2:0', data.astronaut())
+    jpeg = JpegCoefficients(cover)
+    jpeg.usable_coefficients(48)
+    assert len(jpeg.blocks) * 20 < jpeg.n_mcus * jpeg.blocks_per_mcu
+
+    stego, _ = encode(cover, 'hi')
+    assert stego.endswith(cover[len(cover) // 10:])
+    assert jpeg_decode_in_memory(io.BytesIO(stego)) == 'hi'
+
+def test_progressive_cover_is_transcoded_to_baseline():
+    cover = cover_jpeg('4:2:0', progressive=True)
+    with pytest.raises(ValueError):
+        JpegCoefficients(cover)
+    stego, region = encode(cover, 'progressive')
+    assert region is None
+    JpegCoefficients(stego)
+    assert jpeg_decode_in_memory(io.BytesIO(stego)) == 'progressive'
+
+def test_message_too_large_is_rejected():
+    with pytest.raises(ValueError, match="Message too large"):
+        encode(cover_jpeg('4:2:0'), 'x' * 100000)
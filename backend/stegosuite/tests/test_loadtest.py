@@ -0,0 +1,51 @@
+import json
+import os
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+import loadtest
+from loadtest import HttpTarget, Workload, parse_operation, parse_size, parse_weighted, run_load
+
+def test_parse_weighted():
+    assert parse_weighted('encode:lsbm=4, decode:auto', parse_operation) == [
+        (('encode', 'lsbm'), 4.0), (('decode', 'auto'), 1.0)]
+    assert parse_weighted('256x128=2', parse_size) == [((256, 128), 2.0)]
+
+@pytest.mark.parametrize('spec', ['', 'encode:lsbm=0', 'embed:lsbm', 'encode'])
+def test_parse_weighted_rejects(spec):
+    with pytest.raises(ValueError):
+        parse_weighted(spec, parse_operation)
+
+def test_in_process_run_writes_results_and_compares(main_module, tmp_path, capsys):
+    argv = ['-n', '6', '-c', '2', '--mix', 'encode:lsbm=1,encode:dct=1,decode:auto=1', '--sizes', '64x48', '--message-bytes', '12']
+    first, second = tmp_path / 'first.json', tmp_path / 'second.json'
+    assert loadtest.main(argv + ['--output', str(first)]) == 0
+    assert loadtest.main(argv + ['--output', str(second), '--compare', str(first)]) == 0
+    assert 'vs baseline' in capsys.readouterr().out
+
+    result = json.loads(second.read_text())
+    assert result['overall']['requests'] == 6
+    assert result['overall']['error_rate'] == 0
+    assert set(result['by_request']) <= {'encode:lsbm@64x48', 'encode:dct@64x48', 'decode:auto@64x48'}
+    assert sum(group['requests'] for group in result['by_request'].values()) == 6
+    assert result['config']['target'] == 'wsgi'
+    if os.path.isdir('/proc'):
+        assert os.getpid() in [worker['pid'] for worker in result['workers']]
+
+def test_http_target_counts_errors(main_module):
+    server = make_server('127.0.0.1', 0, main_module.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        workload = Workload([(('encode', 'lsbm'), 1), (('encode', 'bogus'), 1)], [((32, 32), 1)], 16)
+        result = run_load(HttpTarget(f'http://127.0.0.1:{server.port}'), workload, concurrency=2, total=8)
+    finally:
+        server.shutdown()
+    bogus = result['by_request']['encode:bogus@32x32']
+    assert result['overall']['requests'] == 8
+    assert bogus['error_rate'] == 1 and bogus['latency_ms']['p50'] is None
+    assert result['errors'] == {'HTTP 400': bogus['requests']}
+    assert result['by_request']['encode:lsbm@32x32']['error_rate'] == 0
+    assert result['workers'] == []  # no server pid given
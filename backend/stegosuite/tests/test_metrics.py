@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from metrics import calculate_metrics_arrays
+from schemes import PIXEL_SCHEMES, get_embedder
+
+def full_metrics(cover, stego, luma_ssim):
+    return calculate_metrics_arrays(cover, stego, None, luma_ssim)
+
+def assert_matches_full(cover, stego, region, luma_ssim):
+    expected = full_metrics(cover, stego, luma_ssim)
+    assert calculate_metrics_arrays(cover, stego, region, luma_ssim) == pytest.approx(expected, rel=1e-6, abs=1e-9)
+
+# Boxes in the interior, against each edge and corner, one pixel, and the whole image
+REGIONS = [(40, 70, 50, 90), (0, 12, 0, 160), (120, 128, 0, 160), (0, 128, 155, 160),
+           (0, 5, 0, 5), (123, 128, 150, 160), (64, 65, 80, 81), (0, 128, 0, 160)]
+
+@pytest.mark.parametrize('luma_ssim', [False, True])
+@pytest.mark.parametrize('region', REGIONS)
+def test_region_metrics_match_full_image(cover_array, region, luma_ssim):
+    top, bottom, left, right = region
+    rng = np.random.default_rng(sum(region))
+    stego = cover_array.copy()
+    noise = rng.integers(-3, 4, stego[top:bottom, left:right].shape)
+    stego[top:bottom, left:right] = np.clip(stego[top:bottom, left:right] + noise, 0, 255)
+    assert_matches_full(cover_array, stego, region, luma_ssim)
+
+@pytest.mark.parametrize('scheme', PIXEL_SCHEMES)
+def test_embedder_regions_give_full_image_metrics(cover_array, scheme):
+    stego = cover_array.copy()
+    region = get_embedder(scheme)(stego, 'measured over the region only')
+    assert region[1] < len(stego)  # a short message leaves most rows untouched
+    for luma_ssim in (False, True):
+        assert_matches_full(cover_array, stego, region, luma_ssim)
+
+def test_empty_region_means_unchanged(cover_array):
+    metrics = calculate_metrics_arrays(cover_array, cover_array.copy(), (0, 0, 0, 0))
+    assert metrics == {'psnr': 100.0, 'ssim': 1.0, 'ber': 0.0}
@@ -0,0 +1,85 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import multiframe
+from multiframe import calculate_metrics_frames, container_metadata, split_payload
+from schemes import PIXEL_SCHEMES, get_decoder, get_encoder
+
+MESSAGE = 'spread across every frame ✓'
+
+def frames(cover_array, count=3):
+    # Distinct frames: GIF and APNG writers merge identical neighbours
+    return [np.roll(cover_array, 8 * index, axis=1) for index in range(count)]
+
+def container(cover_array, image_format):
+    images = [Image.fromarray(frame) for frame in frames(cover_array)]
+    buffer = io.BytesIO()
+    if image_format == 'GIF':
+        images[0].save(buffer, format='GIF', save_all=True, append_images=images[1:], duration=100, loop=0)
+    else:
+        images[0].save(buffer, format='TIFF', save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('image_format, output_format', [('GIF', 'PNG'), ('TIFF', 'TIFF')])
+@pytest.mark.parametrize('scheme', PIXEL_SCHEMES)
+def test_round_trip(cover_array, scheme, image_format, output_format):
+    cover = container(cover_array, image_format)
+    stego = io.BytesIO()
+    get_encoder(scheme)(io.BytesIO(cover), MESSAGE, stego)
+
+    img = Image.open(stego)
+    assert img.format == output_format and img.n_frames == 3
+    metadata = container_metadata(img)
+    assert metadata[multiframe.FRAME_COUNT_KEY] == '3'
+    payload_map = [int(n) for n in metadata[multiframe.FRAME_PAYLOAD_KEY].split(',')]
+    assert sum(payload_map) == len(MESSAGE) and all(payload_map)
+
+    for decoder in (scheme, 'auto'):
+        stego.seek(0)
+        assert get_decoder(decoder)(stego) == MESSAGE
+
+    metrics = calculate_metrics_frames(io.BytesIO(cover), stego)
+    assert metrics['frames'] == 3 and metrics['psnr'] > 30
+
+def test_split_payload_is_proportional_to_capacity():
+    chunks = split_payload('abcdefghij', [10, 10])
+    assert chunks == ['abcde', 'fghij']
+
+def test_split_payload_longer_than_first_frame():
+    chunks = split_payload('abcdefghij', [3, 50])
+    assert ''.join(chunks) == 'abcdefghij'
+    assert len(chunks[0]) <= 3
+
+def test_split_payload_skips_frames_without_capacity():
+    chunks = split_payload('abcdef', [0, 4, 0, 4])
+    assert chunks[0] == chunks[2] == ''
+    assert ''.join(chunks) == 'abcdef'
+
+def test_split_payload_keeps_characters_whole():
+    # 'é' needs 2 bytes, which frame 0 cannot hold
+    assert split_payload('éa', [1, 3]) == ['', 'éa']
+
+def test_split_payload_capacity_exhausted():
+    with pytest.raises(ValueError, match="Message too large"):
+        split_payload('abcdefg', [3, 3])
+    with pytest.raises(ValueError, match="does not split"):
+        split_payload('éé', [1, 1, 1, 1])
+
+def test_no_frame_pool_unless_configured(monkeypatch):
+    monkeypatch.setattr(multiframe, 'FRAME_WORKERS', 0)
+    assert multiframe._pool(None) is None
+    sentinel = object()
+    assert multiframe._pool(sentinel) is sentinel
+
+def test_frame_pool_is_sized_from_config(monkeypatch):
+    monkeypatch.setattr(multiframe, 'FRAME_WORKERS', 2)
+    monkeypatch.setattr(multiframe, '_frame_pool', None)
+    pool = multiframe._pool(None)
+    try:
+        assert pool.max_workers == 2
+        assert multiframe._pool(None) is pool
+    finally:
+        pool.shutdown()
@@ -0,0 +1,62 @@
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from metrics import calculate_metrics_arrays, context_box
+from png_stream import iter_png
+from schemes import PIXEL_SCHEMES, get_embedder
+
+def test_streamed_png_matches_array(cover_array):
+    chunks = iter_png(cover_array, {'ProcessingInfo': 'apple'}, band_rows=16)
+    header = next(chunks)
+    assert header.startswith(b'\x89PNG')
+    img = Image.open(io.BytesIO(header + b''.join(chunks)))
+    np.testing.assert_array_equal(np.array(img), cover_array)
+    assert img.info == {'ProcessingInfo': 'apple'}
+
+def test_metrics_from_cover_context_match_full_cover(cover_array):
+    stego = cover_array.copy()
+    region = get_embedder('erde')(stego, 'hello world')
+    top, bottom, left, right = context_box(region, stego.shape)
+    for luma_ssim in (False, True):
+        full = calculate_metrics_arrays(cover_array, stego, region, luma_ssim)
+        cropped = calculate_metrics_arrays(cover_array[top:bottom, left:right], stego, region, luma_ssim, (top, left))
+        assert cropped == full
+
+def png_bytes(array):
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('scheme', PIXEL_SCHEMES)
+def test_embedders_report_rows_before_changing_them(cover_array, scheme):
+    stego = cover_array.copy()
+    written = []
+    region = get_embedder(scheme)(stego, 'hello world', on_write=lambda top, bottom: written.append((top, bottom)))
+    touched = np.zeros(len(stego), dtype=bool)
+    for top, bottom in written:
+        touched[top:bottom] = True
+    assert written and touched[region[0]:region[1]].all()
+    np.testing.assert_array_equal(stego[~touched], cover_array[~touched])
+
+@pytest.mark.parametrize('scheme', PIXEL_SCHEMES)
+def test_streamed_encode_sends_metrics_header(client, cover_array, scheme):
+    response = client.post('/api/encode', data={
+        'scheme': scheme, 'message': 'hello world', 'image': (io.BytesIO(png_bytes(cover_array)), 'cover.png')})
+    assert response.status_code == 200 and response.is_streamed
+    stego = np.array(Image.open(io.BytesIO(response.get_data())))
+    response.close()
+
+    cover = cover_array[:128 // 8 * 8, :160 // 8 * 8] if scheme == 'dct' else cover_array
+    expected = calculate_metrics_arrays(cover, stego, None)
+    metrics = json.loads(response.headers['X-Metrics'])
+    assert metrics == pytest.approx(expected)
+
+def test_undecodable_upload_is_rejected(client):
+    response = client.post('/api/encode', data={
+        'scheme': 'lsbm', 'message': 'hello', 'image': (io.BytesIO(b'not an image'), 'cover.png')})
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Input Error')
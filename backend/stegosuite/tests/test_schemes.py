@@ -0,0 +1,48 @@
+import io
+
+import pytest
+from PIL import Image
+
+from schemes import PIXEL_SCHEMES, SCHEMES, get_decoder, get_encoder
+
+MESSAGES = ['plain ascii', 'café', 'Ã©', '日本語 ✓']
+
+@pytest.mark.parametrize('message', MESSAGES)
+@pytest.mark.parametrize('scheme', PIXEL_SCHEMES)
+def test_round_trip_preserves_text(cover_array, scheme, message):
+    cover, stego = io.BytesIO(), io.BytesIO()
+    Image.fromarray(cover_array).save(cover, format='PNG')
+    cover.seek(0)
+    get_encoder(scheme)(cover, message, stego)
+    stego.seek(0)
+    assert get_decoder(scheme)(stego) == message
+
+@pytest.mark.parametrize('scheme', SCHEMES)
+def test_message_that_is_not_unicode_text_is_rejected(cover_array, scheme):
+    cover = io.BytesIO()
+    Image.fromarray(cover_array).save(cover, format='JPEG' if scheme == 'jpeg' else 'PNG')
+    cover.seek(0)
+    with pytest.raises(ValueError, match="UTF-8"):
+        get_encoder(scheme)(cover, 'lone \ud800 surrogate', io.BytesIO())
+
+@pytest.mark.parametrize('length', [58, 59, 60, 100])
+def test_dct_payload_across_decoder_chunks(cover_array, length):
+    # 160 px wide: 480 payload bits per 64-row chunk, so these messages end
+    # before, on and across the first chunk boundary, and in the second chunk
+    from encoders.dct import dct_embed_array
+    from decoders.dct import dct_extract_array
+    message = 'x' * length
+    pixels = cover_array.copy()
+    dct_embed_array(pixels, message)
+    assert dct_extract_array(pixels) == message
+
+def test_mpvd_rejects_payload_that_is_not_utf8(cover_array, monkeypatch):
+    # mpvd has no legacy latin-1 payloads to fall back to
+    import bitstream
+    import encoders.mpvd
+    from decoders.mpvd import mpvd_extract_array
+    monkeypatch.setattr(encoders.mpvd, 'frame_length_prefixed',
+                        lambda data: bitstream.frame_length_prefixed('café'.encode('latin-1')))
+    pixels = cover_array.copy()
+    encoders.mpvd.mpvd_embed_array(pixels, 'café')
+    assert mpvd_extract_array(pixels) == ''
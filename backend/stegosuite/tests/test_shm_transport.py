@@ -0,0 +1,81 @@
+import io
+import json
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import shm_transport
+from metrics import calculate_metrics_arrays
+from shm_transport import OffloadPool, SharedArray
+
+def png_bytes(array):
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def _crash(*args):
+    os._exit(1)
+
+@pytest.fixture
+def pool():
+    pool = OffloadPool(1)
+    yield pool
+    pool.shutdown()
+
+@pytest.fixture
+def segments(monkeypatch):
+    """Names of every segment created during the test."""
+    names = []
+    init = SharedArray.__init__
+
+    def recording_init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        names.append(self.descriptor[0])
+    monkeypatch.setattr(SharedArray, '__init__', recording_init)
+    return names
+
+def assert_unlinked(names):
+    assert names
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+@pytest.mark.parametrize('scheme', ['lsbm', 'erde', 'dct', 'pvd', 'mpvd'])
+def test_segments_unlinked_after_round_trip(pool, segments, cover_array, scheme):
+    stego = io.BytesIO()
+    pool.encode_in_memory(scheme, io.BytesIO(png_bytes(cover_array)), 'hello world', stego)
+    assert pool.decode_in_memory(scheme, stego) == 'hello world'
+    assert len(segments) == 2
+    assert_unlinked(segments)
+
+def test_segment_unlinked_after_worker_error(pool, segments, cover_array):
+    with pytest.raises(ValueError):
+        pool.encode_in_memory('lsbm', io.BytesIO(png_bytes(cover_array)), 'x' * 100000, io.BytesIO())
+    assert_unlinked(segments)
+
+def test_segment_unlinked_after_worker_crash(pool, segments, cover_array, monkeypatch):
+    monkeypatch.setattr(shm_transport, '_embed_worker', _crash)
+    with pytest.raises(RuntimeError, match="crashed"):
+        pool.encode_in_memory('lsbm', io.BytesIO(png_bytes(cover_array)), 'hello', io.BytesIO())
+    assert_unlinked(segments)
+
+    # The broken executor is replaced on the next call
+    monkeypatch.undo()
+    stego = io.BytesIO()
+    pool.encode_in_memory('lsbm', io.BytesIO(png_bytes(cover_array)), 'hello', stego)
+    assert pool.decode_in_memory('lsbm', stego) == 'hello'
+
+def test_offloaded_dct_metrics_use_cropped_cover(client, main_module, pool, cover_array, monkeypatch):
+    monkeypatch.setattr(main_module, 'offload_pool', pool)
+    cover = cover_array[:125, :157]
+    response = client.post('/api/encode', data={
+        'scheme': 'dct', 'message': 'hello world', 'image': (io.BytesIO(png_bytes(cover)), 'cover.png')})
+    assert response.status_code == 200
+    stego = np.array(Image.open(io.BytesIO(response.get_data())))
+    assert stego.shape == (120, 152, 3)
+
+    expected = calculate_metrics_arrays(cover[:120, :152], stego, None)
+    assert json.loads(response.headers['X-Metrics']) == pytest.approx(expected, abs=1e-4)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from skimage import data
+
+from schemes import get_array_capacity, get_embedder
+from steganalysis import UNSCORED_SCHEMES, analyze_pixels
+
+COVERS = {'astronaut': data.astronaut, 'coffee': data.coffee}
+
+def embed(cover, scheme, fraction):
+    stego = cover.copy()
+    length = int(get_array_capacity(scheme)(stego) * fraction)
+    rng = np.random.default_rng(0)
+    get_embedder(scheme)(stego, ''.join(chr(c) for c in rng.integers(32, 127, length)))
+    return stego
+
+@pytest.mark.parametrize('name', COVERS)
+def test_clean_cover_scores_low(name):
+    risk = analyze_pixels(COVERS[name]())['risk']
+    assert risk['pvd'] < 0.1 and risk['mpvd'] < 0.1
+
+@pytest.mark.parametrize('name', COVERS)
+@pytest.mark.parametrize('scheme', ['pvd', 'mpvd'])
+@pytest.mark.parametrize('fraction', [0.2, 0.9])
+def test_pvd_payloads_score_high(name, scheme, fraction):
+    risk = analyze_pixels(embed(COVERS[name](), scheme, fraction))['risk']
+    assert risk[scheme] > 0.9
+
+@pytest.mark.parametrize('scheme', UNSCORED_SCHEMES)
+def test_schemes_without_a_detector_are_unscored(scheme):
+    cover = data.coffee()
+    assert analyze_pixels(cover)['risk'][scheme] is None
+    assert analyze_pixels(embed(cover, scheme, 0.9))['risk'][scheme] is None
@@ -168,6 +168,8 @@ export default function StegoSuiteDecode() {
                   <option value="erde">Edge Region Data Embedding (ERDE)</option>
                   <option value="dct">Discrete Cosine Transform (DCT)</option>
                   <option value="pvd">Pixel Value Differencing (PVD)</option>
+                  <option value="mpvd">Multi-channel PVD</option>
+                  <option value="jpeg">JPEG Coefficient (JPEG-DCT)</option>
                 </select>
                 <div style={styles.dropdownArrow} />
               </div>
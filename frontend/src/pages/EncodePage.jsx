@@ -100,7 +100,9 @@ export default function StegoSuiteEncode() {
       const url = window.URL.createObjectURL(new Blob([response.data]));
       const link = document.createElement("a");
       link.href = url;
-      link.setAttribute("download", "stego.png");
+      const contentType = response.headers["content-type"] || "";
+      const extension = scheme === "jpeg" ? "jpg" : contentType.startsWith("image/tiff") ? "tif" : "png";
+      link.setAttribute("download", `stego.${extension}`);
       document.body.appendChild(link);
       link.click();
       link.remove();
@@ -225,6 +227,8 @@ export default function StegoSuiteEncode() {
                   <option value="erde">Edge Region Data Embedding (ERDE)</option>
                   <option value="dct">Discrete Cosine Transform (DCT)</option>
                   <option value="pvd">Pixel Value Differencing (PVD)</option>
+                  <option value="mpvd">Multi-channel PVD</option>
+                  <option value="jpeg">JPEG Coefficient (JPEG-DCT)</option>
                 </select>
                 <div style={styles.dropdownArrow} />
               </div>